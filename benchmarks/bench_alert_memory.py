@@ -0,0 +1,100 @@
+"""Compare the peak memory of the alerts with and without copy-on-write.
+
+   python benchmarks/bench_alert_memory.py --jobs 1000000 --alerts 12
+
+Each mode is run in a fresh process so that the peak resident set size
+(RSS) of one mode does not hide that of the other.
+"""
+
+import os
+import sys
+import resource
+import argparse
+import subprocess
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+from job_defense_shield.cleaner import VectorizedSacctCleaner
+from job_defense_shield.utils import add_new_and_derived_fields
+from job_defense_shield.utils import enable_copy_on_write
+from job_defense_shield.alert.excessive_time_limits import ExcessiveTimeLimitsCPU
+from synthetic import synthetic_jobs
+
+
+def peak_rss_mb() -> float:
+    """Return the peak resident set size of this process in MB."""
+    kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return kb / 1024 if sys.platform != "darwin" else kb / 1024**2
+
+
+def job_frame(num_jobs: int) -> pd.DataFrame:
+    """Return a cleaned dataframe of jobs with decoded summary statistics."""
+    raw = synthetic_jobs(num_jobs, stats=False)
+    field_renamings = {"cputimeraw": "cpu-seconds",
+                       "nnodes": "nodes",
+                       "ncpus": "cores",
+                       "timelimitraw": "limit-minutes"}
+    df = VectorizedSacctCleaner(raw, field_renamings, {}).clean()
+    df = df[(df.state != "PENDING") & (df.elapsedraw > 0)]
+    df = add_new_and_derived_fields(df).reset_index(drop=True)
+    ss = {"nodes":{"node1":{"total_time":-1, "cpus":1}}, "total_time":-1}
+    df["admincomment"] = [ss] * len(df)
+    return df
+
+
+def run_alerts(num_jobs: int, num_alerts: int, copy_on_write: bool) -> str:
+    """Run num_alerts instances of an alert and return the size of the job
+       frame and the peak RSS before and after. The alerts are kept alive as
+       they are by the pipeline runner."""
+    if copy_on_write:
+        enable_copy_on_write()
+    df = job_frame(num_jobs)
+    before = peak_rss_mb()
+    frame_mb = df.memory_usage(deep=True).sum() / 1024**2
+    alerts = [ExcessiveTimeLimitsCPU(df,
+                                     0,
+                                     "",
+                                     "",
+                                     cluster="della",
+                                     partitions=["*"],
+                                     min_run_time=0,
+                                     num_top_users=10,
+                                     absolute_thres_hours=5000,
+                                     overall_ratio_threshold=1.0,
+                                     mean_ratio_threshold=1.0,
+                                     median_ratio_threshold=1.0,
+                                     copy_on_write=copy_on_write)
+              for _ in range(num_alerts)]
+    return f"{frame_mb:.0f} {before:.0f} {peak_rss_mb():.0f} {len(alerts)}"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the memory of the alerts")
+    parser.add_argument("--jobs", type=int, default=1000000, help="Number of jobs")
+    parser.add_argument("--alerts", type=int, default=12, help="Number of alert instances")
+    parser.add_argument("--mode", choices=["copy", "cow"], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.mode:
+        stdout = sys.stdout
+        sys.stdout = open(os.devnull, "w")
+        try:
+            result = run_alerts(args.jobs, args.alerts, args.mode == "cow")
+        finally:
+            sys.stdout.close()
+            sys.stdout = stdout
+        print(result)
+        sys.exit()
+    rows = {}
+    for mode in ("copy", "cow"):
+        out = subprocess.run([sys.executable, __file__,
+                              "--jobs", str(args.jobs),
+                              "--alerts", str(args.alerts),
+                              "--mode", mode],
+                             capture_output=True, text=True, check=True).stdout
+        rows[mode] = [float(x) for x in out.split()]
+    print(f"jobs:            {args.jobs}")
+    print(f"alerts:          {args.alerts}")
+    print(f"job frame:       {rows['copy'][0]:.0f} MB")
+    print(f"before alerts:   {rows['copy'][1]:.0f} MB (copy), {rows['cow'][1]:.0f} MB (cow)")
+    print(f"peak RSS copy:   {rows['copy'][2]:.0f} MB")
+    print(f"peak RSS cow:    {rows['cow'][2]:.0f} MB")
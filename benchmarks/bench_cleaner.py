@@ -0,0 +1,65 @@
+"""Compare the row-wise and vectorized sacct cleaners on synthetic data.
+
+   python benchmarks/bench_cleaner.py --jobs 1000000
+"""
+
+import os
+import sys
+import argparse
+from time import perf_counter
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                "..", "src", "job_defense_shield"))
+from cleaner import SacctCleaner
+from cleaner import VectorizedSacctCleaner
+from synthetic import synthetic_jobs
+
+
+def special_cases(raw: pd.DataFrame, seed: int=42) -> pd.DataFrame:
+    """Add the fraction of UNLIMITED and Partition_Limit time limits and of
+       renamed and multiple partitions seen on a large cluster."""
+    rng = np.random.default_rng(seed)
+    num_jobs = len(raw)
+    limit = rng.choice(["", "UNLIMITED", "Partition_Limit"], num_jobs, p=[0.9, 0.05, 0.05])
+    raw["timelimitraw"] = np.where(limit == "", raw["timelimitraw"], limit)
+    partition = rng.choice(["", "datascience", "cpu,gpu"], num_jobs, p=[0.9, 0.09, 0.01])
+    raw["partition"] = np.where(partition == "", raw["partition"], partition)
+    return raw
+
+
+def time_cleaner(cleaner, raw: pd.DataFrame, repeats: int) -> float:
+    """Return the best time in seconds to clean raw."""
+    field_renamings = {"cputimeraw": "cpu-seconds",
+                       "nnodes": "nodes",
+                       "ncpus": "cores",
+                       "timelimitraw": "limit-minutes"}
+    partition_renamings = {"datascience": "ds"}
+    best = float("inf")
+    for _ in range(repeats):
+        data = raw.copy()
+        start = perf_counter()
+        cleaner(data, field_renamings, partition_renamings).clean()
+        best = min(best, perf_counter() - start)
+    return best
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the sacct cleaners")
+    parser.add_argument("--jobs", type=int, default=1000000, help="Number of jobs")
+    parser.add_argument("--repeats", type=int, default=1, help="Number of repeats")
+    args = parser.parse_args()
+    raw = special_cases(synthetic_jobs(args.jobs, stats=False))
+    stdout = sys.stdout
+    sys.stdout = open(os.devnull, "w")
+    try:
+        rowwise = time_cleaner(SacctCleaner, raw, args.repeats)
+        vectorized = time_cleaner(VectorizedSacctCleaner, raw, args.repeats)
+    finally:
+        sys.stdout.close()
+        sys.stdout = stdout
+    print(f"jobs:       {args.jobs}")
+    print(f"rowwise:    {rowwise:.2f} s")
+    print(f"vectorized: {vectorized:.2f} s")
+    print(f"speedup:    {rowwise / vectorized:.1f}x")
@@ -0,0 +1,236 @@
+"""Time the stages of the pipeline and every alert on synthetic workloads.
+
+   python benchmarks/bench_pipeline.py
+   python benchmarks/bench_pipeline.py --jobs 10000 100000 --format json > bench.jsonl
+
+The data comes from synthetic.py (sacct output with Jobstats summary
+statistics). For each number of jobs the following are timed: the row-wise
+and vectorized sacct cleaners, add_new_and_derived_fields, the decoding of
+the admincomment with get_stats_dict, and each alert of the registry of
+the pipeline (the filter when the alert is created plus the report for the
+administrators). The best time of --repeats runs is reported.
+
+With --format json one JSON object is written per line with the fields
+benchmark, jobs, seconds, rows (the number of rows that were processed)
+and the versions of job_defense_shield, pandas and Python so that the
+output of two versions can be compared. The cancellation of GPU jobs is
+not timed since it queries Prometheus.
+"""
+
+import os
+import sys
+import json
+import platform
+import tempfile
+import argparse
+from time import perf_counter
+from datetime import datetime
+from typing import Callable
+from typing import List
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+from job_defense_shield import __version__
+from job_defense_shield.cleaner import SacctCleaner
+from job_defense_shield.cleaner import VectorizedSacctCleaner
+from job_defense_shield.efficiency import get_stats_dict
+from job_defense_shield.job_index import JobFrameIndex
+from job_defense_shield.pipeline import ALERTS
+from job_defense_shield.pipeline import AlertRunner
+from job_defense_shield.utils import add_new_and_derived_fields
+from job_defense_shield.utils import FIELD_RENAMINGS
+from synthetic import synthetic_jobs
+
+CLUSTER = "della"
+
+# one entry per alert with the parameters of a typical configuration file
+ALERT_CONFIG = {
+    "zero-util-gpu-hours-1": {"partitions":["gpu"],
+                              "min_run_time":30,
+                              "gpu_hours_threshold_user":100,
+                              "gpu_hours_threshold_admin":100,
+                              "max_num_jobid_admin":4},
+    "low-gpu-efficiency-1": {"partitions":["gpu"],
+                             "eff_thres_pct":50,
+                             "eff_target_pct":70,
+                             "proportion_thres_pct":0,
+                             "absolute_thres_hours":1,
+                             "num_top_users":15,
+                             "min_run_time":30},
+    "too-much-cpu-mem-per-gpu-1": {"partitions":["gpu"],
+                                   "cluster_name":"Della (gpu)",
+                                   "cores_per_node":32,
+                                   "gpus_per_node":4,
+                                   "cpu_mem_per_node":256,
+                                   "cpu_mem_per_gpu_target":8,
+                                   "cpu_mem_per_gpu_limit":16,
+                                   "mem_eff_thres":0.8,
+                                   "min_run_time":30},
+    "too-many-cores-per-gpu-1": {"partitions":["gpu"],
+                                 "cluster_name":"Della (gpu)",
+                                 "cores_per_node":32,
+                                 "gpus_per_node":4,
+                                 "cores_per_gpu_target":8,
+                                 "cores_per_gpu_limit":8,
+                                 "min_run_time":30},
+    "gpu-model-too-powerful-1": {"partitions":["gpu"],
+                                 "num_cores_per_gpu":8,
+                                 "gpu_hours_threshold":1,
+                                 "gpu_util_threshold":15,
+                                 "gpu_mem_usage_max":10,
+                                 "cpu_mem_usage_per_gpu":32,
+                                 "min_run_time":30},
+    "multinode-gpu-fragmentation-1": {"partitions":["gpu"],
+                                      "gpus_per_node":4,
+                                      "min_run_time":30},
+    "excessive-time-gpu-1": {"partitions":["gpu"],
+                             "min_run_time":30,
+                             "absolute_thres_hours":100,
+                             "overall_ratio_threshold":0.6,
+                             "mean_ratio_threshold":0.6,
+                             "median_ratio_threshold":0.6,
+                             "num_top_users":10},
+    "zero-cpu-utilization-1": {"partitions":["cpu"],
+                               "min_run_time":30},
+    "excess-cpu-memory-1": {"partitions":["cpu"],
+                            "cores_per_node":32,
+                            "cores_fraction":0.8,
+                            "mem_per_node":128,
+                            "tb_hours_threshold":0,
+                            "ratio_threshold":0.35,
+                            "mean_ratio_threshold":0.35,
+                            "median_ratio_threshold":0.35,
+                            "num_top_users":10,
+                            "num_jobs_display":10,
+                            "min_run_time":30},
+    "low-cpu-efficiency-1": {"partitions":["cpu"],
+                             "eff_thres_pct":60,
+                             "eff_target_pct":90,
+                             "proportion_thres_pct":0,
+                             "absolute_thres_hours":1,
+                             "num_top_users":15,
+                             "min_run_time":30},
+    "serial-allocating-multiple-1": {"partitions":["cpu"],
+                                     "cores_per_node":32,
+                                     "cpu_hours_threshold":100,
+                                     "lower_ratio":0.85,
+                                     "num_top_users":5,
+                                     "num_jobs_display":10,
+                                     "max_num_jobid_admin":4,
+                                     "min_run_time":30},
+    "multinode-cpu-fragmentation-1": {"partitions":["cpu"],
+                                      "cores_per_node":32,
+                                      "cores_fraction":0.5,
+                                      "mem_per_node":128,
+                                      "safety_fraction":0.2,
+                                      "min_run_time":30},
+    "excessive-time-cpu-1": {"partitions":["cpu"],
+                             "min_run_time":30,
+                             "absolute_thres_hours":10,
+                             "overall_ratio_threshold":0.6,
+                             "mean_ratio_threshold":0.6,
+                             "median_ratio_threshold":0.6,
+                             "num_top_users":10}}
+
+
+def best_time(func: Callable, repeats: int):
+    """Return the best time in seconds of repeats calls of func and the
+       value returned by the last call. The output of func is discarded."""
+    best = float("inf")
+    stdout = sys.stdout
+    sys.stdout = open(os.devnull, "w")
+    try:
+        for _ in range(repeats):
+            start = perf_counter()
+            value = func()
+            best = min(best, perf_counter() - start)
+    finally:
+        sys.stdout.close()
+        sys.stdout = stdout
+    return best, value
+
+
+def run_benchmarks(num_jobs: int,
+                   num_nodes: int,
+                   gpus_per_node: int,
+                   repeats: int,
+                   rowwise: bool,
+                   vpath: str) -> List[dict]:
+    """Return one record per benchmark for num_jobs synthetic jobs."""
+    records = []
+
+    def record(name: str, seconds: float, rows: int) -> None:
+        records.append({"benchmark":name,
+                        "jobs":num_jobs,
+                        "seconds":round(seconds, 4),
+                        "rows":rows})
+
+    raw = synthetic_jobs(num_jobs, num_nodes=num_nodes, gpus_per_node=gpus_per_node)
+    if rowwise:
+        seconds, _ = best_time(lambda: SacctCleaner(raw, FIELD_RENAMINGS, {}).clean(), repeats)
+        record("SacctCleaner.clean", seconds, len(raw))
+    seconds, df = best_time(lambda: VectorizedSacctCleaner(raw, FIELD_RENAMINGS, {}).clean(),
+                            repeats)
+    record("VectorizedSacctCleaner.clean", seconds, len(raw))
+    del raw
+    pending = df[df.state == "PENDING"].copy()
+    df = df[(df.state != "PENDING") & (df.elapsedraw > 0)]
+    seconds, df = best_time(lambda: add_new_and_derived_fields(df), repeats)
+    record("add_new_and_derived_fields", seconds, len(df))
+    df = df.reset_index(drop=True)
+    seconds, stats = best_time(lambda: df["admincomment"].apply(get_stats_dict), repeats)
+    record("get_stats_dict", seconds, len(df))
+    df["admincomment"] = stats
+    del stats
+
+    cfg = {"violation-logs-path":vpath, "greeting-method":"basic"}
+    for name, params in ALERT_CONFIG.items():
+        cfg[name] = dict(params, cluster=CLUSTER, include_running_jobs=False)
+    sys_cfg = {"verbose":False,
+               "show_empty_reports":False,
+               "job_index":JobFrameIndex(df)}
+    runner = AlertRunner(cfg,
+                         sys_cfg,
+                         df,
+                         datetime(2023, 11, 7),
+                         datetime(2023, 11, 14),
+                         pending=pending)
+    for spec in ALERTS:
+        if spec.cancels:
+            continue
+        for name, params in runner.instances(spec):
+            seconds, _ = best_time(lambda: runner.run_one(spec, name, params), repeats)
+            record(spec.alert_class.__name__, seconds, len(pending if spec.pending else df))
+    return records
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the pipeline on synthetic jobs")
+    parser.add_argument("--jobs", type=int, nargs="+", default=[10000, 100000, 1000000],
+                        help="Numbers of jobs")
+    parser.add_argument("--nodes", type=int, default=500, help="Number of nodes")
+    parser.add_argument("--gpus-per-node", type=int, default=4, help="GPUs per GPU node")
+    parser.add_argument("--repeats", type=int, default=3, help="Runs per benchmark")
+    parser.add_argument("--no-rowwise", action="store_true",
+                        help="Skip the row-wise sacct cleaner")
+    parser.add_argument("--format", choices=["table", "json"], default="table",
+                        help="Output format (json writes one object per line)")
+    args = parser.parse_args()
+
+    versions = {"version":__version__,
+                "pandas":pd.__version__,
+                "python":platform.python_version()}
+    with tempfile.TemporaryDirectory() as vpath:
+        for num_jobs in args.jobs:
+            records = run_benchmarks(num_jobs,
+                                     args.nodes,
+                                     args.gpus_per_node,
+                                     args.repeats,
+                                     not args.no_rowwise,
+                                     vpath)
+            if args.format == "json":
+                for rec in records:
+                    print(json.dumps(dict(rec, **versions)), flush=True)
+            else:
+                print(pd.DataFrame(records).set_index("benchmark").to_string() + "\n",
+                      flush=True)
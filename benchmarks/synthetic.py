@@ -0,0 +1,130 @@
+"""Synthetic sacct data with Jobstats summary statistics for the benchmarks.
+
+   from synthetic import synthetic_jobs
+   raw = synthetic_jobs(100000, num_nodes=500, gpus_per_node=4)
+
+The columns are those requested from sacct by job_defense_shield (all
+values are strings as returned by sacct) plus the admincomment column with
+the JS1: blobs written by the Jobstats epilog for the completed jobs.
+"""
+
+import json
+import gzip
+import base64
+from typing import Optional
+import numpy as np
+import pandas as pd
+
+GIB = 1024**3
+
+
+def encode_stats(ss: dict) -> str:
+    """Encode the summary statistics as Jobstats does (gzip, base64)."""
+    return "JS1:" + base64.b64encode(gzip.compress(json.dumps(ss).encode(),
+                                                   compresslevel=6)).decode()
+
+
+def summary_stats(rng: np.random.Generator,
+                  nodes: list,
+                  cores: int,
+                  gpus: int,
+                  elapsed: int,
+                  mem_per_node: int) -> dict:
+    """Return the summary statistics of a job that ran on nodes. The CPU
+       efficiency and the memory usage are drawn at random. About one in
+       twenty jobs does not use the CPU-cores and one in ten GPUs is idle."""
+    cores_per_node = max(1, cores // len(nodes))
+    gpus_per_node = gpus // len(nodes)
+    ss = {"gpus":gpus, "nodes":{}, "total_time":elapsed}
+    cpu_eff = 0.0 if rng.random() < 0.05 else 1.0
+    for node in nodes:
+        stats = {"cpus":cores_per_node,
+                 "total_memory":mem_per_node,
+                 "used_memory":int(mem_per_node * rng.uniform(0.01, 0.9)),
+                 "total_time":round(elapsed * cores_per_node * cpu_eff * rng.uniform(0.0, 1.0), 1)}
+        if gpus_per_node:
+            util = np.where(rng.random(gpus_per_node) < 0.1,
+                            0.0,
+                            rng.uniform(1, 100, gpus_per_node).round(1))
+            stats["gpu_total_memory"] = {str(i): 80 * GIB for i in range(gpus_per_node)}
+            stats["gpu_used_memory"] = {str(i): int(80 * GIB * rng.uniform(0.01, 0.95))
+                                        for i in range(gpus_per_node)}
+            stats["gpu_utilization"] = {str(i): float(u) for i, u in enumerate(util)}
+        ss["nodes"][node] = stats
+    return ss
+
+
+def synthetic_jobs(num_jobs: int,
+                   num_nodes: int=500,
+                   gpus_per_node: int=4,
+                   gpu_fraction: float=0.25,
+                   num_users: int=2000,
+                   clusters: tuple=("della",),
+                   seed: int=42,
+                   now: Optional[int]=None,
+                   stats: bool=True) -> pd.DataFrame:
+    """Return num_jobs rows of raw sacct data. The first gpu_fraction of the
+       nodes have gpus_per_node GPUs (partition gpu) and the others are CPU
+       nodes (partition cpu) with 32 cores. Jobs use one to four nodes. If
+       stats is False then admincomment is empty for all jobs (much faster
+       when the summary statistics are not needed)."""
+    rng = np.random.default_rng(seed)
+    now = now or 1700000000
+    num_gpu_nodes = max(1, int(num_nodes * gpu_fraction)) if gpus_per_node else 0
+    cpu_nodes = [f"cpu-n{i:04d}" for i in range(max(1, num_nodes - num_gpu_nodes))]
+    gpu_nodes = [f"gpu-g{i:04d}" for i in range(num_gpu_nodes)]
+    states = np.array(["COMPLETED", "RUNNING", "PENDING", "FAILED", "TIMEOUT",
+                       "CANCELLED by 123456", "OUT_OF_MEMORY"])
+    state = rng.choice(states, num_jobs, p=[0.6, 0.08, 0.08, 0.1, 0.06, 0.06, 0.02])
+    is_gpu = (rng.random(num_jobs) < gpu_fraction) if gpu_nodes else np.zeros(num_jobs, bool)
+    nnodes = rng.choice([1, 2, 4], num_jobs, p=[0.9, 0.07, 0.03])
+    nnodes = np.minimum(nnodes, np.where(is_gpu, len(gpu_nodes), len(cpu_nodes)))
+    cores = nnodes * rng.choice([1, 2, 4, 8, 16, 32], num_jobs)
+    gpus = np.where(is_gpu, nnodes * rng.integers(1, max(2, gpus_per_node + 1), num_jobs), 0)
+    limit = rng.choice([60, 240, 1440, 4320], num_jobs, p=[0.3, 0.3, 0.3, 0.1])
+    elapsed = (limit * 60 * rng.uniform(0.01, 1.0, num_jobs)).astype(int) + 1
+    submit = now - rng.integers(3600, 7 * 86400, num_jobs)
+    start = submit + rng.integers(0, 3600, num_jobs)
+    pending = state == "PENDING"
+    running = state == "RUNNING"
+    elapsed = np.where(pending, 0, elapsed)
+    mem_gb = np.where(is_gpu, 64, 4) * nnodes
+    admincomment = []
+    for i in range(num_jobs):
+        if pending[i] or running[i] or not stats:
+            admincomment.append("")
+            continue
+        pool = gpu_nodes if is_gpu[i] else cpu_nodes
+        first = rng.integers(0, len(pool) - nnodes[i] + 1)
+        nodes = pool[first:first + nnodes[i]]
+        ss = summary_stats(rng, nodes, int(cores[i]), int(gpus[i]), int(elapsed[i]),
+                           int(mem_gb[i] // nnodes[i]) * GIB)
+        admincomment.append(encode_stats(ss) if elapsed[i] >= 300 else "JS1:Short")
+    gres = np.where(is_gpu, np.char.add(",gres/gpu=", gpus.astype(str)), "")
+    alloctres = np.char.add(np.char.add(np.char.add("billing=", cores.astype(str)),
+                                        np.char.add(",cpu=", cores.astype(str))),
+                            np.char.add(gres, np.char.add(np.char.add(",mem=", mem_gb.astype(str)),
+                                                          np.char.add("G,node=", nnodes.astype(str)))))
+    alloctres = np.where(pending, "", alloctres)
+    jobid = np.arange(40000000, 40000000 + num_jobs).astype(str)
+    return pd.DataFrame({"jobid":jobid,
+                         "jobidraw":jobid,
+                         "user":np.char.add("u", rng.integers(0, num_users, num_jobs).astype(str)),
+                         "cluster":rng.choice(np.array(clusters), num_jobs),
+                         "account":rng.choice(np.array(["bio", "chem", "physics", "cs"]), num_jobs),
+                         "partition":np.where(is_gpu, "gpu", "cpu"),
+                         "cputimeraw":(elapsed * cores).astype(str),
+                         "elapsedraw":elapsed.astype(str),
+                         "timelimitraw":limit.astype(str),
+                         "nnodes":nnodes.astype(str),
+                         "ncpus":cores.astype(str),
+                         "alloctres":alloctres,
+                         "submit":submit.astype(str),
+                         "eligible":submit.astype(str),
+                         "start":np.where(pending, "Unknown", start.astype(str)),
+                         "end":np.where(pending | running, "Unknown", (start + elapsed).astype(str)),
+                         "qos":rng.choice(np.array(["short", "medium", "long"]), num_jobs),
+                         "state":state,
+                         "admincomment":admincomment,
+                         "jobname":rng.choice(np.array(["train", "sim", "interactive", "md"]),
+                                              num_jobs)})
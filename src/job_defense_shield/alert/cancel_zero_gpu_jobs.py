@@ -1,14 +1,28 @@
 import os
-import sys
+import re
 import subprocess
 import time
 import pickle
+from typing import Dict
+from typing import List
+from typing import Tuple
 import pandas as pd
 from ..base import Alert
 from ..utils import SECONDS_PER_MINUTE as spm
 from ..utils import SECONDS_PER_HOUR as sph
 from ..utils import MINUTES_PER_HOUR as mph
+from ..utils import add_to_sys_path
 from ..efficiency import num_gpus_with_zero_util
+from ..metrics_tables import MetricsTables
+from ..metrics_tables import num_gpus_with_zero_util_batch
+from ..prom_client import PrometheusBatchClient
+from ..prom_client import LiveStatsCache
+from ..prom_client import DeferredError
+from ..prom_client import fetch_concurrently
+from ..sliding_store import SlidingWindowStore
+from ..sliding_store import plan_sliding_checks
+from ..sliding_store import CANCEL_CHECK
+from ..instrument import stage
 from ..greeting import GreetingFactory
 from ..email_translator import EmailTranslator
 
@@ -49,6 +63,10 @@ class CancelZeroGpuJobs(Alert):
             self.gpu_frac_threshold = 1.0
         if not hasattr(self, "do_not_cancel"):
             self.do_not_cancel = False
+        if not hasattr(self, "scancel_dry_run"):
+            self.scancel_dry_run = False
+        if not hasattr(self, "scancel_chunk_size"):
+            self.scancel_chunk_size = 500
         if not hasattr(self, "warning_frac"):
             self.warning_frac = 1.0
         if not hasattr(self, "fraction_of_period"):
@@ -65,7 +83,7 @@ class CancelZeroGpuJobs(Alert):
             clus_part = f"{self.cluster} ({','.join(sorted(set(self.partitions)))})"
         print(f"INFO: Cancellation of GPU jobs at 0% utilization on {clus_part} is enabled.")
         start_time = time.time()
-        self.lg = self.df.copy()
+        self.lg = self.df
         #########################################
         ## FIXED WINDOW OVER THE FIRST N HOURS ##
         #########################################
@@ -76,14 +94,14 @@ class CancelZeroGpuJobs(Alert):
             else:
                 lower = self.first_warning_minutes * spm
             upper = (self.cancel_minutes + self.sampling_period_minutes) * spm
-            self.df = self.df[(self.df.state == "RUNNING") &
-                              (self.df.gpus > 0) &
-                              (self.df.cluster == self.cluster) &
-                              (self.df.elapsedraw >= lower) &
-                              (self.df.elapsedraw <  upper) &
-                              (~self.df.qos.isin(self.excluded_qos)) &
-                              (~self.df.partition.isin(self.excluded_partitions)) &
-                              (~self.df.user.isin(self.excluded_users))].copy()
+            self.df = self.filtered(self.df[(self.df.state == "RUNNING") &
+                                            (self.df.gpus > 0) &
+                                            (self.df.cluster == self.cluster) &
+                                            (self.df.elapsedraw >= lower) &
+                                            (self.df.elapsedraw <  upper) &
+                                            (~self.df.qos.isin(self.excluded_qos)) &
+                                            (~self.df.partition.isin(self.excluded_partitions)) &
+                                            (~self.df.user.isin(self.excluded_users))])
             if "*" not in self.partitions:
                 self.df = self.df[self.df.partition.isin(self.partitions)]
             self.df.rename(columns={"user":"User"}, inplace=True)
@@ -114,7 +132,12 @@ class CancelZeroGpuJobs(Alert):
                     prts = "_".join(sorted(set(self.partitions)))
                 jobid_cache_file = os.path.join(self.jobid_cache_path,
                                                 f".jobid_cache_{self.cluster}_{prts}.pkl")
-                if os.path.isfile(jobid_cache_file):
+                # the daemon keeps the jobid caches in memory (see daemon.py)
+                memo = getattr(self, "jobid_cache_memo", None)
+                if memo is not None and jobid_cache_file in memo:
+                    jobs_using_gpus = memo[jobid_cache_file]
+                    pre_approved = self.df[self.df.jobid.isin(jobs_using_gpus)].jobid.tolist()
+                elif os.path.isfile(jobid_cache_file):
                     with open(jobid_cache_file, "rb") as fp:
                         jobs_using_gpus = pickle.load(fp)
                     pre_approved = self.df[self.df.jobid.isin(jobs_using_gpus)].jobid.tolist()
@@ -124,15 +147,10 @@ class CancelZeroGpuJobs(Alert):
                 if hasattr(self, "nodelist"):
                     self.df = self.filter_by_nodelist(self.df)
                 if not self.df.empty:
-                    self.df["zero-tuple"] = self.df.apply(lambda row:
-                                                 num_gpus_with_zero_util(row["admincomment"],
-                                                                         row["jobid"],
-                                                                         row["cluster"],
-                                                                         verbose=self.verbose),
-                                                                         axis="columns")
+                    tables = MetricsTables(self.df["admincomment"])
                     cols = ["GPUs-Unused", "error_code"]
-                    self.df[cols] = pd.DataFrame(self.df["zero-tuple"].tolist(),
-                                                 index=self.df.index)
+                    zero = num_gpus_with_zero_util_batch(tables, self.df.index)
+                    self.df[cols] = zero.set_axis(cols, axis="columns")
                     self.df = self.df[self.df["error_code"] == 0]
                     # write cache file of jobid's that are known to be using the gpus
                     if hasattr(self, "jobid_cache_path"):
@@ -143,8 +161,12 @@ class CancelZeroGpuJobs(Alert):
                             prts = "_".join(sorted(set(self.partitions)))
                         jobid_cache_file = os.path.join(self.jobid_cache_path,
                                                         f".jobid_cache_{self.cluster}_{prts}.pkl")
-                        with open(jobid_cache_file, "wb") as fp:
-                            pickle.dump(pre_approved + jobs_using_gpus, fp)
+                        memo = getattr(self, "jobid_cache_memo", None)
+                        if memo is not None:
+                            memo[jobid_cache_file] = pre_approved + jobs_using_gpus
+                        else:
+                            with open(jobid_cache_file, "wb") as fp:
+                                pickle.dump(pre_approved + jobs_using_gpus, fp)
                     self.df["gpu_frac"] = (self.df["gpus"] - self.df["GPUs-Unused"]) / self.df["gpus"]
                     self.df = self.df[self.df["gpu_frac"] < self.gpu_frac_threshold]
                     # filter interactive jobs if such settings are found in config.yaml
@@ -183,13 +205,13 @@ class CancelZeroGpuJobs(Alert):
                             self.sliding_warning_minutes) * spm
             else:
                 lower = self.sliding_warning_minutes * spm
-            self.lg = self.lg[(self.lg.state == "RUNNING") &
-                              (self.lg.gpus > 0) &
-                              (self.lg.cluster == self.cluster) &
-                              (self.lg.elapsedraw >= lower) &
-                              (~self.lg.qos.isin(self.excluded_qos)) &
-                              (~self.lg.partition.isin(self.excluded_partitions)) &
-                              (~self.lg.user.isin(self.excluded_users))].copy()
+            self.lg = self.filtered(self.lg[(self.lg.state == "RUNNING") &
+                                            (self.lg.gpus > 0) &
+                                            (self.lg.cluster == self.cluster) &
+                                            (self.lg.elapsedraw >= lower) &
+                                            (~self.lg.qos.isin(self.excluded_qos)) &
+                                            (~self.lg.partition.isin(self.excluded_partitions)) &
+                                            (~self.lg.user.isin(self.excluded_users))])
             if "*" not in self.partitions:
                 self.lg = self.lg[self.lg.partition.isin(self.partitions)]
             self.sliding_warnings = []
@@ -217,15 +239,15 @@ class CancelZeroGpuJobs(Alert):
                     else:
                         prts = "_".join(sorted(set(self.partitions)))
                     jobid_cache_file = os.path.join(self.jobid_cache_path,
-                                                    f".sliding_cache_{self.cluster}_{prts}.csv")
-                    if os.path.isfile(jobid_cache_file):
-                        # make jobid string since pandas will do this if array job is found
-                        cache = pd.read_csv(jobid_cache_file,
-                                            dtype={"jobid":str,
-                                                   "checked_time":"int64",
-                                                   "idle_gpus":"int64"})
+                                                    f".sliding_cache_{self.cluster}_{prts}.db")
+                    stores = getattr(self, "sliding_stores", None)
+                    if stores is not None:
+                        if jobid_cache_file not in stores:
+                            stores[jobid_cache_file] = SlidingWindowStore(jobid_cache_file)
+                        store = stores[jobid_cache_file]
                     else:
-                        cache = pd.DataFrame(columns=["jobid", "checked_time", "idle_gpus"])
+                        store = SlidingWindowStore(jobid_cache_file)
+                    cache = store.load()
 
                     def num_idle_gpus_sliding_window(jobid: str,
                                                      window_seconds: int) -> int:
@@ -234,17 +256,25 @@ class CancelZeroGpuJobs(Alert):
                            version of call to get_job_stats() updates seven properties
                            when only one is needed. Would be nice to pass list of
                            properties that are needed."""
-                        sys.path.append(self.jobstats_module_path)
-                        sys.path.append(self.jobstats_config_path)
-                        from jobstats import Jobstats
-                        from config import PROM_SERVER
-                        stats = Jobstats(jobid=jobid,
-                                         cluster=self.cluster,
-                                         prom_server=PROM_SERVER)
-                        stats.diff = window_seconds
-                        stats.end = time.time()
-                        stats.get_job_stats()
-                        admincomment = eval(stats.report_job_json(encode=False))
+                        def fetch_jobstats(keys):
+                            add_to_sys_path(self.jobstats_module_path,
+                                            self.jobstats_config_path)
+                            from jobstats import Jobstats
+                            from config import PROM_SERVER
+                            results = {}
+                            for cluster, jobid_, (metric, window) in keys:
+                                stats = Jobstats(jobid=jobid_,
+                                                 cluster=cluster,
+                                                 prom_server=PROM_SERVER)
+                                stats.diff = window
+                                stats.end = time.time()
+                                stats.get_job_stats()
+                                results[(cluster, jobid_, (metric, window))] = \
+                                    eval(stats.report_job_json(encode=False))
+                            return results, {}
+                        key = (self.cluster, jobid, ("gpu_utilization", window_seconds))
+                        results, _ = live_cache.get_many([key], fetch_jobstats)
+                        admincomment = results.get(key, {})
                         n, error_code = num_gpus_with_zero_util(admincomment,
                                                                 jobid,
                                                                 self.cluster,
@@ -259,18 +289,18 @@ class CancelZeroGpuJobs(Alert):
                     when a new job runs for longer than sliding_warning_minutes.
 
                     To make sure that the code does not run longer than the cron sampling
-                    period, the time is checked. The loop is terminated if the cumulative
-                    time of the loop approaches the cron sampling period. Eventually all of
-                    the running jobs will be cached and the code will execute quickly.
+                    period, the checks must finish before fraction_of_period of the period
+                    has elapsed. The checks that are due are ordered by urgency (see
+                    plan_sliding_checks) and ran concurrently. Jobs that were warned and
+                    are due for the cancellation check come first, then new jobs, then the
+                    re-checks of jobs that were using their GPUs. The checks that are not
+                    finished by the deadline are deferred to the next call and the jobs
+                    keep their previous state. The jobs of the checks that failed also keep
+                    their previous state but the failures are reported as a warning.
 
                     Note that n is set to 0 if the fraction of active GPUs was greater than
                     or equal to gpu_frac_threshold. This allows us to use n_prev == 0 later.
 
-                    The loop below runs on jobs from lowest jobid to highest. This is good
-                    because the oldest jobs (lowest jobid) have already been cached. Do not
-                    want to lose cache data in rare cases when code does not finish before
-                    break is reached.
-
                     A different approach not implemented here would be to get the individual
                     utilization measurements from the NVIDIA exporter. Figure out how long
                     there has been 0% utilization and then schedule the job to be checked
@@ -281,63 +311,112 @@ class CancelZeroGpuJobs(Alert):
 
                     start_time_sliding = time.time()
                     prom_query = 0
-                    num_cached_jobs = 0
                     print(f"INFO: Looking for idle GPUs for {len(self.lg)} jobs ... ",
                           end="",
                           flush=True)
                     self.id_time_gpus = []
                     warning_seconds = self.sliding_warning_minutes * spm
                     cancel_seconds = self.sliding_cancel_minutes * spm
-                    early_break = False
-                    for jobid, num_gpus in zip(self.lg.jobid, self.lg.gpus):
-                        jobid = str(jobid)
+                    # with prometheus_batch the GPU utilization of all of the jobs
+                    # is retrieved for both windows using four queries in total. The
+                    # window of the keys is tagged since only the GPU utilization is
+                    # retrieved (the other alerts key on the window in seconds).
+                    live_cache = getattr(self, "live_stats_cache", None)
+                    if live_cache is None:
+                        live_cache = LiveStatsCache()
+                    if getattr(self, "prometheus_batch", False) and not self.lg.empty:
+                        add_to_sys_path(self.jobstats_config_path)
+                        from config import PROM_SERVER
+                        client = getattr(self, "prometheus_client", None)
+                        if client is None:
+                            client = PrometheusBatchClient(PROM_SERVER,
+                                                           timeout=getattr(self, "prometheus_timeout", None))
+                        jobids = self.lg.jobid.astype(str).tolist()
+                        # the exporters label an array job (e.g., 123_4) by its raw jobid
+                        raw_jobids = dict(zip(jobids, self.lg.jobidraw.astype(str)))
+                        for window in {warning_seconds, cancel_seconds}:
+                            def fetch_batch(keys, window=window):
+                                try:
+                                    stats = client.get_job_stats(self.cluster,
+                                                                 [raw_jobids[key[1]] for key in keys],
+                                                                 window,
+                                                                 metrics=["gpu_utilization"])
+                                except (OSError, RuntimeError, ValueError, KeyError) as e:
+                                    print(f"WARNING: Batch Prometheus query failed ({e}). "
+                                           "Querying each job.")
+                                    return {}, {}
+                                return {key: stats.get(raw_jobids[key[1]], {}) for key in keys}, {}
+                            with stage("prometheus"):
+                                live_cache.get_many([(self.cluster, jobid, ("gpu_utilization", window))
+                                                     for jobid in jobids],
+                                                    fetch_batch)
+                    checks, unchanged = plan_sliding_checks(zip(self.lg.jobid.astype(str),
+                                                                self.lg.gpus),
+                                                            cache,
+                                                            round(time.time()),
+                                                            warning_seconds,
+                                                            cancel_seconds,
+                                                            self.warning_frac)
+                    self.id_time_gpus.extend(unchanged)
+                    def check(task):
+                        _, jobid, _, window = task
                         now = round(time.time())
-                        if jobid not in cache.jobid.values:
-                            n = num_idle_gpus_sliding_window(jobid, warning_seconds)
-                            prom_query += 1
-                            if 1.0 - n / num_gpus >= self.gpu_frac_threshold:
-                                self.id_time_gpus.append([jobid, now, 0])
+                        return now, num_idle_gpus_sliding_window(jobid, window)
+                    deadline = start_time + self.fraction_of_period * self.sampling_period_minutes * spm
+                    with stage("prometheus"):
+                        results, errors = fetch_concurrently(checks,
+                                                             check,
+                                                             workers=getattr(self, "prometheus_workers", 8),
+                                                             timeout=getattr(self, "prometheus_timeout", None),
+                                                             deadline=deadline)
+                    self.sliding_deferred = []
+                    self.sliding_errors = []
+                    for task in checks:
+                        priority, jobid, num_gpus, _ = task
+                        if task not in results:
+                            # keep the previous state of a deferred or failed check
+                            if isinstance(errors.get(task), TimeoutError):
+                                self.sliding_deferred.append(jobid)
                             else:
-                                self.sliding_warnings.append(jobid)
-                                self.id_time_gpus.append([jobid, now, n])
+                                self.sliding_errors.append(jobid)
+                            if jobid in cache:
+                                self.id_time_gpus.append([jobid, *cache[jobid]])
+                            continue
+                        prom_query += 1
+                        now, n = results[task]
+                        if 1.0 - n / num_gpus >= self.gpu_frac_threshold:
+                            self.id_time_gpus.append([jobid, now, 0])
+                        elif priority == CANCEL_CHECK:
+                            self.sliding_cancellations.append(jobid)
+                            self.id_time_gpus.append([jobid, now, n])
                         else:
-                            time_prev = cache[cache.jobid == jobid]["checked_time"].values[0]
-                            n_prev = cache[cache.jobid == jobid]["idle_gpus"].values[0]
-                            if n_prev == 0:
-                                if now - time_prev >= self.warning_frac * warning_seconds:
-                                    n = num_idle_gpus_sliding_window(jobid, warning_seconds)
-                                    prom_query += 1
-                                    if 1.0 - n / num_gpus >= self.gpu_frac_threshold:
-                                        self.id_time_gpus.append([jobid, now, 0])
-                                    else:
-                                        self.sliding_warnings.append(jobid)
-                                        self.id_time_gpus.append([jobid, now, n])
-                                else:
-                                    self.id_time_gpus.append([jobid, time_prev, n_prev])
-                            else:
-                                if now - time_prev >= cancel_seconds - warning_seconds:
-                                    n = num_idle_gpus_sliding_window(jobid, cancel_seconds)
-                                    prom_query += 1
-                                    if 1.0 - n / num_gpus >= self.gpu_frac_threshold:
-                                        self.id_time_gpus.append([jobid, now, 0])
-                                    else:
-                                        self.sliding_cancellations.append(jobid)
-                                        self.id_time_gpus.append([jobid, now, n])
-                                else:
-                                    self.id_time_gpus.append([jobid, time_prev, n_prev])
-                        total_time = time.time() - start_time
-                        if total_time > self.fraction_of_period * self.sampling_period_minutes * spm:
-                            early_break = True
-                            break
-                        num_cached_jobs += 1
+                            self.sliding_warnings.append(jobid)
+                            self.id_time_gpus.append([jobid, now, n])
                     p = f"done ({round(time.time() - start_time_sliding)} seconds, {prom_query} queries)."
                     print(p, flush=True)
-                    if early_break:
-                        p = f"INFO: Only cached {num_cached_jobs} of {len(self.lg)} jobs. Will try again on next call."
+                    if self.sliding_deferred:
+                        p = (f"INFO: Deferred {len(self.sliding_deferred)} of {len(checks)} checks "
+                             "to the next call.")
                         print(p)
-                    out = pd.DataFrame(self.id_time_gpus,
-                                       columns=["jobid", "checked_time", "idle_gpus"])
-                    out.to_csv(jobid_cache_file, index=False)
+                        if self.verbose:
+                            for task, e in errors.items():
+                                if isinstance(e, TimeoutError) and not isinstance(e, DeferredError):
+                                    print(f"  {task[1]}: {e}")
+                    if self.sliding_errors:
+                        failed = [(task[1], e) for task, e in errors.items()
+                                  if not isinstance(e, TimeoutError)]
+                        jobid, e = failed[0]
+                        print(f"WARNING: {len(failed)} of {len(checks)} checks failed "
+                              f"(e.g., {jobid}: {e!r}).")
+                        if self.verbose:
+                            for jobid, e in failed:
+                                print(f"  {jobid}: {e!r}")
+                    # only write the jobs that were checked during this call
+                    store.update(row for row in self.id_time_gpus
+                                 if tuple(row[1:]) != cache.get(row[0]))
+                    store.evict(self.lg.jobid.astype(str))
+                    if stores is None:
+                        store.close()
 
     def create_emails(self, method):
         """Note that the violation history of a user is not considered here
@@ -559,8 +638,10 @@ class CancelZeroGpuJobs(Alert):
                 self.emails.append((user, email, usr))
 
     def cancel_jobs(self) -> None:
-        """Call scancel on each jobid. For this to work, the code must be ran by
-           a user with sufficient privileges."""
+        """Call scancel on the jobids in batches (see scancel_jobs). For this
+           to work, the code must be ran by a user with sufficient privileges.
+           If scancel_dry_run is True then the scancel commands are printed
+           instead of ran."""
         if not self.do_not_cancel:
             jobids_to_cancel = []
             if hasattr(self, "cancel_minutes"):
@@ -568,12 +649,60 @@ class CancelZeroGpuJobs(Alert):
             if hasattr(self, "sliding_warning_minutes") and \
                hasattr(self, "sliding_cancel_minutes"):
                 jobids_to_cancel += self.sliding_cancellations
-            for jobid in jobids_to_cancel:
-                cmd = f"scancel {jobid}"
-                _ = subprocess.run(cmd,
-                                   stdout=subprocess.PIPE,
-                                   shell=True,
-                                   timeout=10,
-                                   text=True,
-                                   check=True)
-                print(f"INFO: Cancelled job {jobid} on {self.cluster} due to 0% GPU utilization.")
+            results = scancel_jobs(jobids_to_cancel,
+                                   chunk_size=self.scancel_chunk_size,
+                                   dry_run=self.scancel_dry_run)
+            for jobid, (cancelled, msg) in results.items():
+                if self.scancel_dry_run:
+                    continue
+                if cancelled:
+                    print(f"INFO: Cancelled job {jobid} on {self.cluster} due to 0% GPU utilization.")
+                else:
+                    print(f"ERROR: Failed to cancel job {jobid} on {self.cluster} ({msg})")
+
+
+def scancel_jobs(jobids: List[str],
+                 chunk_size: int=500,
+                 dry_run: bool=False,
+                 timeout: int=60) -> Dict[str, Tuple[bool, str]]:
+    """Cancel the jobs using one scancel call per chunk of chunk_size jobids
+       (to stay well below the limit on the length of the argument list).
+       Return a dictionary mapping each jobid to (cancelled, message). When
+       scancel fails, the jobids that appear in its error messages are marked
+       as failed and the others as cancelled. If no jobid can be identified
+       then every jobid in the chunk is marked as failed. With dry_run the
+       commands are printed but not ran."""
+    jobids = [str(jobid) for jobid in dict.fromkeys(jobids)]
+    results = {}
+    for i in range(0, len(jobids), max(1, chunk_size)):
+        chunk = jobids[i:i + max(1, chunk_size)]
+        cmd = ["scancel"] + chunk
+        if dry_run:
+            print(f"INFO: Dry run: {' '.join(cmd)}")
+            results.update({jobid: (False, "dry run") for jobid in chunk})
+            continue
+        try:
+            result = subprocess.run(cmd,
+                                    stdout=subprocess.PIPE,
+                                    stderr=subprocess.PIPE,
+                                    timeout=timeout,
+                                    text=True,
+                                    check=False)
+        except (OSError, subprocess.SubprocessError) as e:
+            results.update({jobid: (False, str(e)) for jobid in chunk})
+            continue
+        if result.returncode == 0:
+            results.update({jobid: (True, "") for jobid in chunk})
+            continue
+        errors = {}
+        for line in result.stderr.splitlines():
+            for jobid in re.findall(r"[Jj]ob(?:[ _]?[Ii][Dd])?\s+(\d+(?:_\d+)?)", line):
+                errors[jobid] = line.strip()
+        failed = [jobid for jobid in chunk if jobid in errors]
+        if not failed:
+            msg = result.stderr.strip() or f"scancel exited with {result.returncode}"
+            results.update({jobid: (False, msg) for jobid in chunk})
+            continue
+        results.update({jobid: (False, errors[jobid]) if jobid in errors else (True, "")
+                        for jobid in chunk})
+    return results
@@ -1,8 +1,9 @@
 import pandas as pd
 from ..base import Alert
-from ..efficiency import cpu_efficiency
-from ..efficiency import gpu_efficiency
-from ..efficiency import gpu_memory_usage_mean_pct
+from ..metrics_tables import MetricsTables
+from ..metrics_tables import cpu_efficiency_batch
+from ..metrics_tables import gpu_efficiency_batch
+from ..metrics_tables import gpu_memory_usage_eff_tuples_batch
 from ..utils import SECONDS_PER_HOUR as sph
 from ..utils import SECONDS_PER_MINUTE as spm
 from ..utils import add_dividers
@@ -35,15 +36,15 @@ class LowEfficiency(Alert):
     def _filter_and_add_new_fields(self):
         # compute proportion (self.pr) using as much data as possible; we do not
         # exclude any users for this part
-        self.pr = self.df[(self.df.cluster == self.cluster) &
-                          (~self.df.qos.isin(self.excluded_qos)) &
-                          (~self.df.partition.isin(self.excluded_partitions)) &
-                          pd.notna(self.df[f"{self.xpu}-seconds"])].copy()
+        self.pr = self.filtered(self.df[(self.df.cluster == self.cluster) &
+                                        (~self.df.qos.isin(self.excluded_qos)) &
+                                        (~self.df.partition.isin(self.excluded_partitions)) &
+                                        pd.notna(self.df[f"{self.xpu}-seconds"])])
         if "*" not in self.partitions:
             self.pr = self.pr[self.pr.partition.isin(self.partitions)]
         if not self.pr.empty and hasattr(self, "nodelist"):
             self.pr = self.filter_by_nodelist(self.pr)
-        self.pr = self.pr.groupby("user").agg({f"{self.xpu}-seconds":"sum"})
+        self.pr = self.pr.groupby("user", observed=True).agg({f"{self.xpu}-seconds":"sum"})
         self.pr = self.pr.reset_index(drop=False)
         total = self.pr[f"{self.xpu}-seconds"].sum()
         self.ce = pd.DataFrame({"user":[]})
@@ -57,53 +58,35 @@ class LowEfficiency(Alert):
         # how to include running jobs?
 
         # second dataframe (self.ce) based on admincomment
-        self.ce = self.df[(self.df.cluster == self.cluster) &
-                          (~self.df.user.isin(self.excluded_users)) &
-                          (~self.df.qos.isin(self.excluded_qos)) &
-                          (~self.df.partition.isin(self.excluded_partitions)) &
-                          (self.df["elapsedraw"] >= self.min_run_time * spm) &
-                          (self.df.admincomment != {})].copy()
+        self.ce = self.filtered(self.df[(self.df.cluster == self.cluster) &
+                                        (~self.df.user.isin(self.excluded_users)) &
+                                        (~self.df.qos.isin(self.excluded_qos)) &
+                                        (~self.df.partition.isin(self.excluded_partitions)) &
+                                        (self.df["elapsedraw"] >= self.min_run_time * spm)])
         if "*" not in self.partitions:
             self.ce = self.ce[self.ce.partition.isin(self.partitions)]
+        self.ce = self.decode_admincomment(self.ce)
+        self.ce = self.ce[self.ce.admincomment != {}]
         if not self.ce.empty and hasattr(self, "nodelist"):
             self.ce = self.filter_by_nodelist(self.ce)
         if self.ce.empty:
             return None
         self.ce = self.ce.merge(self.pr, how="left", on="user")
-        if self.xpu == "cpu":
-            self.ce[f"{self.xpu}-tuple"] = self.ce.apply(lambda row:
-                                                         cpu_efficiency(row["admincomment"],
-                                                                        row["elapsedraw"],
-                                                                        row["jobid"],
-                                                                        row["cluster"],
-                                                                        verbose=self.verbose),
-                                                                        axis="columns")
-        else:
-            self.ce[f"{self.xpu}-tuple"] = self.ce.apply(lambda row:
-                                                         gpu_efficiency(row["admincomment"],
-                                                                        row["elapsedraw"],
-                                                                        row["jobid"],
-                                                                        row["cluster"],
-                                                                        verbose=self.verbose),
-                                                                        axis="columns")
+        tables = MetricsTables(self.ce["admincomment"])
+        efficiency_batch = cpu_efficiency_batch if self.xpu == "cpu" else gpu_efficiency_batch
         cols = [f"{self.xpu}-seconds-used",
                 f"{self.xpu}-seconds-total",
                 f"{self.xpu}-error-code"]
-        self.ce[cols] = pd.DataFrame(self.ce[f"{self.xpu}-tuple"].tolist(), index=self.ce.index)
+        self.ce[cols] = efficiency_batch(tables, self.ce["elapsedraw"]).set_axis(cols, axis="columns")
         self.ce = self.ce[self.ce[f"{self.xpu}-error-code"] == 0]
         if self.ce.empty:
             return None
         if self.xpu == "gpu" and hasattr(self, "gpu_mem_eff_pct"):
             num_jobs = len(self.ce)
-            self.ce[f"{self.xpu}-pair"] = self.ce.apply(lambda row:
-                                          gpu_memory_usage_mean_pct(row["admincomment"],
-                                                                    row["jobid"],
-                                                                    row["cluster"],
-                                                                    verbose=self.verbose),
-                                                                    axis="columns")
             cols = [f"{self.xpu}-mem-mean-pct",
                     f"{self.xpu}-error-code-2"]
-            self.ce[cols] = pd.DataFrame(self.ce[f"{self.xpu}-pair"].tolist(), index=self.ce.index)
+            pct = gpu_memory_usage_eff_tuples_batch(tables, self.ce.index, op="mean-percent")
+            self.ce[cols] = pct.set_axis(cols, axis="columns")
             self.ce = self.ce[self.ce[f"{self.xpu}-error-code-2"] == 0]
             self.ce = self.ce[self.ce[f"{self.xpu}-mem-mean-pct"] <= self.gpu_mem_eff_pct]
             num_rm = num_jobs - len(self.ce)
@@ -124,7 +107,7 @@ class LowEfficiency(Alert):
              f"{self.xpu}-seconds-all":"first",
              "cores":"mean",
              "interactive":"sum"}
-        self.ce = self.ce.groupby("user").agg(d).rename(columns={"user":"jobs"})
+        self.ce = self.ce.groupby("user", observed=True).agg(d).rename(columns={"user":"jobs"})
         self.ce = self.ce.sort_values(by=f"{self.xpu}-seconds-total", ascending=False)
         self.ce = self.ce.reset_index(drop=False)
         self.ce = self.ce.head(self.num_top_users)
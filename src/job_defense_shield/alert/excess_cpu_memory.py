@@ -1,6 +1,7 @@
 import pandas as pd
 from ..base import Alert
-from ..efficiency import cpu_memory_usage
+from ..metrics_tables import MetricsTables
+from ..metrics_tables import cpu_memory_usage_batch
 from ..utils import add_dividers
 from ..utils import MINUTES_PER_HOUR as mph
 from ..greeting import GreetingFactory
@@ -28,14 +29,15 @@ class ExcessCPUMemory(Alert):
 
     def _filter_and_add_new_fields(self):
         # exclude gpu jobs?
-        self.df = self.df[(self.df.cluster == self.cluster) &
-                          (self.df.state != "OUT_OF_MEMORY") &
-                          (~self.df.qos.isin(self.excluded_qos)) &
-                          (~self.df.partition.isin(self.excluded_partitions)) &
-                          (~self.df.user.isin(self.excluded_users)) &
-                          (self.df["elapsed-hours"] >= self.min_run_time / mph)].copy()
+        self.df = self.filtered(self.df[(self.df.cluster == self.cluster) &
+                                        (self.df.state != "OUT_OF_MEMORY") &
+                                        (~self.df.qos.isin(self.excluded_qos)) &
+                                        (~self.df.partition.isin(self.excluded_partitions)) &
+                                        (~self.df.user.isin(self.excluded_users)) &
+                                        (self.df["elapsed-hours"] >= self.min_run_time / mph)])
         if "*" not in self.partitions:
             self.df = self.df[self.df.partition.isin(self.partitions)]
+        self.df = self.decode_admincomment(self.df)
         if not self.df.empty and self.include_running_jobs:
             self.df.admincomment = self.get_admincomment_for_running_jobs()
         self.df = self.df[self.df.admincomment != {}]
@@ -52,14 +54,10 @@ class ExcessCPUMemory(Alert):
         self.admin = pd.DataFrame()
         # add new fields
         if not self.df.empty:
-            self.df["memory-tuple"] = self.df.apply(lambda row:
-                                                    cpu_memory_usage(row["admincomment"],
-                                                                     row["jobid"],
-                                                                     row["cluster"],
-                                                                     verbose=self.verbose),
-                                                                     axis="columns")
-            self.df["mem-used"]   = self.df["memory-tuple"].apply(lambda x: x[0])
-            self.df["mem-alloc"]  = self.df["memory-tuple"].apply(lambda x: x[1])
+            tables = MetricsTables(self.df["admincomment"])
+            memory = cpu_memory_usage_batch(tables, self.df.index)
+            self.df["mem-used"]   = memory["used"]
+            self.df["mem-alloc"]  = memory["total"]
             self.df["mem-unused"] = self.df["mem-alloc"] - self.df["mem-used"]
             # filter out jobs using approximately default memory
             self.df["GB-per-core"] = self.df["mem-alloc"] / self.df["cores"]
@@ -85,7 +83,7 @@ class ExcessCPUMemory(Alert):
                  "mean-ratio":"mean",
                  "median-ratio":"median",
                  "user":"size"}
-            self.gp = self.df.groupby(["cluster", "partition", "user"]).agg(d)
+            self.gp = self.df.groupby(["cluster", "partition", "user"], observed=True).agg(d)
             self.gp = self.gp.rename(columns={"user":"jobs"})
             self.gp.reset_index(drop=False, inplace=True)
             total_mem_hours = self.gp["mem-hrs-alloc"].sum()
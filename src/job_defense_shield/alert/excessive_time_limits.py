@@ -32,14 +32,15 @@ class ExcessiveTimeLimits(Alert):
             self.median_ratio_threshold = 1.0
 
     def _filter_and_add_new_fields(self):
-        self.df = self.df[(self.df.cluster == self.cluster) &
-                          (self.df.state.isin(["COMPLETED"])) &
-                          (~self.df.qos.isin(self.excluded_qos)) &
-                          (~self.df.partition.isin(self.excluded_partitions)) &
-                          (~self.df.user.isin(self.excluded_users)) &
-                          (self.df["elapsed-hours"] >= self.min_run_time / mph)].copy()
+        self.df = self.filtered(self.df[(self.df.cluster == self.cluster) &
+                                        (self.df.state.isin(["COMPLETED"])) &
+                                        (~self.df.qos.isin(self.excluded_qos)) &
+                                        (~self.df.partition.isin(self.excluded_partitions)) &
+                                        (~self.df.user.isin(self.excluded_users)) &
+                                        (self.df["elapsed-hours"] >= self.min_run_time / mph)])
         if "*" not in self.partitions:
             self.df = self.df[self.df.partition.isin(self.partitions)]
+        self.df = self.decode_admincomment(self.df)
         self.df = self.df[self.df.admincomment != {}]
         if not self.df.empty and hasattr(self, "nodelist"):
             self.df = self.filter_by_nodelist(self.df)
@@ -62,7 +63,7 @@ class ExcessiveTimeLimits(Alert):
                  "partition":lambda series: ",".join(sorted(set(series))),
                  "mean-ratio":"mean",
                  "median-ratio":"median"}
-            self.gp = self.df.groupby("user").agg(d).rename(columns={"user":"jobs"})
+            self.gp = self.df.groupby("user", observed=True).agg(d).rename(columns={"user":"jobs"})
             self.gp = self.gp.sort_values(by=f"{xpu}-hours", ascending=False).reset_index(drop=False)
             self.gp["rank"] = self.gp.index + 1
             self.gp = self.gp.sort_values(by=f"{xpu}-waste-hours", ascending=False).reset_index(drop=False)
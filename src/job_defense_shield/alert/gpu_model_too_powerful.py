@@ -2,8 +2,9 @@ import pandas as pd
 from ..base import Alert
 from ..utils import add_dividers
 from ..utils import MINUTES_PER_HOUR as mph
-from ..efficiency import cpu_memory_usage
-from ..efficiency import gpu_memory_usage_eff_tuples
+from ..metrics_tables import MetricsTables
+from ..metrics_tables import cpu_memory_usage_batch
+from ..metrics_tables import gpu_memory_usage_eff_tuples_batch
 from ..greeting import GreetingFactory
 from ..email_translator import EmailTranslator
 
@@ -28,13 +29,13 @@ class GpuModelTooPowerful(Alert):
             self.gpu_hours_threshold = 0
 
     def _filter_and_add_new_fields(self):
-        self.df = self.df[(self.df.cluster == self.cluster) &
-                          (self.df.gpus > 0) &
-                          (~self.df.qos.isin(self.excluded_qos)) &
-                          (~self.df.partition.isin(self.excluded_partitions)) &
-                          (~self.df.user.isin(self.excluded_users)) &
-                          (self.df.state != "OUT_OF_MEMORY") &
-                          (self.df["elapsed-hours"] >= self.min_run_time / mph)].copy()
+        self.df = self.filtered(self.df[(self.df.cluster == self.cluster) &
+                                        (self.df.gpus > 0) &
+                                        (~self.df.qos.isin(self.excluded_qos)) &
+                                        (~self.df.partition.isin(self.excluded_partitions)) &
+                                        (~self.df.user.isin(self.excluded_users)) &
+                                        (self.df.state != "OUT_OF_MEMORY") &
+                                        (self.df["elapsed-hours"] >= self.min_run_time / mph)])
         if "*" not in self.partitions:
             self.df = self.df[self.df.partition.isin(self.partitions)]
         self.df["GPU-Hours"] = self.df.gpus * self.df["elapsed-hours"]
@@ -43,6 +44,7 @@ class GpuModelTooPowerful(Alert):
             self.df = self.df[self.df.gpus <= self.num_gpus]
         if hasattr(self, "num_cores_per_gpu"):
             self.df = self.df[self.df["Cores/GPU"] <= self.num_cores_per_gpu]
+        self.df = self.decode_admincomment(self.df)
         if not self.df.empty and self.include_running_jobs:
             self.df.admincomment = self.get_admincomment_for_running_jobs()
         self.df = self.df[self.df.admincomment != {}]
@@ -51,13 +53,10 @@ class GpuModelTooPowerful(Alert):
         self.df.rename(columns={"user":"User"}, inplace=True)
         # add new fields
         if not self.df.empty:
-            self.df["gpu-tuple"] = self.df.apply(lambda row:
-                                   gpu_memory_usage_eff_tuples(row["admincomment"],
-                                                               row["jobid"],
-                                                               row["cluster"],
-                                                               verbose=self.verbose),
-                                                               axis="columns")
-            self.df["error_code"] = self.df["gpu-tuple"].apply(lambda x: x[1])
+            tables = MetricsTables(self.df["admincomment"])
+            tuples = gpu_memory_usage_eff_tuples_batch(tables, self.df.index)
+            self.df["gpu-tuple"] = list(zip(tuples["value"], tuples["error_code"]))
+            self.df["error_code"] = tuples["error_code"]
             self.df = self.df[self.df["error_code"] == 0]
             def max_gpu_mem(tpl):
                 items, error_code = tpl
@@ -69,14 +68,9 @@ class GpuModelTooPowerful(Alert):
             self.df["GPU-Util"] = self.df["gpu-tuple"].apply(mean_gpu_util)
             if not self.df.empty:
                 # add CPU memory usage
-                self.df["memory-tuple"] = self.df.apply(lambda row:
-                                          cpu_memory_usage(row["admincomment"],
-                                                           row["jobid"],
-                                                           row["cluster"],
-                                                           verbose=self.verbose),
-                                                           axis="columns")
                 cols = ["CPU-Mem-Used", "mem-alloc", "error_code-cpu"]
-                self.df[cols] = pd.DataFrame(self.df["memory-tuple"].tolist(), index=self.df.index)
+                memory = cpu_memory_usage_batch(tables, self.df.index)
+                self.df[cols] = memory.set_axis(cols, axis="columns")
                 self.df = self.df[self.df["error_code-cpu"] == 0]
                 self.df["CPU-Mem-Used-per-GPU"] = self.df["CPU-Mem-Used"] / self.df["gpus"]
                 # find jobs that could have used less powerful gpus
@@ -111,7 +105,7 @@ class GpuModelTooPowerful(Alert):
                         "Hours",
                         "GPU-Hours"]
                 self.df = self.df[cols]
-                self.gp = self.df.groupby("User").agg({"GPU-Hours":"sum"}).reset_index()
+                self.gp = self.df.groupby("User", observed=True).agg({"GPU-Hours":"sum"}).reset_index()
                 self.gp = self.gp[self.gp["GPU-Hours"] > self.gpu_hours_threshold]
                 self.df = self.df[self.df.User.isin(self.gp.User)]
 
@@ -181,7 +175,7 @@ class GpuModelTooPowerful(Alert):
             ellipsis = "+ " if len(series) > self.max_num_jobid_admin else "  "
             return ",".join(series[:self.max_num_jobid_admin]) + ellipsis
         d = {"GPU-Hours":"sum", "User":"size", "JobID":jobid_list}
-        self.admin = self.df.groupby("User").agg(d)
+        self.admin = self.df.groupby("User", observed=True).agg(d)
         renamings = {"User":"Jobs"}
         self.admin = self.admin.rename(columns=renamings)
         self.admin.reset_index(drop=False, inplace=True)
@@ -16,7 +16,7 @@ class JobsOverview(Alert):
             self.report_title = "Users with the Most Jobs"
 
     def _filter_and_add_new_fields(self):
-        self.df = self.df[self.df["elapsedraw"] > 0].copy()
+        self.df = self.filtered(self.df[self.df["elapsedraw"] > 0])
         cols = ["jobid",
                 "user",
                 "cluster",
@@ -27,12 +27,12 @@ class JobsOverview(Alert):
                 "gpus"]
         self.df = self.df[cols]
         # add new fields
-        self.df["CLD"] = self.df.state.apply(lambda s: s == "CANCELLED")
-        self.df["COM"] = self.df.state.apply(lambda s: s == "COMPLETED")
-        self.df["OOM"] = self.df.state.apply(lambda s: s == "OUT_OF_MEMORY")
-        self.df["TO"]  = self.df.state.apply(lambda s: s == "TIMEOUT")
-        self.df["F"]   = self.df.state.apply(lambda s: s == "FAILED")
-        self.df["RUN"] = self.df.state.apply(lambda s: s == "RUNNING")
+        self.df["CLD"] = self.df.state == "CANCELLED"
+        self.df["COM"] = self.df.state == "COMPLETED"
+        self.df["OOM"] = self.df.state == "OUT_OF_MEMORY"
+        self.df["TO"]  = self.df.state == "TIMEOUT"
+        self.df["F"]   = self.df.state == "FAILED"
+        self.df["RUN"] = self.df.state == "RUNNING"
         self.df["gpu-job"] = self.df.gpus.apply(lambda g: 1 if g else 0)
         d = {"user":"size",
              "COM":"sum",
@@ -45,7 +45,7 @@ class JobsOverview(Alert):
              "gpu-seconds":"sum",
              "gpu-job":"sum",
              "partition":lambda series: ",".join(sorted(set(series)))}
-        self.gp = self.df.groupby(["cluster", "user"]).agg(d)
+        self.gp = self.df.groupby(["cluster", "user"], observed=True).agg(d)
         self.gp = self.gp.rename(columns={"user":"jobs"})
         self.gp = self.gp.reset_index(drop=False)
         self.gp = self.gp.sort_values("jobs", ascending=False)
@@ -21,7 +21,7 @@ class LongestQueuedJobs(Alert):
 
     def _filter_and_add_new_fields(self):
         # filter the dataframe
-        self.df = self.df[self.df.state == "PENDING"].copy()
+        self.df = self.filtered(self.df[self.df.state == "PENDING"])
         # remove array jobs
         self.df = self.df[~self.df.jobid.str.contains("_")]
         # add new fields
@@ -39,12 +39,12 @@ class LongestQueuedJobs(Alert):
                 "e-days"]
         major, minor, _ = map(int, pd.__version__.split("."))
         if (major >= 2 and minor >= 2) or major >= 3:
-            self.df = self.df[cols].groupby("user").apply(lambda d:
+            self.df = self.df[cols].groupby("user", observed=True).apply(lambda d:
                                                           d.iloc[d["s-days"].argmax()],
                                                           include_groups=False)
             self.df.reset_index(inplace=True)
         else:
-            self.df = self.df[cols].groupby("user").apply(lambda d:
+            self.df = self.df[cols].groupby("user", observed=True).apply(lambda d:
                                                           d.iloc[d["s-days"].argmax()])
         self.df = self.df[cols]
         self.df.sort_values("s-days", ascending=False, inplace=True)
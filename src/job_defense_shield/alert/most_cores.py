@@ -1,6 +1,7 @@
 import pandas as pd
 from ..base import Alert
-from ..efficiency import cpu_efficiency
+from ..metrics_tables import MetricsTables
+from ..metrics_tables import cpu_efficiency_batch
 from ..utils import add_dividers
 from ..utils import JOBSTATES
 
@@ -29,31 +30,23 @@ class MostCores(Alert):
                 "elapsed-hours",
                 "admincomment",
                 "elapsedraw"]
-        major, minor, _ = map(int, pd.__version__.split("."))
-        if (major >= 2 and minor >= 2) or major >= 3:
-            self.gp = self.df[cols].groupby("user").apply(lambda d:
-                                                          d.iloc[d["cores"].argmax()],
-                                                          include_groups=False)
-            self.gp.reset_index(inplace=True)
-        else:
-            self.gp = self.df[cols].groupby("user").apply(lambda d:
-                                                          d.iloc[d["cores"].argmax()])
+        # first job with the most cores for each user
+        rows = self.df.groupby("user", observed=True)["cores"].idxmax()
+        self.gp = self.df.loc[rows, cols]
         self.gp = self.gp.sort_values("cores", ascending=False)[:10]
+        self.gp = self.decode_admincomment(self.gp)
         self.gp = self.gp.rename(columns={"elapsed-hours":"Hours"})
         self.gp.state = self.gp.state.apply(lambda x: JOBSTATES[x])
         if not self.gp.empty:
-            self.gp["CPU-eff-tpl"] = self.gp.apply(lambda row:
-                                          cpu_efficiency(row["admincomment"],
-                                                         row["elapsedraw"],
-                                                         row["jobid"],
-                                                         row["cluster"],
-                                                         single=True,
-                                                         verbose=self.verbose)
-                                          if row["admincomment"] != {}
-                                          else ("--", 0), axis="columns")
+            tables = MetricsTables(self.gp["admincomment"])
             cols = ["CPU-eff", "error-code"]
-            self.gp[cols] = pd.DataFrame(self.gp["CPU-eff-tpl"].tolist(),
-                                         index=self.gp.index)
+            eff = cpu_efficiency_batch(tables, self.gp["elapsedraw"], single=True)
+            self.gp[cols] = eff.set_axis(cols, axis="columns")
+            # jobs without summary statistics are shown with --
+            no_stats = pd.Series([ss == {} for ss in self.gp["admincomment"]],
+                                 index=self.gp.index)
+            self.gp["CPU-eff"] = self.gp["CPU-eff"].astype(object).mask(no_stats, "--")
+            self.gp["error-code"] = self.gp["error-code"].mask(no_stats, 0)
             self.gp = self.gp[self.gp["error-code"] == 0]
             self.gp["CPU-eff"] = self.gp["CPU-eff"].apply(lambda x:
                                                           x if x == "--"
@@ -1,7 +1,8 @@
 import pandas as pd
 from ..base import Alert
 from ..utils import add_dividers
-from ..efficiency import gpu_efficiency
+from ..metrics_tables import MetricsTables
+from ..metrics_tables import gpu_efficiency_batch
 from ..utils import JOBSTATES
 
 
@@ -30,31 +31,23 @@ class MostGPUs(Alert):
                 "admincomment",
                 "elapsedraw"]
         self.df = self.df[(self.df.gpus > 0) & (self.df.elapsedraw > 0)]
-        major, minor, _ = map(int, pd.__version__.split("."))
-        if (major >= 2 and minor >= 2) or major >= 3:
-            self.gp = self.df[cols].groupby("user").apply(lambda d:
-                                                          d.iloc[d["gpus"].argmax()],
-                                                          include_groups=False)
-            self.gp.reset_index(inplace=True)
-        else:
-            self.gp = self.df[cols].groupby("user").apply(lambda d:
-                                                          d.iloc[d["gpus"].argmax()])
+        # first job with the most gpus for each user
+        rows = self.df.groupby("user", observed=True)["gpus"].idxmax()
+        self.gp = self.df.loc[rows, cols]
         self.gp = self.gp.sort_values("gpus", ascending=False)[:10]
+        self.gp = self.decode_admincomment(self.gp)
         self.gp.rename(columns={"elapsed-hours":"Hours"}, inplace=True)
         self.gp.state = self.gp.state.apply(lambda x: JOBSTATES[x])
         if not self.gp.empty:
-            self.gp["GPU-eff-tpl"] = self.gp.apply(lambda row:
-                                          gpu_efficiency(row["admincomment"],
-                                                         row["elapsedraw"],
-                                                         row["jobid"],
-                                                         row["cluster"],
-                                                         single=True,
-                                                         verbose=self.verbose)
-                                          if row["admincomment"] != {}
-                                          else ("--", 0), axis="columns")
+            tables = MetricsTables(self.gp["admincomment"])
             cols = ["GPU-eff", "error-code"]
-            self.gp[cols] = pd.DataFrame(self.gp["GPU-eff-tpl"].tolist(),
-                                         index=self.gp.index)
+            eff = gpu_efficiency_batch(tables, self.gp["elapsedraw"], single=True)
+            self.gp[cols] = eff.set_axis(cols, axis="columns")
+            # jobs without summary statistics are shown with --
+            no_stats = pd.Series([ss == {} for ss in self.gp["admincomment"]],
+                                 index=self.gp.index)
+            self.gp["GPU-eff"] = self.gp["GPU-eff"].astype(object).mask(no_stats, "--")
+            self.gp["error-code"] = self.gp["error-code"].mask(no_stats, 0)
             self.gp = self.gp[self.gp["error-code"] == 0]
             self.gp["GPU-eff"] = self.gp["GPU-eff"].apply(lambda x:
                                                           x if x == "--"
@@ -1,8 +1,9 @@
 import math
 import pandas as pd
 from ..base import Alert
-from ..efficiency import cpu_memory_usage
-from ..efficiency import cpu_nodes_with_zero_util
+from ..metrics_tables import MetricsTables
+from ..metrics_tables import cpu_memory_usage_batch
+from ..metrics_tables import cpu_nodes_with_zero_util_batch
 from ..utils import add_dividers
 from ..utils import MINUTES_PER_HOUR as mph
 from ..greeting import GreetingFactory
@@ -46,16 +47,17 @@ class MultinodeCpuFragmentation(Alert):
         return max(min_nodes_by_cores, min_nodes_by_memory)
 
     def _filter_and_add_new_fields(self):
-        self.df = self.df[(self.df.cluster == self.cluster) &
-                          (self.df.nodes >= self.min_nodes_thres) &
-                          (self.df["gpus"] == 0) &
-                          (~self.df.qos.isin(self.excluded_qos)) &
-                          (~self.df.partition.isin(self.excluded_partitions)) &
-                          (~self.df.user.isin(self.excluded_users)) &
-                          (self.df.state != "OUT_OF_MEMORY") &
-                          (self.df["elapsed-hours"] >= self.min_run_time / mph)].copy()
+        self.df = self.filtered(self.df[(self.df.cluster == self.cluster) &
+                                        (self.df.nodes >= self.min_nodes_thres) &
+                                        (self.df["gpus"] == 0) &
+                                        (~self.df.qos.isin(self.excluded_qos)) &
+                                        (~self.df.partition.isin(self.excluded_partitions)) &
+                                        (~self.df.user.isin(self.excluded_users)) &
+                                        (self.df.state != "OUT_OF_MEMORY") &
+                                        (self.df["elapsed-hours"] >= self.min_run_time / mph)])
         if "*" not in self.partitions:
             self.df = self.df[self.df.partition.isin(self.partitions)]
+        self.df = self.decode_admincomment(self.df)
         if not self.df.empty and self.include_running_jobs:
             self.df.admincomment = self.get_admincomment_for_running_jobs()
         self.df = self.df[self.df.admincomment != {}]
@@ -63,26 +65,17 @@ class MultinodeCpuFragmentation(Alert):
             self.df = self.filter_by_nodelist(self.df)
         # add new fields
         if not self.df.empty:
-            self.df["nodes-tuple"] = self.df.apply(lambda row:
-                                     cpu_nodes_with_zero_util(row["admincomment"],
-                                                              row["jobid"],
-                                                              row["cluster"],
-                                                              verbose=self.verbose),
-                                                              axis="columns")
+            tables = MetricsTables(self.df["admincomment"])
             cols = ["nodes-unused", "error_code"]
-            self.df[cols] = pd.DataFrame(self.df["nodes-tuple"].tolist(), index=self.df.index)
+            zero = cpu_nodes_with_zero_util_batch(tables, self.df.index)
+            self.df[cols] = zero.set_axis(cols, axis="columns")
             self.df = self.df[(self.df["error_code"] == 0) & (self.df["nodes-unused"] == 0)]
             if not self.df.empty:
                 self.df["cores-per-node"] = self.df["cores"] / self.df["nodes"]
                 self.df["cores-per-node"] = self.df["cores-per-node"].apply(lambda x: round(x, 1))
-                self.df["memory-tuple"] = self.df.apply(lambda row:
-                                                        cpu_memory_usage(row["admincomment"],
-                                                                         row["jobid"],
-                                                                         row["cluster"],
-                                                                         verbose=self.verbose),
-                                                                         axis="columns")
                 cols = ["memory-used", "memory-alloc", "error_code"]
-                self.df[cols] = pd.DataFrame(self.df["memory-tuple"].tolist(), index=self.df.index)
+                memory = cpu_memory_usage_batch(tables, self.df.index)
+                self.df[cols] = memory.set_axis(cols, axis="columns")
                 self.df = self.df[self.df["error_code"] == 0]
                 self.df["memory-per-node-used"] = self.df["memory-used"] / self.df["nodes"]
                 self.df["memory-per-node-used"] = self.df["memory-per-node-used"].apply(round)
@@ -1,6 +1,7 @@
 import pandas as pd
 from ..base import Alert
-from ..efficiency import gpu_efficiency
+from ..metrics_tables import MetricsTables
+from ..metrics_tables import gpu_efficiency_batch
 from ..utils import add_dividers
 from ..utils import JOBSTATES
 from ..utils import MINUTES_PER_HOUR as mph
@@ -22,16 +23,17 @@ class MultinodeGpuFragmentation(Alert):
             self.report_title = "Multinode GPU Jobs with Fragmentation"
 
     def _filter_and_add_new_fields(self):
-        self.df = self.df[(self.df.cluster == self.cluster) &
-                          (self.df.gpus > 0) &
-                          (self.df.nodes > 1) &
-                          (self.df.gpus / self.df.nodes < self.gpus_per_node) &
-                          (~self.df.qos.isin(self.excluded_qos)) &
-                          (~self.df.partition.isin(self.excluded_partitions)) &
-                          (~self.df.user.isin(self.excluded_users)) &
-                          (self.df["elapsed-hours"] >= self.min_run_time / mph)].copy()
+        self.df = self.filtered(self.df[(self.df.cluster == self.cluster) &
+                                        (self.df.gpus > 0) &
+                                        (self.df.nodes > 1) &
+                                        (self.df.gpus / self.df.nodes < self.gpus_per_node) &
+                                        (~self.df.qos.isin(self.excluded_qos)) &
+                                        (~self.df.partition.isin(self.excluded_partitions)) &
+                                        (~self.df.user.isin(self.excluded_users)) &
+                                        (self.df["elapsed-hours"] >= self.min_run_time / mph)])
         if "*" not in self.partitions:
             self.df = self.df[self.df.partition.isin(self.partitions)]
+        self.df = self.decode_admincomment(self.df)
         if not self.df.empty and self.include_running_jobs:
             self.df.admincomment = self.get_admincomment_for_running_jobs()
         self.df = self.df[self.df.admincomment != {}]
@@ -40,19 +42,12 @@ class MultinodeGpuFragmentation(Alert):
         self.df.rename(columns={"user":"User"}, inplace=True)
         # add new fields
         if not self.df.empty:
-            self.df["GPU-Eff-tpl"] = self.df.apply(lambda row:
-                                                   gpu_efficiency(row["admincomment"],
-                                                                  row["elapsedraw"],
-                                                                  row["jobid"],
-                                                                  row["cluster"],
-                                                                  single=True,
-                                                                  verbose=self.verbose),
-                                                                  axis="columns")
-            self.df["error-code"] = self.df["GPU-Eff-tpl"].apply(lambda tpl: tpl[1])
+            tables = MetricsTables(self.df["admincomment"])
+            eff = gpu_efficiency_batch(tables, self.df["elapsedraw"], single=True)
+            self.df[["GPU-Eff", "error-code"]] = eff.set_axis(["GPU-Eff", "error-code"], axis="columns")
             # drop jobs with non-zero error code
             self.df = self.df[self.df["error-code"] == 0]
-            self.df["GPU-Eff"] = self.df["GPU-Eff-tpl"].apply(lambda tpl: tpl[0])
-            self.df = self.df.drop(columns=["GPU-Eff-tpl", "error-code"])
+            self.df = self.df.drop(columns=["error-code"])
 
             self.df["GPUs-per-Node"] = self.df.gpus / self.df.nodes
             cols = ["jobid",
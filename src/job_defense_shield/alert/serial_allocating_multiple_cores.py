@@ -2,7 +2,8 @@ import pandas as pd
 from ..base import Alert
 from ..utils import add_dividers
 from ..utils import MINUTES_PER_HOUR as mph
-from ..efficiency import cpu_efficiency
+from ..metrics_tables import MetricsTables
+from ..metrics_tables import cpu_efficiency_batch
 from ..greeting import GreetingFactory
 from ..email_translator import EmailTranslator
 
@@ -29,19 +30,20 @@ class SerialAllocatingMultipleCores(Alert):
             self.ignore_job_arrays = False
 
     def _filter_and_add_new_fields(self):
-        self.df = self.df[(self.df.cluster == self.cluster) &
-                          (self.df.nodes == 1) &
-                          (self.df.cores > 1) &
-                          (~self.df.qos.isin(self.excluded_qos)) &
-                          (~self.df.partition.isin(self.excluded_partitions)) &
-                          (~self.df.user.isin(self.excluded_users)) &
-                          (self.df["elapsed-hours"] >= self.min_run_time / mph)].copy()
+        self.df = self.filtered(self.df[(self.df.cluster == self.cluster) &
+                                        (self.df.nodes == 1) &
+                                        (self.df.cores > 1) &
+                                        (~self.df.qos.isin(self.excluded_qos)) &
+                                        (~self.df.partition.isin(self.excluded_partitions)) &
+                                        (~self.df.user.isin(self.excluded_users)) &
+                                        (self.df["elapsed-hours"] >= self.min_run_time / mph)])
         if "*" not in self.partitions:
             self.df = self.df[self.df.partition.isin(self.partitions)]
         if self.ignore_job_arrays:
             print("INFO: ignoring job arrays for --serial-allocating-multiple")
             self.df = self.df[pd.notna(self.df.jobid)]
             self.df = self.df[~self.df.jobid.str.contains("_")]
+        self.df = self.decode_admincomment(self.df)
         if not self.df.empty and self.include_running_jobs:
             self.df.admincomment = self.get_admincomment_for_running_jobs()
         self.df = self.df[self.df.admincomment != {}]
@@ -50,19 +52,11 @@ class SerialAllocatingMultipleCores(Alert):
         self.gp = pd.DataFrame({"User":[]})
         if not self.df.empty:
             # add new fields
-            self.df["cpu-eff-tpl"] = self.df.apply(lambda row:
-                                                   cpu_efficiency(row["admincomment"],
-                                                                  row["elapsedraw"],
-                                                                  row["jobid"],
-                                                                  row["cluster"],
-                                                                  single=True,
-                                                                  precision=1,
-                                                                  verbose=self.verbose),
-                                                                  axis="columns")
-            self.df["error-code"] = self.df["cpu-eff-tpl"].apply(lambda tpl: tpl[1])
+            tables = MetricsTables(self.df["admincomment"])
+            eff = cpu_efficiency_batch(tables, self.df["elapsedraw"], single=True, precision=1)
+            self.df[["cpu-eff", "error-code"]] = eff.set_axis(["cpu-eff", "error-code"], axis="columns")
             # drop jobs with non-zero error codes
             self.df = self.df[self.df["error-code"] == 0]
-            self.df["cpu-eff"] = self.df["cpu-eff-tpl"].apply(lambda tpl: tpl[0])
             # ignore jobs at 0% CPU-eff (also avoids division by zero later)
             self.df = self.df[self.df["cpu-eff"] > 0]
             # max efficiency if serial is 100% / cores
@@ -98,7 +92,7 @@ class SerialAllocatingMultipleCores(Alert):
                  "User":"size",
                  "CPU-Cores":"mean",
                  "JobID":jobid_list}
-            self.gp = self.df.groupby("User").agg(d).rename(columns={"User":"Jobs"})
+            self.gp = self.df.groupby("User", observed=True).agg(d).rename(columns={"User":"Jobs"})
             self.gp.reset_index(drop=False, inplace=True)
             self.gp = self.gp[self.gp["CPU-Hours-Wasted"] > self.cpu_hours_threshold]
             self.gp = self.gp.head(self.num_top_users)
@@ -2,7 +2,8 @@ import pandas as pd
 from ..base import Alert
 from ..utils import add_dividers
 from ..utils import MINUTES_PER_HOUR as mph
-from ..efficiency import cpu_efficiency
+from ..metrics_tables import MetricsTables
+from ..metrics_tables import cpu_efficiency_batch
 from ..greeting import GreetingFactory
 from ..email_translator import EmailTranslator
 
@@ -28,15 +29,16 @@ class TooManyCoresPerGpu(Alert):
 
     def _filter_and_add_new_fields(self):
         # filter the dataframe
-        self.df = self.df[(self.df.cluster == self.cluster) &
-                          (self.df.gpus > 0) &
-                          (self.df.cores > self.cores_per_gpu_limit * self.df.gpus) &
-                          (~self.df.qos.isin(self.excluded_qos)) &
-                          (~self.df.partition.isin(self.excluded_partitions)) &
-                          (~self.df.user.isin(self.excluded_users)) &
-                          (self.df["elapsed-hours"] >= self.min_run_time / mph)].copy()
+        self.df = self.filtered(self.df[(self.df.cluster == self.cluster) &
+                                        (self.df.gpus > 0) &
+                                        (self.df.cores > self.cores_per_gpu_limit * self.df.gpus) &
+                                        (~self.df.qos.isin(self.excluded_qos)) &
+                                        (~self.df.partition.isin(self.excluded_partitions)) &
+                                        (~self.df.user.isin(self.excluded_users)) &
+                                        (self.df["elapsed-hours"] >= self.min_run_time / mph)])
         if "*" not in self.partitions:
             self.df = self.df[self.df.partition.isin(self.partitions)]
+        self.df = self.decode_admincomment(self.df)
         if not self.df.empty and self.include_running_jobs:
             self.df.admincomment = self.get_admincomment_for_running_jobs()
         self.df = self.df[self.df.admincomment != {}]
@@ -45,16 +47,10 @@ class TooManyCoresPerGpu(Alert):
         self.df.rename(columns={"user":"User"}, inplace=True)
         if self.df.empty:
             return None
-        self.df["cpu-tuple"] = self.df.apply(lambda row:
-                                             cpu_efficiency(row["admincomment"],
-                                                            row["elapsedraw"],
-                                                            row["jobid"],
-                                                            row["cluster"],
-                                                            single=True,
-                                                            verbose=self.verbose),
-                                                            axis="columns")
+        tables = MetricsTables(self.df["admincomment"])
         cols = ["CPU-Eff", "error-code"]
-        self.df[cols] = pd.DataFrame(self.df["cpu-tuple"].tolist(), index=self.df.index)
+        eff = cpu_efficiency_batch(tables, self.df["elapsedraw"], single=True)
+        self.df[cols] = eff.set_axis(cols, axis="columns")
         self.df = self.df[self.df["error-code"] == 0]
         self.df = self.df[self.df["CPU-Eff"] <= self.cpu_eff_threshold]
         if self.df.empty:
@@ -75,7 +71,7 @@ class TooManyCoresPerGpu(Alert):
         self.df = self.df[cols]
         # only include users with gpu-hours > gpu_hours_threshold
         self.df["gpu-hours"] = self.df["gpus"] * self.df["elapsed-hours"]
-        self.gp = self.df.groupby("User").agg({"gpu-hours":"sum"}).reset_index()
+        self.gp = self.df.groupby("User", observed=True).agg({"gpu-hours":"sum"}).reset_index()
         self.gp = self.gp[self.gp["gpu-hours"] > self.gpu_hours_threshold]
         self.df = self.df[self.df.User.isin(self.gp.User)]
         self.df.drop(columns=["gpu-hours"], inplace=True)
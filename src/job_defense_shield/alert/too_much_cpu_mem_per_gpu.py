@@ -2,7 +2,8 @@ import pandas as pd
 from ..base import Alert
 from ..utils import add_dividers
 from ..utils import MINUTES_PER_HOUR as mph
-from ..efficiency import cpu_memory_usage
+from ..metrics_tables import MetricsTables
+from ..metrics_tables import cpu_memory_usage_batch
 from ..greeting import GreetingFactory
 from ..email_translator import EmailTranslator
 
@@ -27,15 +28,16 @@ class TooMuchCpuMemPerGpu(Alert):
             self.gpu_hours_threshold = 0
 
     def _filter_and_add_new_fields(self):
-        self.df = self.df[(self.df.cluster == self.cluster) &
-                          (self.df.gpus > 0) &
-                          (self.df.state != "OUT_OF_MEMORY") &
-                          (~self.df.qos.isin(self.excluded_qos)) &
-                          (~self.df.partition.isin(self.excluded_partitions)) &
-                          (~self.df.user.isin(self.excluded_users)) &
-                          (self.df["elapsed-hours"] >= self.min_run_time / mph)].copy()
+        self.df = self.filtered(self.df[(self.df.cluster == self.cluster) &
+                                        (self.df.gpus > 0) &
+                                        (self.df.state != "OUT_OF_MEMORY") &
+                                        (~self.df.qos.isin(self.excluded_qos)) &
+                                        (~self.df.partition.isin(self.excluded_partitions)) &
+                                        (~self.df.user.isin(self.excluded_users)) &
+                                        (self.df["elapsed-hours"] >= self.min_run_time / mph)])
         if "*" not in self.partitions:
             self.df = self.df[self.df.partition.isin(self.partitions)]
+        self.df = self.decode_admincomment(self.df)
         if not self.df.empty and self.include_running_jobs:
             self.df.admincomment = self.get_admincomment_for_running_jobs()
         self.df = self.df[self.df.admincomment != {}]
@@ -43,14 +45,10 @@ class TooMuchCpuMemPerGpu(Alert):
             self.df = self.filter_by_nodelist(self.df)
         self.df.rename(columns={"user":"User"}, inplace=True)
         if not self.df.empty:
-            self.df["memory-tuple"] = self.df.apply(lambda row:
-                                           cpu_memory_usage(row["admincomment"],
-                                                            row["jobid"],
-                                                            row["cluster"],
-                                                            verbose=self.verbose),
-                                                            axis="columns")
+            tables = MetricsTables(self.df["admincomment"])
             cols = ["CPU-Mem-Used", "mem-alloc", "error_code"]
-            self.df[cols] = pd.DataFrame(self.df["memory-tuple"].tolist(), index=self.df.index)
+            memory = cpu_memory_usage_batch(tables, self.df.index)
+            self.df[cols] = memory.set_axis(cols, axis="columns")
             self.df = self.df[self.df["error_code"] == 0]
             self.df["CPU-Mem-per-GPU"] = self.df["mem-alloc"] / self.df.gpus
             self.df = self.df[self.df["CPU-Mem-per-GPU"] > self.cpu_mem_per_gpu_limit]
@@ -73,7 +71,7 @@ class TooMuchCpuMemPerGpu(Alert):
             self.df = self.df[cols]
             # only include users with gpu-hours > gpu_hours_threshold
             self.df["gpu-hours"] = self.df["gpus"] * self.df["elapsed-hours"]
-            self.gp = self.df.groupby("User").agg({"gpu-hours":"sum"}).reset_index()
+            self.gp = self.df.groupby("User", observed=True).agg({"gpu-hours":"sum"}).reset_index()
             self.gp = self.gp[self.gp["gpu-hours"] > self.gpu_hours_threshold]
             self.df = self.df[self.df.User.isin(self.gp.User)]
             self.df.drop(columns=["gpu-hours"], inplace=True)
@@ -14,12 +14,12 @@ class UsageBySlurmAccount(Alert):
             self.report_title = "Usage by Slurm Account"
 
     def _filter_and_add_new_fields(self):
-        self.df = self.df[self.df["elapsedraw"] > 0].copy()
+        self.df = self.filtered(self.df[self.df["elapsedraw"] > 0])
         # dataframe 1 of 2 where the results are summed over users
         d = {"user":lambda series: series.unique().size,
              "cpu-hours":"sum",
              "gpu-hours":"sum"}
-        self.gp = self.df.groupby(["cluster", "partition", "account"]).agg(d)
+        self.gp = self.df.groupby(["cluster", "partition", "account"], observed=True).agg(d)
         self.gp = self.gp.reset_index()
         self.gp = self.gp.rename(columns={"user":"users"})
         self.gp = self.gp.sort_values(by=["cluster", "partition", "cpu-hours"],
@@ -42,7 +42,7 @@ class UsageBySlurmAccount(Alert):
         d = {"cpu-hours":"sum",
              "gpu-hours":"sum"}
         cols = ["cluster", "partition", "account"]
-        self.by_user = self.df.groupby(cols + ["user"]).agg(d)
+        self.by_user = self.df.groupby(cols + ["user"], observed=True).agg(d)
         self.by_user = self.by_user.reset_index()
         self.by_user = self.by_user.sort_values(by=cols + ["cpu-hours"],
                                                 ascending=[True, True, True, False])
@@ -20,7 +20,7 @@ class UsageOverview(Alert):
             d = {"user":lambda series: series.unique().size,
                  "cpu-hours":"sum",
                  "gpu-hours":"sum"}
-            gp = self.df.groupby(fields).agg(d)
+            gp = self.df.groupby(fields, observed=True).agg(d)
             gp = gp.rename(columns={"user":"users"})
             gp = gp.reset_index().sort_values(by=["cluster", "cpu-hours"],
                                               ascending=[True, False])
@@ -42,7 +42,7 @@ class UsageOverview(Alert):
                                                  if row["cluster"] == cluster
                                                  else row[field], axis="columns")
             return gp
-        self.df = self.df[self.df["elapsedraw"] > 0].copy()
+        self.df = self.filtered(self.df[self.df["elapsedraw"] > 0])
         if self.df.empty:
             self.by_cluster = pd.DataFrame({"Cluster":[],
                                             "Users":[],
@@ -2,7 +2,8 @@ import pandas as pd
 from ..base import Alert
 from ..utils import add_dividers
 from ..utils import MINUTES_PER_HOUR as mph
-from ..efficiency import cpu_nodes_with_zero_util
+from ..metrics_tables import MetricsTables
+from ..metrics_tables import cpu_nodes_with_zero_util_batch
 from ..greeting import GreetingFactory
 from ..email_translator import EmailTranslator
 
@@ -23,13 +24,14 @@ class ZeroCPU(Alert):
             self.cpu_hours_threshold = None
 
     def _filter_and_add_new_fields(self):
-        self.df = self.df[(self.df.cluster == self.cluster) &
-                          (~self.df.qos.isin(self.excluded_qos)) &
-                          (~self.df.partition.isin(self.excluded_partitions)) &
-                          (~self.df.user.isin(self.excluded_users)) &
-                          (self.df["elapsed-hours"] >= self.min_run_time / mph)].copy()
+        self.df = self.filtered(self.df[(self.df.cluster == self.cluster) &
+                                        (~self.df.qos.isin(self.excluded_qos)) &
+                                        (~self.df.partition.isin(self.excluded_partitions)) &
+                                        (~self.df.user.isin(self.excluded_users)) &
+                                        (self.df["elapsed-hours"] >= self.min_run_time / mph)])
         if "*" not in self.partitions:
             self.df = self.df[self.df.partition.isin(self.partitions)]
+        self.df = self.decode_admincomment(self.df)
         if not self.df.empty and self.include_running_jobs:
             self.df.admincomment = self.get_admincomment_for_running_jobs()
         self.df = self.df[self.df.admincomment != {}]
@@ -38,14 +40,10 @@ class ZeroCPU(Alert):
         self.df.rename(columns={"user":"User"}, inplace=True)
         # add new fields
         if not self.df.empty:
-            self.df["nodes-tuple"] = self.df.apply(lambda row:
-                                     cpu_nodes_with_zero_util(row["admincomment"],
-                                                              row["jobid"],
-                                                              row["cluster"],
-                                                              verbose=self.verbose),
-                                                              axis="columns")
+            tables = MetricsTables(self.df["admincomment"])
             cols = ["nodes-unused", "error_code"]
-            self.df[cols] = pd.DataFrame(self.df["nodes-tuple"].tolist(), index=self.df.index)
+            zero = cpu_nodes_with_zero_util_batch(tables, self.df.index)
+            self.df[cols] = zero.set_axis(cols, axis="columns")
             self.df = self.df[(self.df["error_code"] == 0) & (self.df["nodes-unused"] > 0)]
             def is_interactive(jobname):
                 if jobname.startswith("sys/dashboard") or jobname.startswith("interactive"):
@@ -57,7 +55,7 @@ class ZeroCPU(Alert):
                 # remove users within insufficient cpu-hours at 0%
                 self.df["cpu-hours-at-0%"] = (self.df.cores / self.df.nodes) * \
                                              self.df["nodes-unused"] * self.df["elapsed-hours"]
-                total_hrs = self.df.groupby("User").agg({"cpu-hours-at-0%":"sum"}).reset_index()
+                total_hrs = self.df.groupby("User", observed=True).agg({"cpu-hours-at-0%":"sum"}).reset_index()
                 total_hrs = total_hrs[total_hrs["cpu-hours-at-0%"] >= self.cpu_hours_threshold]
                 self.df = self.df[self.df.User.isin(total_hrs.User)]
                 del total_hrs
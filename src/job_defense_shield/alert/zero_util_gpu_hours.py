@@ -2,7 +2,8 @@ import pandas as pd
 from ..base import Alert
 from ..utils import add_dividers
 from ..utils import MINUTES_PER_HOUR as mph
-from ..efficiency import num_gpus_with_zero_util
+from ..metrics_tables import MetricsTables
+from ..metrics_tables import num_gpus_with_zero_util_batch
 from ..greeting import GreetingFactory
 from ..email_translator import EmailTranslator
 
@@ -23,14 +24,15 @@ class ZeroUtilGPUHours(Alert):
             self.max_num_jobid_admin = 4
 
     def _filter_and_add_new_fields(self):
-        self.df = self.df[(self.df.cluster == self.cluster) &
-                          (self.df.gpus > 0) &
-                          (~self.df.qos.isin(self.excluded_qos)) &
-                          (~self.df.partition.isin(self.excluded_partitions)) &
-                          (~self.df.user.isin(self.excluded_users)) &
-                          (self.df["elapsed-hours"] >= self.min_run_time / mph)].copy()
+        self.df = self.filtered(self.df[(self.df.cluster == self.cluster) &
+                                        (self.df.gpus > 0) &
+                                        (~self.df.qos.isin(self.excluded_qos)) &
+                                        (~self.df.partition.isin(self.excluded_partitions)) &
+                                        (~self.df.user.isin(self.excluded_users)) &
+                                        (self.df["elapsed-hours"] >= self.min_run_time / mph)])
         if "*" not in self.partitions:
             self.df = self.df[self.df.partition.isin(self.partitions)]
+        self.df = self.decode_admincomment(self.df)
         if not self.df.empty and self.include_running_jobs:
             self.df.admincomment = self.get_admincomment_for_running_jobs()
         self.df = self.df[self.df.admincomment != {}]
@@ -40,14 +42,10 @@ class ZeroUtilGPUHours(Alert):
         self.admin = pd.DataFrame()
         # add new fields
         if not self.df.empty:
-            self.df["zero-tuple"] = self.df.apply(lambda row:
-                                    num_gpus_with_zero_util(row["admincomment"],
-                                                            row["jobid"],
-                                                            row["cluster"],
-                                                            verbose=self.verbose),
-                                                            axis="columns")
+            tables = MetricsTables(self.df["admincomment"])
             cols = ["GPUs-Unused", "error_code"]
-            self.df[cols] = pd.DataFrame(self.df["zero-tuple"].tolist(), index=self.df.index)
+            zero = num_gpus_with_zero_util_batch(tables, self.df.index)
+            self.df[cols] = zero.set_axis(cols, axis="columns")
             self.df = self.df[(self.df["error_code"] == 0) & (self.df["GPUs-Unused"] > 0)]
             self.df["GPU-Hours-At-0%"] = self.df["GPUs-Unused"] * self.df["elapsed-hours"]
             self.df["GPU-Unused-Util"] = "0%"
@@ -68,7 +66,7 @@ class ZeroUtilGPUHours(Alert):
                 ellipsis = "+" if len(series) > self.max_num_jobid_admin else ""
                 return ",".join(series[:self.max_num_jobid_admin]) + ellipsis
             # for each user sum the number of GPU-hours with zero GPU utilization
-            self.gp = self.df.groupby("User").agg({"GPU-Hours-At-0%":"sum",
+            self.gp = self.df.groupby("User", observed=True).agg({"GPU-Hours-At-0%":"sum",
                                                    "User":"size",
                                                    "JobID":jobid_list})
             self.gp = self.gp.rename(columns={"User":"Jobs"})
@@ -1,15 +1,25 @@
 import os
-import sys
 from time import time
 from datetime import datetime
+from typing import Optional
+from typing import Tuple
 from abc import abstractmethod
 import pandas as pd
 
 from .utils import send_email
+from .utils import copy_on_write_enabled
+from .utils import add_to_sys_path
 from .utils import SECONDS_PER_HOUR as sph
 from .utils import HOURS_PER_DAY as hpd
-from .efficiency import get_nodelist
+from .metrics_tables import MetricsTables
+from .metrics_tables import get_nodelist_batch
+from .prom_client import fetch_concurrently
+from .prom_client import PrometheusBatchClient
+from .prom_client import LiveStatsCache
+from .prom_client import window_bucket
 from .ldap_lookups import ldap_lookup_mail
+from .instrument import stage
+from .violation_store import ViolationStore
 
 
 class Alert:
@@ -17,7 +27,12 @@ class Alert:
     """Base class for all alerts. The named parameters in props will
        overwrite the default values of attributes. For example, if
        excluded_users is defined in the alert in config.yaml then it
-       will take on those values (if not then it will be an empty list)."""
+       will take on those values (if not then it will be an empty list).
+       If job_index is given and was built from df then the alert starts
+       from the jobs of its cluster and partitions instead of the entire
+       dataframe (any other df is used as is). If
+       violation_store_path is given then the violation logs are kept in
+       a ViolationStore instead of one CSV file per user."""
 
     def __init__(self,
                  df: pd.DataFrame,
@@ -39,6 +54,9 @@ class Alert:
         self.min_run_time = 0
         self.include_running_jobs = False
         self.show_all_users = False
+        self.copy_on_write = copy_on_write_enabled()
+        self.violation_store_path = None
+        self.violation_store = None
         # next line needed for send_emails_to_users
         self.warnings_to_admin = False
         for key in props:
@@ -46,8 +64,11 @@ class Alert:
         if hasattr(self, "partitions") and isinstance(self.partitions, str):
             self.partitions = [self.partitions]
         self._add_required_fields()
+        job_index = getattr(self, "job_index", None)
+        if job_index is not None and job_index.df is df and hasattr(self, "cluster"):
+            self.df = job_index.select(self.cluster, getattr(self, "partitions", None))
         self._filter_and_add_new_fields()
-        if self.vbase and not os.path.exists(self.vbase):
+        if self.vbase and not self.violation_store_path and not os.path.exists(self.vbase):
             os.mkdir(self.vbase)
 
     @abstractmethod
@@ -87,22 +108,24 @@ class Alert:
                 if self.email_method == "simple":
                     user_email_address = f"{user}{self.email_domain}"
                 elif self.email_method == "ldap":
-                    user_email_address = ldap_lookup_mail(user, self.ldap)
+                    with stage("ldap"):
+                        user_email_address = ldap_lookup_mail(user, self.ldap)
                     if user_email_address == "":
                         email_not_found.append(user)
                 if user in self.external_emails:
                     user_email_address = self.external_emails[user]
                 if user_email_address:
-                    send_email(email,
-                               user_email_address,
-                               subject=self.email_subject,
-                               sender=self.sender,
-                               reply_to=self.reply_to,
-                               smtp_server=self.smtp_server,
-                               smtp_user=self.smtp_user,
-                               smtp_password=self.smtp_password,
-                               smtp_port=self.smtp_port,
-                               verbose=self.verbose)
+                    with stage("smtp"):
+                        send_email(email,
+                                   user_email_address,
+                                   subject=self.email_subject,
+                                   sender=self.sender,
+                                   reply_to=self.reply_to,
+                                   smtp_server=self.smtp_server,
+                                   smtp_user=self.smtp_user,
+                                   smtp_password=self.smtp_password,
+                                   smtp_port=self.smtp_port,
+                                   verbose=self.verbose)
                     print(email)
                     if usr is not None:
                         vfile = f"{self.vpath}/{self.violation}/{user}.csv"
@@ -115,16 +138,17 @@ class Alert:
             for user, email, usr in self.emails:
                 for admin_email in self.admin_emails:
                     if usr is not None or (usr is None and self.warnings_to_admin):
-                        send_email(email,
-                                   admin_email,
-                                   subject=self.email_subject,
-                                   sender=self.sender,
-                                   reply_to=self.reply_to,
-                                   smtp_server=self.smtp_server,
-                                   smtp_user=self.smtp_user,
-                                   smtp_password=self.smtp_password,
-                                   smtp_port=self.smtp_port,
-                                   verbose=self.verbose)
+                        with stage("smtp"):
+                            send_email(email,
+                                       admin_email,
+                                       subject=self.email_subject,
+                                       sender=self.sender,
+                                       reply_to=self.reply_to,
+                                       smtp_server=self.smtp_server,
+                                       smtp_user=self.smtp_user,
+                                       smtp_password=self.smtp_password,
+                                       smtp_port=self.smtp_port,
+                                       verbose=self.verbose)
                 if self.no_emails_to_users:
                     print(email)
 
@@ -161,25 +185,122 @@ class Alert:
 
     def get_admincomment_for_running_jobs(self) -> pd.Series:
         """Query the Prometheus server for the admincomment of
-        jobs in a RUNNING state."""
-        sys.path.append(self.jobstats_module_path)
-        sys.path.append(self.jobstats_config_path)
-        from jobstats import Jobstats
+        jobs in a RUNNING state. The queries are made concurrently
+        (see prometheus_workers and prometheus_timeout) or in batches
+        per cluster (see prometheus_batch). The results are shared
+        by the alerts through live_stats_cache so each running job is
+        queried at most once per run. A job whose query fails or
+        times out is given an empty admincomment so that it is
+        removed by the alert."""
+        add_to_sys_path(self.jobstats_module_path, self.jobstats_config_path)
         from config import PROM_SERVER
-        num_jobs = len(self.df[self.df.state == "RUNNING"])
+        running = self.df[self.df.state == "RUNNING"]
+        num_jobs = len(running)
         print(f"INFO: Querying Prometheus server for data on {num_jobs} running jobs ... ",
               end="",
               flush=True)
         start = time()
-        adminc = self.df.apply(lambda row:
-                               eval(Jobstats(jobid=row["jobid"],
-                                             cluster=row["cluster"],
-                                             prom_server=PROM_SERVER).report_job_json(False))
-                               if row["state"] == "RUNNING"
-                               else row["admincomment"], axis="columns")
+        # the window of a key is None for the entire run time of the job (Jobstats)
+        # or the window of the batch query that returned the statistics
+        batch = getattr(self, "prometheus_batch", False)
+        if batch:
+            windows = [window_bucket(int(elapsed)) for elapsed in running.elapsedraw]
+        else:
+            windows = [None] * num_jobs
+        keys = {label: (str(cluster), str(jobid), window)
+                for label, cluster, jobid, window in zip(running.index,
+                                                         running.cluster,
+                                                         running.jobid,
+                                                         windows)}
+        def fetch_missing(missing_keys):
+            missing_keys = set(missing_keys)
+            missing = running[[keys[label] in missing_keys for label in running.index]]
+            if batch:
+                results, errors = self.get_running_stats_batch(missing, PROM_SERVER)
+            else:
+                from jobstats import Jobstats
+                def fetch(label):
+                    stats = Jobstats(jobid=missing.at[label, "jobid"],
+                                     cluster=missing.at[label, "cluster"],
+                                     prom_server=PROM_SERVER)
+                    return eval(stats.report_job_json(False))
+                results, errors = fetch_concurrently(missing.index,
+                                                     fetch,
+                                                     workers=getattr(self, "prometheus_workers", 8),
+                                                     timeout=getattr(self, "prometheus_timeout", None))
+            return ({keys[label]: ss for label, ss in results.items()},
+                    {keys[label]: e for label, e in errors.items()})
+        cache = getattr(self, "live_stats_cache", None)
+        if cache is None:
+            cache = LiveStatsCache()
+        with stage("prometheus"):
+            results, errors = cache.get_many(keys.values(), fetch_missing)
+        results = {label: results[key] for label, key in keys.items() if key in results}
+        errors = {label: errors[key] for label, key in keys.items() if key in errors}
+        adminc = self.df.admincomment.astype(object)
+        for label in running.index:
+            adminc.at[label] = results.get(label, {})
         print(f"done ({round(time() - start)} seconds).", flush=True)
+        if errors:
+            jobids = ",".join(sorted(str(running.at[label, "jobid"]) for label in errors))
+            print(f"WARNING: Prometheus query failed for {len(errors)} running jobs ({jobids})")
+            if self.verbose:
+                for label, e in errors.items():
+                    print(f"  {running.at[label, 'jobid']}: {e}")
         return adminc
 
+    def get_running_stats_batch(self,
+                                running: pd.DataFrame,
+                                prom_server: str) -> Tuple[dict, dict]:
+        """Retrieve the summary statistics of the running jobs with a fixed
+           number of queries per cluster and window (see PrometheusBatchClient).
+           The jobs are grouped by window_bucket of their elapsed time so a
+           short job is not queried over the run time of the oldest job. The
+           total_time of each job is its own elapsed time. The jobs are
+           matched on jobidraw since the exporters label an array job (e.g.,
+           123_4) by its raw jobid. Return dictionaries of the results and
+           errors keyed by index label."""
+        client = getattr(self, "prometheus_client", None)
+        if client is None:
+            client = PrometheusBatchClient(prom_server,
+                                           timeout=getattr(self, "prometheus_timeout", None))
+        num_queries = client.num_queries
+        results, errors = {}, {}
+        windows = running.elapsedraw.apply(window_bucket)
+        for (cluster, window), jobs in running.groupby([running.cluster, windows],
+                                                       observed=True):
+            jobids = jobs.jobidraw.astype(str)
+            elapsed = dict(zip(jobids, jobs.elapsedraw))
+            try:
+                stats = client.get_job_stats(cluster, jobids, window, elapsed=elapsed)
+            except (OSError, RuntimeError, ValueError, KeyError) as e:
+                errors.update({label: e for label in jobs.index})
+                continue
+            for label, jobid in zip(jobs.index, jobids):
+                if jobid in stats:
+                    results[label] = stats[jobid]
+                else:
+                    errors[label] = LookupError("no data")
+        if self.verbose:
+            print(f"({client.num_queries - num_queries} queries) ", end="", flush=True)
+        return results, errors
+
+    def filtered(self, jb: pd.DataFrame) -> pd.DataFrame:
+        """Return the filtered dataframe jb for the alert to modify. With
+           copy-on-write a column is only copied when the alert modifies it
+           so no copy is made here. Otherwise jb is copied."""
+        return jb if self.copy_on_write else jb.copy()
+
+    def decode_admincomment(self, jb: pd.DataFrame) -> pd.DataFrame:
+        """Return jb with the summary statistics decoded. This should be
+           called after the cheap filters of the alert so that only the
+           remaining jobs are decoded (see StatsDecoder). If there is no
+           decoder then the admincomment is assumed to be decoded already."""
+        decoder = getattr(self, "stats_decoder", None)
+        if decoder is None or jb.empty:
+            return jb
+        return jb.assign(admincomment=decoder.decode(jb))
+
     def filter_by_nodelist(self, jb: pd.DataFrame) -> pd.DataFrame:
         """If the alert contains a nodelist then filter out the jobs
            that ran on nodes that are not in the nodelist. This function
@@ -190,36 +311,47 @@ class Alert:
            nodelist."""
         if jb.empty:
             return jb
+        jb = self.decode_admincomment(jb)
         num_jobs = len(jb)
-        jb["node-tuple"] = jb.apply(lambda row:
-                                    get_nodelist(row["admincomment"],
-                                                 row["jobid"],
-                                                 row["cluster"]),
-                                                 axis="columns")
         cols = ["job_nodes", "error_code"]
-        jb[cols] = pd.DataFrame(jb["node-tuple"].tolist(),
-                                index=jb.index)
+        nodelists = get_nodelist_batch(MetricsTables(jb["admincomment"]), jb.index)
+        jb[cols] = nodelists.set_axis(cols, axis="columns")
         jb = jb[jb["error_code"] == 0]
         self.nodelist = set(self.nodelist)
         jb["num_other_nodes"] = jb["job_nodes"].apply(lambda jns:
                                                       len(jns - self.nodelist))
         jb = jb[jb["num_other_nodes"] == 0]
-        cols = ["node-tuple", "job_nodes", "error_code", "num_other_nodes"]
+        cols = ["job_nodes", "error_code", "num_other_nodes"]
         jb.drop(columns=cols, inplace=True)
         num_rm = num_jobs - len(jb)
         pct = f"{round(100 * num_rm / num_jobs)}%" if num_jobs else "--%"
         print(f"INFO: Applied nodelist (removed {num_rm} or {pct} of the {num_jobs} jobs)")
         return jb
 
+    def get_violation_store(self) -> Optional[ViolationStore]:
+        """Return the violation store (opened on first use) or None if the
+           violation logs are CSV files."""
+        if not self.violation_store_path:
+            return None
+        if self.violation_store is None:
+            self.violation_store = ViolationStore(self.violation_store_path)
+        return self.violation_store
+
     def has_sufficient_time_passed_since_last_email(self, vfile: str) -> bool:
         """Return boolean specifying whether sufficient time has passed."""
         last_sent_email_date = datetime(1970, 1, 1)
-        if os.path.isfile(vfile):
+        alert_partitions = ",".join(sorted(set(self.partitions)))
+        store = self.get_violation_store()
+        if store is not None:
+            user = os.path.splitext(os.path.basename(vfile))[0]
+            _, last = store.emails_sent(self.violation, user, self.cluster, alert_partitions)
+            if last is not None:
+                last_sent_email_date = datetime.fromtimestamp(last)
+        elif os.path.isfile(vfile):
             vhist = pd.read_csv(vfile,
                                 parse_dates=["Email-Sent"],
                                 date_format="mixed",
                                 dayfirst=False)
-            alert_partitions = ",".join(sorted(set(self.partitions)))
             vhist = vhist[(vhist["Cluster"] == self.cluster) &
                           (vhist["Alert-Partitions"] == alert_partitions)]
             if not vhist.empty:
@@ -231,6 +363,18 @@ class Alert:
     def get_emails_sent_count(self, user: str, violation: str) -> str:
         """Return the number of emails sent to a user for a given violation in the
            last N days."""
+        alert_partitions = ",".join(sorted(set(self.partitions)))
+        store = self.get_violation_store()
+        if store is not None:
+            num_emails_sent, last = store.emails_sent(violation,
+                                                      user,
+                                                      self.cluster,
+                                                      alert_partitions)
+            if num_emails_sent:
+                dt = datetime.now() - datetime.fromtimestamp(last)
+                days_ago_last_email_sent = round(dt.total_seconds() / hpd / sph)
+                return f"{num_emails_sent} ({days_ago_last_email_sent})"
+            return "0 (-)"
         root_violations = os.path.join(self.vpath, violation)
         if not os.path.exists(root_violations):
             print(f"Warning: {root_violations} not found in get_emails_sent_count()")
@@ -240,7 +384,6 @@ class Alert:
                                 parse_dates=["Email-Sent"],
                                 date_format="mixed",
                                 dayfirst=False)
-            alert_partitions = ",".join(sorted(set(self.partitions)))
             vhist = vhist[(vhist["Cluster"] == self.cluster) &
                           (vhist["Alert-Partitions"] == alert_partitions)]
             if not vhist.empty:
@@ -271,11 +414,14 @@ class Alert:
             return pair.replace("(-)", "   ")
         return counts.apply(fix_spacing)
 
-    @staticmethod
-    def update_violation_log(usr: pd.DataFrame, vfile: str) -> None:
-        """Append the new violations to file."""
+    def update_violation_log(self, usr: pd.DataFrame, vfile: str) -> None:
+        """Append the new violations to file (or to the violation store)."""
         usr["Email-Sent"] = datetime.now().strftime("%m/%d/%Y %H:%M:%S")
-        if os.path.isfile(vfile):
+        store = self.get_violation_store()
+        if store is not None:
+            user = os.path.splitext(os.path.basename(vfile))[0]
+            store.add(self.violation, user, usr)
+        elif os.path.isfile(vfile):
             curr = pd.read_csv(vfile)
             curr = pd.concat([curr, usr]).drop_duplicates()
             curr.to_csv(vfile, index=False, header=True, encoding="utf-8")
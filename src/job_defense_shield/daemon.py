@@ -0,0 +1,220 @@
+"""Run the cancellation of GPU jobs with zero utilization as a daemon."""
+
+import os
+import sys
+import pickle
+import signal
+import threading
+from time import time
+from datetime import datetime
+from typing import Callable
+from typing import Optional
+import pandas as pd
+
+from .utils import SACCT_FIELDS
+from .utils import FIELD_RENAMINGS
+from .utils import SECONDS_PER_MINUTE as spm
+from .utils import add_new_and_derived_fields
+from .utils import add_to_sys_path
+from .raw_job_data import SlurmRunningJobs
+from .cleaner import SacctCleaner
+from .cleaner import VectorizedSacctCleaner
+from .prom_client import LiveStatsCache
+from .prom_client import PrometheusBatchClient
+from .job_index import JobFrameIndex
+from .alert.cancel_zero_gpu_jobs import CancelZeroGpuJobs
+
+
+class CancelZeroGpuDaemon:
+
+    """Run the cancel-zero-gpu-jobs alerts every sampling_period_minutes
+       in a single long-running process instead of from cron. The import
+       of the modules and the configuration are paid for once. The jobid
+       caches of the fixed window, the sliding-window stores and the
+       Prometheus client are kept in memory between ticks. Only the
+       running jobs are requested from Slurm on each tick.
+
+       The jobid caches are written to disk every checkpoint_ticks ticks
+       and on shutdown (SIGTERM or SIGINT). The configuration file is read
+       again on SIGHUP. If the new configuration is invalid then the
+       previous one is kept. The Jobstats module and config.py are also
+       imported again after a reload so a change to PROM_SERVER is used.
+
+       The Prometheus client is only kept between ticks with
+       prometheus-batch. Otherwise each tick creates one Jobstats object
+       per job since Jobstats does not accept a shared HTTP session.
+
+       The value of load_config is a function that returns the same tuple
+       as read_config_file. The value of get_running_jobs is a function
+       that takes cfg and returns the cleaned dataframe of the running
+       jobs (see running_jobs_from_sacct)."""
+
+    def __init__(self,
+                 load_config: Callable[[], tuple],
+                 email: bool=False,
+                 get_running_jobs: Optional[Callable[[dict], pd.DataFrame]]=None) -> None:
+        self.load_config = load_config
+        self.email = email
+        self.get_running_jobs = get_running_jobs or running_jobs_from_sacct
+        self.jobid_cache_memo = {}
+        self.sliding_stores = {}
+        self.prometheus_client = None
+        self.num_ticks = 0
+        self.wakeup = threading.Event()
+        self.reload_requested = False
+        self.stop_requested = False
+        self.cfg, self.sys_cfg, _ = self.load_config()
+        self.checkpoint_ticks = self.cfg["daemon-checkpoint-ticks"]
+
+    def alerts(self) -> list:
+        return [alert for alert in self.cfg.keys()
+                if "cancel-zero-gpu-jobs" in alert and
+                self.cfg[alert].get("enabled", True)]
+
+    def interval_seconds(self) -> float:
+        """The daemon wakes up every sampling_period_minutes (the smallest
+           value if there are several alerts)."""
+        minutes = [self.cfg[alert]["sampling_period_minutes"] for alert in self.alerts()]
+        return min(minutes) * spm if minutes else 15 * spm
+
+    def reload(self) -> None:
+        """Read the configuration file again. Keep the previous one if the
+           new one cannot be read (read_config_file calls sys.exit)."""
+        self.reload_requested = False
+        try:
+            cfg, sys_cfg, _ = self.load_config()
+        except (SystemExit, Exception) as e:
+            print(f"ERROR: Keeping the previous configuration ({e})")
+            return
+        self.cfg, self.sys_cfg = cfg, sys_cfg
+        self.checkpoint_ticks = self.cfg["daemon-checkpoint-ticks"]
+        self.prometheus_client = None
+        # import config.py (PROM_SERVER) and the Jobstats module again
+        for module in ("config", "jobstats"):
+            sys.modules.pop(module, None)
+        print("INFO: Reloaded the configuration file")
+
+    def client(self) -> Optional[PrometheusBatchClient]:
+        """Return the Prometheus client that is shared by the ticks."""
+        if not self.sys_cfg.get("prometheus_batch"):
+            return None
+        if self.prometheus_client is None:
+            add_to_sys_path(self.sys_cfg["jobstats_config_path"])
+            from config import PROM_SERVER
+            self.prometheus_client = PrometheusBatchClient(PROM_SERVER,
+                                                           timeout=self.sys_cfg["prometheus_timeout"])
+        return self.prometheus_client
+
+    def tick(self) -> None:
+        """Run the cancel-zero-gpu-jobs alerts once on the running jobs."""
+        alerts = self.alerts()
+        df = self.get_running_jobs(self.cfg)
+        if df.empty:
+            print("INFO: No running jobs")
+            return
+        run_cfg = dict(self.sys_cfg)
+        run_cfg["live_stats_cache"] = LiveStatsCache()
+        run_cfg["job_index"] = JobFrameIndex(df)
+        run_cfg["jobid_cache_memo"] = self.jobid_cache_memo
+        run_cfg["sliding_stores"] = self.sliding_stores
+        client = self.client()
+        if client is not None:
+            run_cfg["prometheus_client"] = client
+        for alert in alerts:
+            params = dict(self.cfg[alert])
+            params.update(run_cfg)
+            params.update({"num_cancel_alerts":len(alerts)})
+            cancel_gpu = CancelZeroGpuJobs(df,
+                                           days_between_emails=1,
+                                           violation="cancel_zero_gpu_jobs",
+                                           vpath=self.cfg["violation-logs-path"],
+                                           **params)
+            if self.email:
+                cancel_gpu.create_emails(self.cfg["greeting-method"])
+                cancel_gpu.send_emails_to_users()
+                cancel_gpu.cancel_jobs()
+
+    def checkpoint(self) -> None:
+        """Write the jobid caches of the fixed window to disk. The sliding
+           window stores are SQLite databases so they are already on disk."""
+        for path, jobids in self.jobid_cache_memo.items():
+            tmp = f"{path}.tmp"
+            with open(tmp, "wb") as fp:
+                pickle.dump(jobids, fp)
+            os.replace(tmp, path)
+
+    def close(self) -> None:
+        self.checkpoint()
+        for store in self.sliding_stores.values():
+            store.close()
+        self.sliding_stores = {}
+
+    def request_reload(self, signum, frame) -> None:
+        self.reload_requested = True
+        self.wakeup.set()
+
+    def request_stop(self, signum, frame) -> None:
+        self.stop_requested = True
+        self.wakeup.set()
+
+    def run(self, max_ticks: Optional[int]=None) -> None:
+        """Tick on a fixed cadence until a stop is requested (or max_ticks)."""
+        signal.signal(signal.SIGHUP, self.request_reload)
+        signal.signal(signal.SIGTERM, self.request_stop)
+        signal.signal(signal.SIGINT, self.request_stop)
+        print(f"INFO: Starting daemon (every {round(self.interval_seconds())} seconds)",
+              flush=True)
+        next_tick = time()
+        try:
+            while max_ticks is None or self.num_ticks < max_ticks:
+                if self.stop_requested:
+                    break
+                self.wakeup.clear()
+                if self.reload_requested:
+                    self.reload()
+                if time() >= next_tick:
+                    start = time()
+                    print(f"INFO: Tick at {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}",
+                          flush=True)
+                    try:
+                        self.tick()
+                    except Exception as e:
+                        print(f"ERROR: Tick failed ({e})", flush=True)
+                    self.num_ticks += 1
+                    if self.num_ticks % max(1, self.checkpoint_ticks) == 0:
+                        self.checkpoint()
+                    next_tick = start + self.interval_seconds()
+                    print(f"INFO: Tick done ({round(time() - start)} seconds)", flush=True)
+                if max_ticks is not None and self.num_ticks >= max_ticks:
+                    break
+                # sleep until the next tick or until a signal arrives
+                self.wakeup.wait(max(0, next_tick - time()))
+        finally:
+            self.close()
+            print("INFO: Stopped daemon", flush=True)
+
+
+def running_jobs_from_sacct(cfg: dict,
+                            clusters: str="all",
+                            partitions: str="") -> pd.DataFrame:
+    """Return the cleaned dataframe of the jobs that are running now."""
+    fields = list(SACCT_FIELDS)
+    fields.insert(-1, "admincomment")
+    if cfg["prometheus-batch"]:
+        # the batch Prometheus queries are keyed by jobidraw
+        fields.insert(1, "jobidraw")
+    raw = SlurmRunningJobs(fields,
+                           clusters,
+                           partitions,
+                           parser=cfg["sacct-parser"],
+                           allow_empty=True).get_job_data()
+    if raw.empty:
+        return pd.DataFrame()
+    if cfg["sacct-cleaner"] == "vectorized":
+        Cleaner = VectorizedSacctCleaner
+    else:
+        Cleaner = SacctCleaner
+    df = Cleaner(raw, FIELD_RENAMINGS, cfg["partition-renamings"]).clean()
+    df = df[(df.state == "RUNNING") & (df.elapsedraw > 0)]
+    df = add_new_and_derived_fields(df)
+    return df.reset_index(drop=True)
@@ -3,11 +3,14 @@
 import json
 import gzip
 import base64
+from typing import List
 from typing import Tuple
 from typing import Set
 from typing import Optional
 from typing import Union
 from functools import partial
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 import pandas as pd
 
 
@@ -18,6 +21,40 @@ def get_stats_dict(ss64: Optional[str]) -> dict:
     return json.loads(gzip.decompress(base64.b64decode(ss64[4:])))
 
 
+def get_stats_dicts_chunk(chunk: List[str]) -> List[dict]:
+    """Decode a list of summary statistics (run by the worker processes)."""
+    return [get_stats_dict(ss64) for ss64 in chunk]
+
+
+def get_stats_dicts(series: pd.Series,
+                    workers: int=1,
+                    min_jobs: int=20000) -> pd.Series:
+    """Return the decoded summary statistics of the admincomment column. The
+       work is split into chunks that are decoded by a pool of worker processes
+       when there are at least min_jobs jobs with summary statistics. Jobs
+       without summary statistics are handled by the main process. The serial
+       approach is used if the process pool cannot be used."""
+    encoded = [bool(ss64) and not pd.isna(ss64) and ss64 not in ("JS1:Short", "JS1:None")
+               for ss64 in series]
+    num_encoded = sum(encoded)
+    if workers <= 1 or num_encoded < max(min_jobs, 1):
+        return series.apply(get_stats_dict)
+    values = [ss64 for ss64, enc in zip(series, encoded) if enc]
+    size = -(-num_encoded // (4 * workers))
+    chunks = [values[i:i + size] for i in range(0, num_encoded, size)]
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            decoded = iter([ss for chunk in executor.map(get_stats_dicts_chunk, chunks)
+                               for ss in chunk])
+    except (OSError, BrokenProcessPool) as error:
+        print(f"WARNING: Decoding admincomment serially ({error})")
+        return series.apply(get_stats_dict)
+    return pd.Series([next(decoded) if enc else {} for enc in encoded],
+                     index=series.index,
+                     name=series.name,
+                     dtype=object)
+
+
 def cpu_efficiency(ss: dict,
                    elapsedraw: int,
                    jobid: str,
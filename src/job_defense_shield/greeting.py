@@ -3,6 +3,7 @@
 import pwd
 from abc import ABC, abstractmethod
 from .ldap_lookups import ldap_lookup_name
+from .instrument import stage
 
 
 class Greeting(ABC):
@@ -47,7 +48,8 @@ class GreetingLDAP(Greeting):
 
     def greeting(self, user: str) -> str:
         """Return the greeting or first line for user emails."""
-        return ldap_lookup_name(user, self.ldap)
+        with stage("ldap"):
+            return ldap_lookup_name(user, self.ldap)
 
 
 class GreetingCustom(Greeting):
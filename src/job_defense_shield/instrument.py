@@ -0,0 +1,158 @@
+"""Timing and memory instrumentation of the stages of a run (--profile)."""
+
+import os
+import sys
+import json
+import resource
+import functools
+from time import time
+from time import perf_counter
+from datetime import datetime
+from contextlib import contextmanager
+from typing import Callable
+from typing import Dict
+from typing import Iterator
+from typing import List
+from typing import Optional
+import pandas as pd
+
+
+def rss_mb() -> float:
+    """Return the current resident set size of the process in MB. The peak
+       value is returned if the current value is not available (non-Linux)."""
+    try:
+        with open("/proc/self/statm") as fp:
+            pages = int(fp.read().split()[1])
+        return pages * os.sysconf("SC_PAGE_SIZE") / 1024**2
+    except (OSError, ValueError, IndexError):
+        return peak_rss_mb()
+
+
+def peak_rss_mb() -> float:
+    """Return the peak resident set size of the process in MB."""
+    kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return kb / 1024**2 if sys.platform == "darwin" else kb / 1024
+
+
+class Profiler:
+
+    """Record the wall time and the memory usage of the stages of a run.
+       A stage is recorded each time the stage context manager (or a
+       function decorated with timed) exits. The stages can be nested (e.g.,
+       the decoding of the admincomment within the filter of an alert) and
+       each one is recorded under its own name. A snapshot records the
+       number of rows and the memory of a dataframe at a point of the run.
+
+       Nothing is recorded until enable is called so the instrumentation
+       costs almost nothing when --profile is not used."""
+
+    def __init__(self) -> None:
+        self.enabled = False
+        self.start = time()
+        self.stages: List[dict] = []
+        self.snapshots: List[dict] = []
+
+    def enable(self) -> None:
+        self.enabled = True
+        self.start = time()
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        if not self.enabled:
+            yield
+            return
+        rss_before = rss_mb()
+        start = perf_counter()
+        try:
+            yield
+        finally:
+            seconds = perf_counter() - start
+            rss_after = rss_mb()
+            self.stages.append({"stage":name,
+                                "seconds":seconds,
+                                "rss_mb":rss_after,
+                                "rss_delta_mb":rss_after - rss_before,
+                                "peak_rss_mb":peak_rss_mb()})
+
+    def snapshot(self, name: str, df: pd.DataFrame) -> None:
+        """Record the number of rows and the memory of df (in MB)."""
+        if not self.enabled:
+            return
+        self.snapshots.append({"frame":name,
+                               "rows":len(df),
+                               "columns":len(df.columns),
+                               "memory_mb":df.memory_usage(deep=True).sum() / 1024**2,
+                               "rss_mb":rss_mb()})
+
+    def merge(self, stages: List[dict], snapshots: List[dict]) -> None:
+        """Add the records of a worker process (see AlertRunner)."""
+        self.stages.extend(stages)
+        self.snapshots.extend(snapshots)
+
+    def totals(self) -> pd.DataFrame:
+        """Return the number of calls, the total and maximum time, and the
+           largest memory values of each stage in order of first appearance."""
+        if not self.stages:
+            return pd.DataFrame(columns=["calls", "seconds", "max-seconds",
+                                         "rss-delta-mb", "peak-rss-mb"])
+        df = pd.DataFrame(self.stages)
+        gp = df.groupby("stage", sort=False).agg(calls=("seconds", "size"),
+                                                 seconds=("seconds", "sum"),
+                                                 max_seconds=("seconds", "max"),
+                                                 rss_delta_mb=("rss_delta_mb", "max"),
+                                                 peak_rss_mb=("peak_rss_mb", "max"))
+        gp.columns = [col.replace("_", "-") for col in gp.columns]
+        return gp
+
+    def summary(self) -> str:
+        """Return the tables of the stages and of the snapshots."""
+        gp = self.totals().round({"seconds":2, "max-seconds":2,
+                                  "rss-delta-mb":1, "peak-rss-mb":1})
+        s = "\nStages of the run\n"
+        s += gp.to_string() if not gp.empty else "no stages recorded"
+        if self.snapshots:
+            snaps = pd.DataFrame(self.snapshots).set_index("frame")
+            s += "\n\nDataframes\n"
+            s += snaps.round({"memory_mb":1, "rss_mb":1}).to_string()
+        s += f"\n\nWall time: {round(time() - self.start, 1)} seconds"
+        s += f"\nPeak RSS: {round(peak_rss_mb(), 1)} MB\n"
+        return s
+
+    def write_json(self, path: str, extra: Optional[Dict[str, str]]=None) -> None:
+        """Append the records of this run as one line of JSON to path so
+           that the runs can be compared over time."""
+        totals = self.totals()
+        record = {"started":datetime.fromtimestamp(self.start).isoformat(timespec="seconds"),
+                  "wall_seconds":time() - self.start,
+                  "peak_rss_mb":peak_rss_mb(),
+                  "stages":totals.to_dict(orient="index"),
+                  "snapshots":self.snapshots}
+        if extra:
+            record.update(extra)
+        with open(path, "a") as fp:
+            fp.write(json.dumps(record, default=float) + "\n")
+
+
+# the profiler of the run (enabled by --profile)
+PROFILER = Profiler()
+
+
+def stage(name: str):
+    """Context manager that records a stage with the profiler of the run."""
+    return PROFILER.stage(name)
+
+
+def snapshot(name: str, df: pd.DataFrame) -> None:
+    """Record a dataframe with the profiler of the run."""
+    PROFILER.snapshot(name, df)
+
+
+def timed(name: str) -> Callable:
+    """Decorator that records each call of the function as a stage."""
+    def decorator(func: Callable) -> Callable:
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with PROFILER.stage(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
@@ -2,6 +2,7 @@ import os
 import sys
 import argparse
 from datetime import datetime
+from functools import partial
 import pandas as pd
 
 from .utils import send_email
@@ -11,32 +12,36 @@ from .utils import display_alerts
 from .utils import read_config_file
 from .utils import add_new_and_derived_fields
 from .utils import apply_strict_start
-from .efficiency import get_stats_dict
+from .utils import optimize_dtypes
+from .utils import merge_external_summary_stats
+from .utils import enable_copy_on_write
+from .utils import SACCT_FIELDS
+from .utils import CATEGORICAL_FIELDS
+from .utils import FIELD_RENAMINGS
+from .efficiency import get_stats_dicts
 from .workday import WorkdayFactory
 from .raw_job_data import SlurmSacct
+from .raw_job_data import SlurmSacctSharded
+from .raw_job_data import SlurmRunningJobs
+from .job_history import JobHistoryStore
+from .stats_cache import StatsCache
+from .stats_decoder import StatsDecoder
+from .violation_store import ViolationStore
+from .prom_client import LiveStatsCache
+from .job_index import JobFrameIndex
+from .instrument import PROFILER
+from .instrument import stage
+from .instrument import snapshot
+from .instrument import timed
 from .cleaner import SacctCleaner
+from .cleaner import VectorizedSacctCleaner
+from .cleaner import clean_chunks
 from .db_handler import ShieldDBHandler
+from .daemon import CancelZeroGpuDaemon
+from .daemon import running_jobs_from_sacct
 
-from .alert.cancel_zero_gpu_jobs import CancelZeroGpuJobs
-from .alert.gpu_model_too_powerful import GpuModelTooPowerful
-from .alert.zero_util_gpu_hours import ZeroUtilGPUHours
-from .alert.excess_cpu_memory import ExcessCPUMemory
-from .alert.zero_cpu_utilization import ZeroCPU
-from .alert.most_gpus import MostGPUs
-from .alert.most_cores import MostCores
-from .alert.usage_overview import UsageOverview
-from .alert.usage_by_slurm_account import UsageBySlurmAccount
-from .alert.longest_queued import LongestQueuedJobs
-from .alert.jobs_overview import JobsOverview
-from .alert.excessive_time_limits import ExcessiveTimeLimitsCPU
-from .alert.excessive_time_limits import ExcessiveTimeLimitsGPU
-from .alert.serial_allocating_multiple_cores import SerialAllocatingMultipleCores
-from .alert.multinode_cpu_fragmentation import MultinodeCpuFragmentation
-from .alert.multinode_gpu_fragmentation import MultinodeGpuFragmentation
-from .alert.compute_efficiency import LowEfficiencyCPU
-from .alert.compute_efficiency import LowEfficiencyGPU
-from .alert.too_many_cores_per_gpu import TooManyCoresPerGpu
-from .alert.too_much_cpu_mem_per_gpu import TooMuchCpuMemPerGpu
+from .pipeline import ALERTS
+from .pipeline import AlertRunner
 
 
 def main():
@@ -108,7 +113,19 @@ def main():
                         help='Write CSV files of job data for debugging')
     parser.add_argument('-s', '--strict-start', action='store_true', default=False,
                         help='Only include usage during the time window and not before')
+    parser.add_argument('--rebuild-stats-cache', action='store_true', default=False,
+                        help='Remove all entries from the summary statistics cache')
+    parser.add_argument('--import-violation-logs', action='store_true', default=False,
+                        help='Import the CSV violation logs into the violation store and exit')
+    parser.add_argument('--daemon', action='store_true', default=False,
+                        help='Run --cancel-zero-gpu-jobs as a long-running process')
+    parser.add_argument('--profile', action='store_true', default=False,
+                        help='Show the time and memory of each stage of the run')
+    parser.add_argument('--profile-json', type=str, default=None, metavar='FILE',
+                        help='Append the time and memory of each stage to FILE (JSON lines)')
     args = parser.parse_args()
+    if args.profile or args.profile_json:
+        PROFILER.enable()
 
     head = "\nJob Defense Shield (1.2.6)\n"
     head += "github.com/PrincetonUniversity/job_defense_shield\n\n"
@@ -138,9 +155,22 @@ def main():
                                           head,
                                           args.no_emails_to_users,
                                           args.no_emails_to_admins)
+    if cfg["copy-on-write"]:
+        enable_copy_on_write()
 
-    greeting_method = cfg["greeting-method"]
     violation_logs_path = cfg["violation-logs-path"]
+    violation_store = None
+    if cfg["violation-store-path"]:
+        violation_store = ViolationStore(cfg["violation-store-path"])
+    if args.import_violation_logs:
+        if violation_store is None:
+            print("ERROR: --import-violation-logs requires violation-store-path in config.yaml.\n")
+            sys.exit()
+        num_rows, num_files = violation_store.import_csv_tree(violation_logs_path)
+        print(f"INFO: Imported {num_rows} new entries from {num_files} files in "
+              f"{violation_logs_path} into {violation_store.path}")
+        violation_store.close()
+        sys.exit()
     workday_method = cfg["workday-method"]
     holidays_file = cfg["holidays-file"] if "holidays-file" in cfg else None
     is_workday = WorkdayFactory(holidays_file).create_workday(workday_method).is_workday()
@@ -170,73 +200,87 @@ def main():
             show_history_of_emails_sent(violation_logs_path,
                                         "cancel_zero_gpu_jobs",
                                         "CANCEL JOBS WITH ZERO GPU UTILIZATION",
-                                        args.days)
+                                        args.days,
+                                        store=violation_store)
         if args.zero_util_gpu_hours:
             show_history_of_emails_sent(violation_logs_path,
                                         "zero_util_gpu_hours",
                                         "GPU-HOURS AT 0% GPU UTILIZATION",
-                                        args.days)
+                                        args.days,
+                                        store=violation_store)
         if args.zero_cpu_utilization:
             show_history_of_emails_sent(violation_logs_path,
                                         "zero_cpu_utilization",
                                         "ZERO CPU UTILIZATION OF A RUNNING JOB",
-                                        args.days)
+                                        args.days,
+                                        store=violation_store)
         if args.gpu_model_too_powerful:
             show_history_of_emails_sent(violation_logs_path,
                                         "gpu_model_too_powerful",
                                         "GPU MODEL TOO POWERFUL",
-                                        args.days)
+                                        args.days,
+                                        store=violation_store)
         if args.low_cpu_efficiency:
             show_history_of_emails_sent(violation_logs_path,
                                         "low_cpu_efficiency",
                                         "LOW CPU EFFICIENCY",
-                                        args.days)
+                                        args.days,
+                                        store=violation_store)
         if args.low_gpu_efficiency:
             show_history_of_emails_sent(violation_logs_path,
                                         "low_gpu_efficiency",
                                         "LOW GPU EFFICIENCY",
-                                        args.days)
+                                        args.days,
+                                        store=violation_store)
         if args.multinode_cpu_fragmentation:
             show_history_of_emails_sent(violation_logs_path,
                                         "multinode_cpu_fragmentation",
                                         "MULTINODE CPU FRAGMENTATION",
-                                        args.days)
+                                        args.days,
+                                        store=violation_store)
         if args.multinode_gpu_fragmentation:
             show_history_of_emails_sent(violation_logs_path,
                                         "multinode_gpu_fragmentation",
                                         "MULTINODE GPU FRAGMENTATION",
-                                        args.days)
+                                        args.days,
+                                        store=violation_store)
         if args.excess_cpu_memory:
             show_history_of_emails_sent(violation_logs_path,
                                         "excess_cpu_memory",
                                         "EXCESS CPU MEMORY",
-                                        args.days)
+                                        args.days,
+                                        store=violation_store)
         if args.serial_allocating_multiple:
             show_history_of_emails_sent(violation_logs_path,
                                         "serial_allocating_multiple",
                                         "SERIAL CODE ALLOCATING MULTIPLE CPU-CORES",
-                                        args.days)
+                                        args.days,
+                                        store=violation_store)
         if args.too_many_cores_per_gpu:
             show_history_of_emails_sent(violation_logs_path,
                                         "too_many_cores_per_gpu",
                                         "TOO MANY CPU-CORES PER GPU",
-                                        args.days)
+                                        args.days,
+                                        store=violation_store)
         if args.too_much_cpu_mem_per_gpu:
             show_history_of_emails_sent(violation_logs_path,
                                         "too_much_cpu_mem_per_gpu",
                                         "TOO MUCH CPU MEMORY PER GPU",
-                                        args.days)
+                                        args.days,
+                                        store=violation_store)
         if args.excessive_time_cpu:
             show_history_of_emails_sent(violation_logs_path,
                                         "excessive_time_limits_cpu",
                                         "EXCESSIVE TIME LIMITS (CPU)",
-                                        args.days)
+                                        args.days,
+                                        store=violation_store)
 
         if args.excessive_time_gpu:
             show_history_of_emails_sent(violation_logs_path,
                                         "excessive_time_limits_gpu",
                                         "EXCESSIVE TIME LIMITS (GPU)",
-                                        args.days)
+                                        args.days,
+                                        store=violation_store)
         if args.most_gpus or \
            args.most_cores or \
            args.usage_overview or \
@@ -248,6 +292,28 @@ def main():
                    "--jobs-overview or --longest-queued."))
         sys.exit()
 
+    ############
+    ## DAEMON ##
+    ############
+    if args.daemon:
+        if not args.cancel_zero_gpu_jobs:
+            print("ERROR: --daemon can only be used with --cancel-zero-gpu-jobs.\n")
+            sys.exit()
+        load_config = partial(read_config_file,
+                              args.config_file,
+                              jds_path,
+                              cwd_path,
+                              "",
+                              args.no_emails_to_users,
+                              args.no_emails_to_admins)
+        get_running_jobs = partial(running_jobs_from_sacct,
+                                   clusters=args.clusters,
+                                   partitions=args.partition)
+        CancelZeroGpuDaemon(load_config,
+                            email=args.email,
+                            get_running_jobs=get_running_jobs).run()
+        sys.exit()
+
     start_date, end_date = prepare_datetimes(args.starttime,
                                              args.endtime,
                                              args.days)
@@ -265,35 +331,85 @@ def main():
     else:
         use_external_db = False
  
-    fields = ["jobid",
-              "user",
-              "cluster",
-              "account",
-              "partition",
-              "cputimeraw",
-              "elapsedraw",
-              "timelimitraw",
-              "nnodes",
-              "ncpus",
-              "alloctres",
-              "submit",
-              "eligible",
-              "start",
-              "end",
-              "qos",
-              "state",
-              "jobname"]
-    if use_external_db:
-        fields.insert(1, "jobidraw")
-    else:
+    fields = list(SACCT_FIELDS)
+    if not use_external_db:
         fields.insert(-1, "admincomment")
+    # the external database, the stats cache and the batch Prometheus queries
+    # are keyed by jobidraw (the jobid of an array job is of the form 123_4)
+    if use_external_db or cfg["stats-cache-path"] or cfg["prometheus-batch"]:
+        fields.insert(1, "jobidraw")
     # jobname must be last in list below to catch "|" characters in jobname
     assert fields[-1] == "jobname"
-    raw = SlurmSacct(start_date,
-                     end_date,
-                     fields,
-                     args.clusters,
-                     args.partition).get_job_data()
+    field_renamings = FIELD_RENAMINGS
+    partition_renamings = cfg["partition-renamings"]
+    chunksize = cfg["sacct-chunk-size"]
+    if chunksize and args.dump_files:
+        print("INFO: Ignoring sacct-chunk-size since --dump-files needs the raw data")
+        chunksize = 0
+    # the cancellation of GPU jobs only needs the running jobs
+    other_alerts = [getattr(args, spec.flag) for spec in ALERTS if not spec.cancels]
+    only_running = args.cancel_zero_gpu_jobs and not any(other_alerts) and \
+                   not args.dump_files and not args.starttime and not args.endtime
+    if only_running:
+        chunksize = 0
+        sacct = SlurmRunningJobs(fields,
+                                 args.clusters,
+                                 args.partition,
+                                 parser=cfg["sacct-parser"])
+    elif cfg["job-history-path"]:
+        if chunksize:
+            print("INFO: Ignoring sacct-chunk-size since job-history-path is set")
+            chunksize = 0
+        sacct = JobHistoryStore(cfg["job-history-path"],
+                                start_date,
+                                end_date,
+                                fields,
+                                args.clusters,
+                                args.partition,
+                                overlap_minutes=cfg["job-history-overlap-minutes"],
+                                retention_days=cfg["job-history-retention-days"],
+                                parser=cfg["sacct-parser"])
+    elif cfg["sacct-shard-hours"]:
+        if chunksize:
+            print("INFO: Ignoring sacct-chunk-size since sacct-shard-hours is set")
+            chunksize = 0
+        sacct = SlurmSacctSharded(start_date,
+                                  end_date,
+                                  fields,
+                                  args.clusters,
+                                  args.partition,
+                                  shard_hours=cfg["sacct-shard-hours"],
+                                  max_workers=cfg["sacct-shard-workers"],
+                                  shard_by_cluster=cfg["sacct-shard-by-cluster"],
+                                  parser=cfg["sacct-parser"])
+    else:
+        sacct = SlurmSacct(start_date,
+                           end_date,
+                           fields,
+                           args.clusters,
+                           args.partition,
+                           chunksize=chunksize,
+                           parser=cfg["sacct-parser"])
+    if cfg["sacct-cleaner"] == "vectorized":
+        Cleaner = VectorizedSacctCleaner
+    elif cfg["sacct-cleaner"] == "rowwise":
+        Cleaner = SacctCleaner
+    else:
+        print('ERROR: sacct-cleaner must be either "rowwise" or "vectorized".\n')
+        sys.exit()
+    if chunksize:
+        # clean each chunk as it arrives instead of holding all of the raw data
+        with stage("sacct and clean"):
+            categorical = CATEGORICAL_FIELDS if cfg["optimize-dtypes"] else []
+            df = clean_chunks(Cleaner,
+                              sacct.iter_job_data(),
+                              field_renamings,
+                              partition_renamings,
+                              categorical=categorical)
+    else:
+        with stage("sacct"):
+            raw = sacct.get_job_data()
+        snapshot("raw", raw)
     if args.dump_files:
         dg = raw.copy()
         private_users = {key:f"u{i}" for i, key in enumerate(dg.user.unique())}
@@ -307,12 +423,10 @@ def main():
         raw.info()
 
     # clean the raw data
-    field_renamings = {"cputimeraw":"cpu-seconds",
-                       "nnodes":"nodes",
-                       "ncpus":"cores",
-                       "timelimitraw":"limit-minutes"}
-    partition_renamings = cfg["partition-renamings"]
-    df = SacctCleaner(raw, field_renamings, partition_renamings).clean()
+    if not chunksize:
+        with stage("clean"):
+            df = Cleaner(raw, field_renamings, partition_renamings).clean()
+        del raw
     pending = df[df.state == "PENDING"].copy()
     df = df[(df.state != "PENDING") & (df.elapsedraw > 0)]
     num_nulls = df.isnull().sum().sum()
@@ -321,7 +435,17 @@ def main():
 
     if args.strict_start:
         df = apply_strict_start(df, start_date)
-    df = add_new_and_derived_fields(df)
+    with stage("derived fields"):
+        df = add_new_and_derived_fields(df)
+    if cfg["optimize-dtypes"]:
+        before = df.memory_usage(deep=True).sum() if cfg["verbose"] else 0
+        with stage("optimize dtypes"):
+            df = optimize_dtypes(df)
+            pending = optimize_dtypes(pending)
+        if cfg["verbose"]:
+            after = df.memory_usage(deep=True).sum()
+            print(f"INFO: Memory of job dataframe reduced from {round(before / 1024**2)} MB "
+                  f"to {round(after / 1024**2)} MB")
 
     if use_external_db:
         ext = ShieldDBHandler(EXTERNAL_DB_CONFIG,
@@ -329,454 +453,63 @@ def main():
                               start_date,
                               cfg["verbose"])
         ext.get_external_connection()
-        df_ext = ext.get_summary_stats()
-        df_ext.jobid = df_ext.jobid.astype("str")
-        df.jobidraw = df.jobidraw.astype("str")
-        df = pd.merge(df,
-                      df_ext,
-                      left_on=['jobidraw', 'cluster'],
-                      right_on=['jobid', 'cluster'],
-                      how="left")
-        df.drop(columns="jobid_y", inplace=True)
-        df.rename(columns={"admin_comment": "admincomment",
-                           "jobid_x": "jobid"}, inplace=True)
+        df = merge_external_summary_stats(df, ext.get_summary_stats())
 
-    # next line should be in utils.py but need resolve pytest path issues
-    # with import of: from .efficiency import get_stats_dict
-    df["admincomment"] = df["admincomment"].apply(get_stats_dict)
     df.reset_index(drop=True, inplace=True)
+    snapshot("jobs", df)
+    decode = timed("decode admincomment")(partial(get_stats_dicts,
+                                                  workers=cfg["decode-workers"],
+                                                  min_jobs=cfg["decode-min-jobs"]))
+    stats_cache = None
+    if cfg["stats-cache-path"] and not use_external_db:
+        stats_cache = StatsCache(cfg["stats-cache-path"],
+                                 max_age_days=cfg["stats-cache-max-age-days"],
+                                 max_size_mb=cfg["stats-cache-max-size-mb"])
+        if args.rebuild_stats_cache:
+            print("INFO: Removing all entries from the stats cache")
+            stats_cache.clear()
+    # the alerts decode the summary statistics of the jobs that pass their filters
+    stats_decoder = StatsDecoder(df, decode, stats_cache)
+    sys_cfg["stats_decoder"] = stats_decoder
+    live_stats_cache = LiveStatsCache()
+    sys_cfg["live_stats_cache"] = live_stats_cache
+    # the alerts start from the rows of their cluster and partitions
+    sys_cfg["job_index"] = JobFrameIndex(df)
     if args.dump_files:
         dg = df.copy()
         dg.user = dg.user.map(private_users)
+        dg["admincomment"] = stats_decoder.decode(dg)
         dg.to_csv("DEBUG_DF.csv", index=False)
         del dg
         dfiles = "see DEBUG_RAW.csv and DEBUG_DF.csv"
         print(f"INFO: Wrote debug files with obfuscated usernames ({dfiles}).")
 
-    s = "\n"
-    ###########################################
-    ## CANCEL JOBS WITH ZERO GPU UTILIZATION ##
-    ###########################################
-    if args.cancel_zero_gpu_jobs:
-        alerts = [alert for alert in cfg.keys() if "cancel-zero-gpu-jobs" in alert]
-        for alert in alerts:
-            params = cfg[alert]
-            if "enabled" in params and not params["enabled"]:
-                continue
-            params.update(sys_cfg)
-            params.update({"num_cancel_alerts":len(alerts)})
-            cancel_gpu = CancelZeroGpuJobs(df,
-                                           days_between_emails=1,
-                                           violation="cancel_zero_gpu_jobs",
-                                           vpath=violation_logs_path,
-                                           **params)
-            if args.email:
-                cancel_gpu.create_emails(greeting_method)
-                cancel_gpu.send_emails_to_users()
-                cancel_gpu.cancel_jobs()
-
-
-    ################################
-    ## ZERO UTILIZATION GPU-HOURS ##
-    ################################
-    if args.zero_util_gpu_hours:
-        alerts = [alert for alert in cfg.keys() if "zero-util-gpu-hours" in alert]
-        for alert in alerts:
-            params = cfg[alert]
-            if "enabled" in params and not params["enabled"]:
-                continue
-            params.update(sys_cfg)
-            zero_gpu_hours = ZeroUtilGPUHours(df,
-                                   days_between_emails=args.days,
-                                   violation="zero_util_gpu_hours",
-                                   vpath=violation_logs_path,
-                                   **params)
-            if args.email and is_workday:
-                zero_gpu_hours.create_emails(greeting_method)
-                zero_gpu_hours.send_emails_to_users()
-            report = zero_gpu_hours.generate_report_for_admins(keep_index=True)
-            if report:
-                s += report
-                s += zero_gpu_hours.add_report_metadata(start_date, end_date)
-
-
-    ########################
-    ## LOW GPU EFFICIENCY ##
-    ########################
-    if args.low_gpu_efficiency:
-        alerts = [alert for alert in cfg.keys() if "low-gpu-efficiency" in alert]
-        for alert in alerts:
-            params = cfg[alert]
-            if "enabled" in params and not params["enabled"]:
-                continue
-            params.update(sys_cfg)
-            low_gpu = LowEfficiencyGPU(df,
-                                       days_between_emails=args.days,
-                                       violation="low_gpu_efficiency",
-                                       vpath=violation_logs_path,
-                                       **params)
-            if args.email and is_workday:
-                low_gpu.create_emails(greeting_method)
-                low_gpu.send_emails_to_users()
-            report = low_gpu.generate_report_for_admins()
-            if report:
-                s += report
-                s += low_gpu.add_report_metadata(start_date, end_date)
-
-
-    #################################
-    ## TOO MUCH CPU MEMORY PER GPU ##
-    #################################
-    if args.too_much_cpu_mem_per_gpu:
-        alerts = [alert for alert in cfg.keys() if "too-much-cpu-mem-per-gpu" in alert]
-        for alert in alerts:
-            params = cfg[alert]
-            if "enabled" in params and not params["enabled"]:
-                continue
-            params.update(sys_cfg)
-            mpg = TooMuchCpuMemPerGpu(df,
-                                      days_between_emails=args.days,
-                                      violation="too_much_cpu_mem_per_gpu",
-                                      vpath=violation_logs_path,
-                                      **params)
-            if args.email and is_workday:
-                mpg.create_emails(greeting_method)
-                mpg.send_emails_to_users()
-            report = mpg.generate_report_for_admins()
-            if report:
-                s += report
-                s += mpg.add_report_metadata(start_date, end_date)
-
-
-    ############################
-    ## TOO MANY CORES PER GPU ##
-    ############################
-    if args.too_many_cores_per_gpu:
-        alerts = [alert for alert in cfg.keys() if "too-many-cores-per-gpu" in alert]
-        for alert in alerts:
-            params = cfg[alert]
-            if "enabled" in params and not params["enabled"]:
-                continue
-            params.update(sys_cfg)
-            cpg = TooManyCoresPerGpu(df,
-                                     days_between_emails=args.days,
-                                     violation="too_many_cores_per_gpu",
-                                     vpath=violation_logs_path,
-                                     **params)
-            if args.email and is_workday:
-                cpg.create_emails(greeting_method)
-                cpg.send_emails_to_users()
-            report = cpg.generate_report_for_admins()
-            if report:
-                s += report
-                s += cpg.add_report_metadata(start_date, end_date)
-
-
-    ############################
-    ## GPU MODEL TOO POWERFUL ##
-    ############################
-    if args.gpu_model_too_powerful:
-        alerts = [alert for alert in cfg.keys() if "gpu-model-too-powerful" in alert]
-        for alert in alerts:
-            params = cfg[alert]
-            if "enabled" in params and not params["enabled"]:
-                continue
-            params.update(sys_cfg)
-            too_power = GpuModelTooPowerful(df,
-                                            days_between_emails=args.days,
-                                            violation="gpu_model_too_powerful",
-                                            vpath=violation_logs_path,
-                                            **params)
-            if args.email and is_workday:
-                too_power.create_emails(greeting_method)
-                too_power.send_emails_to_users()
-            report = too_power.generate_report_for_admins()
-            if report:
-                s += report
-                s += too_power.add_report_metadata(start_date, end_date)
-
-
-    #################################
-    ## MULTINODE GPU FRAGMENTATION ##
-    #################################
-    if args.multinode_gpu_fragmentation:
-        alerts = [alert for alert in cfg.keys() if "multinode-gpu-fragmentation" in alert]
-        for alert in alerts:
-            params = cfg[alert]
-            if "enabled" in params and not params["enabled"]:
-                continue
-            params.update(sys_cfg)
-            gpu_frag = MultinodeGpuFragmentation(df,
-                                   days_between_emails=args.days,
-                                   violation="multinode_gpu_fragmentation",
-                                   vpath=violation_logs_path,
-                                   **params)
-            if args.email and is_workday:
-                gpu_frag.create_emails(greeting_method)
-                gpu_frag.send_emails_to_users()
-            report = gpu_frag.generate_report_for_admins()
-            if report:
-                s += report
-                s += gpu_frag.add_report_metadata(start_date, end_date)
-
-
-    #################################
-    ## EXCESSIVE TIME LIMITS (GPU) ##
-    #################################
-    if args.excessive_time_gpu:
-        alerts = [alert for alert in cfg.keys() if "excessive-time-gpu" in alert]
-        for alert in alerts:
-            params = cfg[alert]
-            if "enabled" in params and not params["enabled"]:
-                continue
-            params.update(sys_cfg)
-            time_limits = ExcessiveTimeLimitsGPU(
-                                              df,
-                                              days_between_emails=args.days,
-                                              violation="excessive_time_limits_gpu",
-                                              vpath=violation_logs_path,
-                                              **params)
-            if args.email and is_workday:
-                time_limits.create_emails(greeting_method)
-                time_limits.send_emails_to_users()
-            report = time_limits.generate_report_for_admins()
-            if report:
-                s += report
-                s += time_limits.add_report_metadata(start_date, end_date)
-
-
-    ##########################
-    ## ZERO CPU UTILIZATION ##
-    ##########################
-    if args.zero_cpu_utilization:
-        alerts = [alert for alert in cfg.keys() if "zero-cpu-utilization" in alert]
-        for alert in alerts:
-            params = cfg[alert]
-            if "enabled" in params and not params["enabled"]:
-                continue
-            params.update(sys_cfg)
-            zero_cpu = ZeroCPU(df,
-                               days_between_emails=args.days,
-                               violation="zero_cpu_utilization",
-                               vpath=violation_logs_path,
-                               **params)
-            if args.email and is_workday:
-                zero_cpu.create_emails(greeting_method)
-                zero_cpu.send_emails_to_users()
-            report = zero_cpu.generate_report_for_admins()
-            if report:
-                s += report
-                s += zero_cpu.add_report_metadata(start_date, end_date)
-
-
-    #######################
-    ## EXCESS CPU MEMORY ##
-    #######################
-    if args.excess_cpu_memory:
-        alerts = [alert for alert in cfg.keys() if "excess-cpu-memory" in alert]
-        for alert in alerts:
-            params = cfg[alert]
-            if "enabled" in params and not params["enabled"]:
-                continue
-            params.update(sys_cfg)
-            mem_hours = ExcessCPUMemory(df,
-                                        days_between_emails=args.days,
-                                        violation="excess_cpu_memory",
-                                        vpath=violation_logs_path,
-                                        **params)
-            if args.email and is_workday:
-                mem_hours.create_emails(greeting_method)
-                mem_hours.send_emails_to_users()
-            report = mem_hours.generate_report_for_admins(keep_index=True)
-            if report:
-                s += report
-                s += mem_hours.add_report_metadata(start_date, end_date)
-
-
-    ########################
-    ## LOW CPU EFFICIENCY ##
-    ########################
-    if args.low_cpu_efficiency:
-        alerts = [alert for alert in cfg.keys() if "low-cpu-efficiency" in alert]
-        for alert in alerts:
-            params = cfg[alert]
-            if "enabled" in params and not params["enabled"]:
-                continue
-            params.update(sys_cfg)
-            low_cpu = LowEfficiencyCPU(df,
-                                       days_between_emails=args.days,
-                                       violation="low_cpu_efficiency",
-                                       vpath=violation_logs_path,
-                                       **params)
-            if args.email and is_workday:
-                low_cpu.create_emails(greeting_method)
-                low_cpu.send_emails_to_users()
-            report = low_cpu.generate_report_for_admins()
-            if report:
-                s += report
-                s += low_cpu.add_report_metadata(start_date, end_date)
-
-
-    ###########################################
-    ## SERIAL CODE ALLOCATING MULTIPLE CORES ##
-    ###########################################
-    if args.serial_allocating_multiple:
-        alerts = [alert for alert in cfg.keys() if "serial-allocating-multiple" in alert]
-        for alert in alerts:
-            params = cfg[alert]
-            if "enabled" in params and not params["enabled"]:
-                continue
-            params.update(sys_cfg)
-            serial = SerialAllocatingMultipleCores(df,
-                                     days_between_emails=args.days,
-                                     violation="serial_allocating_multiple",
-                                     vpath=violation_logs_path,
-                                     **params)
-            if args.email and is_workday:
-                serial.create_emails(greeting_method)
-                serial.send_emails_to_users()
-            report = serial.generate_report_for_admins(keep_index=True)
-            if report:
-                s += report
-                s += serial.add_report_metadata(start_date, end_date)
-
-
-    #################################
-    ## MULTINODE CPU FRAGMENTATION ##
-    #################################
-    if args.multinode_cpu_fragmentation:
-        alerts = [alert for alert in cfg.keys() if "multinode-cpu-fragmentation" in alert]
-        for alert in alerts:
-            params = cfg[alert]
-            if "enabled" in params and not params["enabled"]:
-                continue
-            params.update(sys_cfg)
-            cpu_frag = MultinodeCpuFragmentation(df,
-                                   days_between_emails=args.days,
-                                   violation="multinode_cpu_fragmentation",
-                                   vpath=violation_logs_path,
-                                   **params)
-            if args.email and is_workday:
-                cpu_frag.create_emails(greeting_method)
-                cpu_frag.send_emails_to_users()
-            report = cpu_frag.generate_report_for_admins(keep_index=False)
-            if report:
-                s += report
-                s += cpu_frag.add_report_metadata(start_date, end_date)
-
-
-    #################################
-    ## EXCESSIVE TIME LIMITS (CPU) ##
-    #################################
-    if args.excessive_time_cpu:
-        alerts = [alert for alert in cfg.keys() if "excessive-time-cpu" in alert]
-        for alert in alerts:
-            params = cfg[alert]
-            if "enabled" in params and not params["enabled"]:
-                continue
-            params.update(sys_cfg)
-            time_limits = ExcessiveTimeLimitsCPU(
-                                              df,
-                                              days_between_emails=args.days,
-                                              violation="excessive_time_limits_cpu",
-                                              vpath=violation_logs_path,
-                                              **params)
-            if args.email and is_workday:
-                time_limits.create_emails(greeting_method)
-                time_limits.send_emails_to_users()
-            report = time_limits.generate_report_for_admins()
-            if report:
-                s += report
-                s += time_limits.add_report_metadata(start_date, end_date)
-
-
-    ####################
-    ## USAGE OVERVIEW ##
-    ####################
-    if args.usage_overview:
-        usage = UsageOverview(df,
-                              days_between_emails=args.days,
-                              violation="null",
-                              vpath=violation_logs_path)
-        s += usage.generate_report_for_admins()
-        s += usage.add_report_metadata(start_date,
-                                       end_date,
-                                       dates_only=True)
-
-
     ############################
-    ## USAGE BY SLURM ACCOUNT ##
+    ## RUN THE ALERTS/REPORTS ##
     ############################
-    if args.usage_by_slurm_account:
-        usage_acc = UsageBySlurmAccount(df,
-                                        days_between_emails=args.days,
-                                        violation="null",
-                                        vpath=violation_logs_path)
-        s += usage_acc.generate_report_for_admins()
-        s += usage_acc.add_report_metadata(start_date,
-                                           end_date,
-                                           dates_only=True)
-
-
-    #########################
-    ## LONGEST QUEUED JOBS ##
-    #########################
-    if args.longest_queued:
-        queued = LongestQueuedJobs(pending,
-                                   days_between_emails=args.days,
-                                   violation="null",
-                                   vpath=violation_logs_path)
-        s += queued.generate_report_for_admins()
-        s += queued.add_report_metadata(start_date,
-                                        end_date,
-                                        dates_only=True)
-
-
-    ###################
-    ## JOBS OVERVIEW ##
-    ###################
-    if args.jobs_overview:
-        jobs = JobsOverview(df,
-                            days_between_emails=args.days,
-                            violation="null",
-                            vpath=violation_logs_path)
-        s += jobs.generate_report_for_admins()
-        s += jobs.add_report_metadata(start_date,
-                                      end_date,
-                                      dates_only=True)
-
-
-    ####################
-    ## MOST CPU-CORES ##
-    ####################
-    if args.most_cores:
-        params = sys_cfg
-        most_cores = MostCores(df,
-                               days_between_emails=args.days,
-                               violation="null",
-                               vpath=violation_logs_path,
-                               **params)
-        s += most_cores.generate_report_for_admins()
-        s += most_cores.add_report_metadata(start_date,
-                                            end_date,
-                                            dates_only=True)
-
-
-    ###############
-    ## MOST GPUS ##
-    ###############
-    if args.most_gpus:
-        params = sys_cfg
-        most_gpus = MostGPUs(df,
-                             days_between_emails=args.days,
-                             violation="null",
-                             vpath=violation_logs_path,
-                             **params)
-        s += most_gpus.generate_report_for_admins()
-        s += most_gpus.add_report_metadata(start_date,
-                                           end_date,
-                                           dates_only=True)
+    runner = AlertRunner(cfg,
+                         sys_cfg,
+                         df,
+                         start_date,
+                         end_date,
+                         pending=pending,
+                         days_between_emails=args.days,
+                         email=args.email,
+                         is_workday=is_workday,
+                         workers=cfg["alert-workers"])
+    results = runner.run([spec.flag for spec in ALERTS if getattr(args, spec.flag)])
+    s = "\n" + runner.report(results)
 
+    if cfg["verbose"]:
+        print(f"INFO: Decoded the summary statistics of {len(stats_decoder)} of {len(df)} jobs")
+        print(runner.timings(results))
+        if live_stats_cache.hits or live_stats_cache.misses:
+            print(live_stats_cache.report())
+        if stats_cache is not None:
+            print(stats_cache.report())
+    if stats_cache is not None:
+        stats_cache.evict()
+        stats_cache.close()
 
     ####################################
     ## SEND REPORT BY EMAIL TO ADMINS ##
@@ -799,6 +532,10 @@ def main():
                    "sender were not defined in config.yaml.\n\n")
             print(msg)
     print(s, end="\n\n")
+    if args.profile:
+        print(PROFILER.summary())
+    if args.profile_json:
+        PROFILER.write_json(args.profile_json, {"argv":" ".join(sys.argv[1:])})
 
 
 if __name__ == "__main__":
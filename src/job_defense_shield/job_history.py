@@ -0,0 +1,203 @@
+"""A persistent store of the raw job data of finished jobs. Only the jobs
+   that changed since the previous call are fetched from sacct."""
+
+import os
+import json
+import shutil
+from time import time
+from datetime import datetime
+from datetime import timedelta
+from typing import List
+from typing import Optional
+import pandas as pd
+from .raw_job_data import RawJobData
+from .raw_job_data import SlurmSacct
+
+
+# states of jobs whose sacct records can still change
+ACTIVE_STATES = ["PENDING",
+                 "RUNNING",
+                 "REQUEUED",
+                 "REQUEUE_FED",
+                 "REQUEUE_HOLD",
+                 "RESIZING",
+                 "SUSPENDED",
+                 "STOPPED"]
+
+
+class JobHistoryStore(RawJobData):
+
+    """Keep the sacct records of finished jobs on disk in Parquet files that
+       are partitioned by cluster and end date. The records of finished jobs
+       never change so only the jobs that were active after the previous
+       sync (the watermark) are fetched from sacct. This includes all of the
+       RUNNING and PENDING jobs. The remainder of the time window is served
+       from disk.
+
+       A separate store is kept for each combination of clusters (-M) and
+       partitions (-r). The store is rebuilt if the sacct fields change. The
+       watermark is moved back by overlap_minutes to allow for records that
+       are written to the Slurm database after the job ends.
+
+       A stored job is returned for the window [start, end] if it ended after
+       start and it became eligible (or was submitted) before end."""
+
+    def __init__(self,
+                 path: str,
+                 start: datetime,
+                 end: datetime,
+                 fields: List[str],
+                 clusters: str,
+                 partitions: str,
+                 overlap_minutes: int=10,
+                 retention_days: Optional[int]=None,
+                 parser: str="python") -> None:
+        self.start_datetime = start
+        self.end_datetime = end
+        self.fields = fields
+        self.clusters = clusters
+        self.partitions = partitions
+        self.overlap = timedelta(minutes=overlap_minutes)
+        self.retention_days = retention_days
+        self.parser = parser
+        spec = f"clusters={clusters}_partitions={partitions if partitions else 'all'}"
+        self.root = os.path.join(path, spec.replace(",", "+"))
+        self.meta_file = os.path.join(self.root, "meta.json")
+
+    def read_meta(self) -> dict:
+        """Return the metadata of the store. An empty store is returned if
+           the fields have changed."""
+        if os.path.isfile(self.meta_file):
+            with open(self.meta_file, "r", encoding="utf-8") as fp:
+                meta = json.load(fp)
+            if meta.get("fields") == self.fields:
+                return meta
+            print("INFO: Rebuilding job history store since the sacct fields changed")
+            shutil.rmtree(self.root)
+        return {"fields": self.fields, "low": None, "watermark": None}
+
+    def write_meta(self, meta: dict) -> None:
+        """Atomically write the metadata of the store."""
+        os.makedirs(self.root, exist_ok=True)
+        tmp = f"{self.meta_file}.tmp"
+        with open(tmp, "w", encoding="utf-8") as fp:
+            json.dump(meta, fp)
+        os.replace(tmp, self.meta_file)
+
+    def fetch(self, start: datetime, end: datetime) -> pd.DataFrame:
+        """Return the sacct data for the window (possibly empty)."""
+        sacct = SlurmSacct(start,
+                           end,
+                           self.fields,
+                           self.clusters,
+                           self.partitions,
+                           parser=self.parser)
+        os.environ["SLURM_TIME_FORMAT"] = "%s"
+        stdout = sacct.call_sacct(sacct.sacct_command(), binary=self.parser == "arrow")
+        raw = sacct.parse(stdout)
+        # the store keeps strings (see save) so the columns of both parsers are
+        # converted to match the jobs that are loaded from disk
+        return raw.astype(str) if not raw.empty else pd.DataFrame(columns=self.fields)
+
+    @staticmethod
+    def finished_jobs(raw: pd.DataFrame) -> pd.DataFrame:
+        """Return the jobs whose records will not change."""
+        state = raw.state.str.split().str[0]
+        return raw[raw.end.str.isnumeric() & ~state.isin(ACTIVE_STATES)]
+
+    def partition_file(self, cluster: str, end_date: str) -> str:
+        return os.path.join(self.root,
+                            f"cluster={cluster}",
+                            f"end_date={end_date}",
+                            "part.parquet")
+
+    def save(self, raw: pd.DataFrame) -> int:
+        """Merge the finished jobs into the partitions of the store. Return
+           the number of jobs written."""
+        done = self.finished_jobs(raw)
+        if done.empty:
+            return 0
+        end_dates = pd.to_datetime(done.end.astype("int64"), unit="s").dt.strftime("%Y-%m-%d")
+        for (cluster, end_date), jobs in done.groupby([done.cluster, end_dates]):
+            pfile = self.partition_file(cluster, end_date)
+            if os.path.isfile(pfile):
+                jobs = pd.concat([pd.read_parquet(pfile), jobs])
+                jobs = jobs.drop_duplicates(subset=["jobid"], keep="last")
+            os.makedirs(os.path.dirname(pfile), exist_ok=True)
+            tmp = f"{pfile}.tmp"
+            jobs.astype(str).to_parquet(tmp, index=False)
+            os.replace(tmp, pfile)
+        return len(done)
+
+    def load(self, start: datetime, end: datetime) -> pd.DataFrame:
+        """Return the stored jobs that belong to the window."""
+        # partitions are by UTC date so allow for one extra day
+        first = (start - timedelta(days=1)).strftime("%Y-%m-%d")
+        clusters = [c.strip() for c in self.clusters.split(",")]
+        frames = []
+        if os.path.isdir(self.root):
+            for cdir in sorted(os.listdir(self.root)):
+                if not cdir.startswith("cluster="):
+                    continue
+                if "all" not in clusters and cdir[len("cluster="):] not in clusters:
+                    continue
+                for ddir in sorted(os.listdir(os.path.join(self.root, cdir))):
+                    if ddir[len("end_date="):] >= first:
+                        pfile = os.path.join(self.root, cdir, ddir, "part.parquet")
+                        if os.path.isfile(pfile):
+                            frames.append(pd.read_parquet(pfile))
+        if not frames:
+            return pd.DataFrame(columns=self.fields)
+        jobs = pd.concat(frames, ignore_index=True)
+        began = jobs.eligible.where(jobs.eligible.str.isnumeric(), jobs.submit)
+        began = pd.to_numeric(began, errors="coerce")
+        ended = jobs.end.astype("int64")
+        return jobs[(ended >= start.timestamp()) &
+                    ~(began > end.timestamp())][self.fields]
+
+    def prune(self) -> None:
+        """Remove the partitions that are older than retention_days."""
+        if not self.retention_days or not os.path.isdir(self.root):
+            return None
+        oldest = (datetime.now() - timedelta(days=self.retention_days)).strftime("%Y-%m-%d")
+        for cdir in os.listdir(self.root):
+            if cdir.startswith("cluster="):
+                for ddir in os.listdir(os.path.join(self.root, cdir)):
+                    if ddir[len("end_date="):] < oldest:
+                        shutil.rmtree(os.path.join(self.root, cdir, ddir))
+        return None
+
+    def get_job_data(self) -> pd.DataFrame:
+        """Return the raw job data for the window by combining the jobs on
+           disk with the jobs that changed since the watermark."""
+        meta = self.read_meta()
+        low = datetime.fromtimestamp(meta["low"]) if meta["low"] else None
+        watermark = datetime.fromtimestamp(meta["watermark"]) if meta["watermark"] else None
+        if low is None or watermark is None or \
+           self.start_datetime < low or watermark < self.start_datetime:
+            # nothing useful on disk for this window
+            delta_start = self.start_datetime
+            low = self.start_datetime
+        else:
+            delta_start = max(self.start_datetime, watermark - self.overlap)
+        # always ask for a short window to find the jobs that were active at end
+        delta_start = min(delta_start, self.end_datetime - self.overlap)
+        print("INFO: Calling sacct for jobs changed since "
+              f"{delta_start.strftime('%Y-%m-%dT%H:%M:%S')} ... ", end="", flush=True)
+        start = time()
+        delta = self.fetch(delta_start, self.end_datetime)
+        print(f"done ({round(time() - start)} seconds, {len(delta)} jobs).", flush=True)
+        num_saved = self.save(delta)
+        stored = self.load(self.start_datetime, self.end_datetime)
+        print(f"INFO: Job history store added {num_saved} jobs and served "
+              f"{len(stored)} jobs from disk")
+        watermark = max(watermark, self.end_datetime) if watermark else self.end_datetime
+        self.write_meta({"fields": self.fields,
+                         "low": low.timestamp(),
+                         "watermark": min(watermark, datetime.now()).timestamp()})
+        self.prune()
+        raw = pd.concat([stored, delta], ignore_index=True)
+        raw = raw.drop_duplicates(subset=["cluster", "jobid"], keep="last")
+        raw = raw.reset_index(drop=True)
+        SlurmSacct.exit_if_empty(len(raw))
+        return raw
@@ -0,0 +1,62 @@
+"""An index of the rows of the job dataframe by cluster and partition."""
+
+from typing import Dict
+from typing import List
+from typing import Optional
+from typing import Tuple
+import numpy as np
+import pandas as pd
+
+
+class JobFrameIndex:
+
+    """Group the row positions of the job dataframe by (cluster, partition)
+       once so that each alert can start from the rows of its cluster and
+       partitions instead of scanning the entire dataframe. The dataframe
+       must not be modified after the index is built."""
+
+    def __init__(self, df: pd.DataFrame) -> None:
+        self.df = df
+        self.groups: Dict[str, Dict[str, np.ndarray]] = {}
+        self.memo: Dict[Tuple[str, Tuple[str, ...]], np.ndarray] = {}
+        if df.empty:
+            return
+        indices = df.groupby(["cluster", "partition"],
+                             observed=True,
+                             sort=False,
+                             dropna=False).indices
+        for (cluster, partition), positions in indices.items():
+            self.groups.setdefault(cluster, {})[partition] = positions
+
+    def __len__(self) -> int:
+        return len(self.df)
+
+    def positions(self,
+                  cluster: str,
+                  partitions: Optional[List[str]]=None) -> np.ndarray:
+        """Return the sorted row positions of the jobs that ran on cluster
+           and one of the partitions. All partitions are included if
+           partitions is None or contains "*"."""
+        if partitions is None or "*" in partitions:
+            key = (cluster, ("*",))
+        else:
+            key = (cluster, tuple(sorted(set(partitions))))
+        if key not in self.memo:
+            by_partition = self.groups.get(cluster, {})
+            if key[1] == ("*",):
+                chunks = list(by_partition.values())
+            else:
+                chunks = [by_partition[p] for p in key[1] if p in by_partition]
+            if chunks:
+                self.memo[key] = np.sort(np.concatenate(chunks))
+            else:
+                self.memo[key] = np.array([], dtype=np.int64)
+        return self.memo[key]
+
+    def select(self,
+               cluster: str,
+               partitions: Optional[List[str]]=None) -> pd.DataFrame:
+        """Return the rows of the jobs that ran on cluster and one of the
+           partitions in their original order (and with their original
+           index labels)."""
+        return self.df.iloc[self.positions(cluster, partitions)]
@@ -0,0 +1,295 @@
+"""Long tables of the per-node and per-GPU metrics of the summary statistics
+   and batch versions of the functions in efficiency.py."""
+
+from typing import Optional
+import numpy as np
+import pandas as pd
+
+
+NODE_METRICS = ["total_time", "cpus", "used_memory", "total_memory"]
+GPU_METRICS = ["util", "used_memory", "total_memory"]
+
+
+class MetricsTables:
+
+    """Explode the decoded summary statistics (the admincomment column) once
+       into two long tables. The nodes table has one row per (job, node) with
+       the columns of NODE_METRICS. The gpus table has one row per (job, node,
+       gpu) with the columns of GPU_METRICS. Missing metrics are NaN. The job
+       column holds the index label of the job in stats so the index of stats
+       must be unique.
+
+       The batch functions below are reductions per job over these tables.
+       They return a dataframe indexed by job with one row per job that is
+       equal to the tuple returned by the corresponding function in
+       efficiency.py. The warnings for malformed summary statistics are not
+       printed."""
+
+    def __init__(self, stats: pd.Series) -> None:
+        if not stats.index.is_unique:
+            raise ValueError("The index of the summary statistics must be unique.")
+        self.has_nodes = pd.Series([isinstance(ss, dict) and "nodes" in ss for ss in stats],
+                                   index=stats.index)
+        nodes = {"job": [], "node": [], "has_gpu_utilization": [], "has_gpu_memory": []}
+        nodes.update({metric: [] for metric in NODE_METRICS})
+        gpus = {"job": [], "node": [], "gpu": []}
+        gpus.update({metric: [] for metric in GPU_METRICS})
+        for job, ss in stats[self.has_nodes].items():
+            for node, metrics in ss["nodes"].items():
+                nodes["job"].append(job)
+                nodes["node"].append(node)
+                for metric in NODE_METRICS:
+                    nodes[metric].append(metrics.get(metric, np.nan))
+                util = metrics.get("gpu_utilization")
+                used = metrics.get("gpu_used_memory")
+                alloc = metrics.get("gpu_total_memory")
+                nodes["has_gpu_utilization"].append(isinstance(util, dict))
+                nodes["has_gpu_memory"].append(isinstance(util, dict) and
+                                               isinstance(used, dict) and
+                                               isinstance(alloc, dict))
+                if isinstance(util, dict):
+                    for gpu, value in util.items():
+                        gpus["job"].append(job)
+                        gpus["node"].append(node)
+                        gpus["gpu"].append(gpu)
+                        gpus["util"].append(value)
+                        gpus["used_memory"].append(used.get(gpu, np.nan)
+                                                   if isinstance(used, dict) else np.nan)
+                        gpus["total_memory"].append(alloc.get(gpu, np.nan)
+                                                    if isinstance(alloc, dict) else np.nan)
+        self.nodes = pd.DataFrame(nodes)
+        self.gpus = pd.DataFrame(gpus)
+        for table, metrics in [(self.nodes, NODE_METRICS), (self.gpus, GPU_METRICS)]:
+            for metric in metrics:
+                table[metric] = pd.to_numeric(table[metric], errors="coerce").astype("float64")
+            table["node"] = table["node"].astype(str)
+        self.gpus["gpu"] = self.gpus["gpu"].astype(str)
+
+    def node_rows(self, jobs: pd.Index) -> pd.DataFrame:
+        return self.nodes[self.nodes.job.isin(jobs)]
+
+    def gpu_rows(self, jobs: pd.Index) -> pd.DataFrame:
+        return self.gpus[self.gpus.job.isin(jobs)]
+
+
+def _round(values: pd.Series, precision: int) -> pd.Series:
+    """Round the values as the built-in round does. NumPy scales the values
+       by 10**precision before rounding so a value close to a tie (e.g.,
+       53.15) can be rounded the other way. Those values are rounded one at
+       a time with the built-in round and the others with np.round."""
+    x = values.to_numpy(dtype="float64", na_value=np.nan)
+    rounded = np.round(x, precision)
+    scaled = np.abs(x) * 10.0**precision
+    near_tie = np.abs(scaled - np.floor(scaled) - 0.5) <= 1e-6 * np.maximum(scaled, 1.0)
+    for i in np.flatnonzero(near_tie):
+        rounded[i] = round(float(x[i]), precision)
+    return pd.Series(rounded, index=values.index, dtype="float64")
+
+
+def _any_per_job(rows: pd.DataFrame, mask: pd.Series, jobs: pd.Index) -> pd.Series:
+    """Return True for the jobs with at least one row where mask is True."""
+    return pd.Series(jobs.isin(rows.job[mask]), index=jobs)
+
+
+def _sum_per_job(rows: pd.DataFrame, values: pd.Series, jobs: pd.Index) -> pd.Series:
+    """Return the sum of values for each job (zero for jobs without rows).
+       Missing values are skipped. The values of a job are added one at a
+       time in the order of the rows as in the loops of efficiency.py: the
+       first rows of all of the jobs are added in one vectorized step, then
+       the second rows and so on. A groupby sum (compensated) or
+       np.add.reduceat (pairwise for eight or more rows) can differ in the
+       last bit which changes the rounded efficiency (e.g., 44.7 vs 44.8)."""
+    sums = np.zeros(len(jobs))
+    position = jobs.get_indexer(rows.job)
+    vals = values.to_numpy(dtype="float64", na_value=np.nan)
+    keep = ~np.isnan(vals)
+    position, vals = position[keep], vals[keep]
+    if len(vals):
+        # rank of each row among the rows of its job
+        by_job = np.argsort(position, kind="stable")
+        first = np.r_[True, position[by_job][1:] != position[by_job][:-1]]
+        index = np.arange(len(vals))
+        rank = np.empty(len(vals), dtype="int64")
+        rank[by_job] = index - np.maximum.accumulate(np.where(first, index, 0))
+        order = np.argsort(rank, kind="stable")
+        bounds = np.searchsorted(rank[order], np.arange(rank.max() + 2))
+        for start, end in zip(bounds[:-1], bounds[1:]):
+            step = order[start:end]
+            sums[position[step]] += vals[step]
+    return pd.Series(sums, index=jobs, dtype="float64")
+
+
+def _count_per_job(rows: pd.DataFrame, mask: pd.Series, jobs: pd.Index) -> pd.Series:
+    return mask.groupby(rows.job, sort=False).sum().reindex(jobs, fill_value=0).astype("int64")
+
+
+def _efficiency(used: pd.Series,
+                total: pd.Series,
+                code: pd.Series,
+                single: bool,
+                precision: int) -> pd.DataFrame:
+    """Assemble the result of cpu_efficiency_batch and gpu_efficiency_batch."""
+    failed = code > 0
+    code = code.mask(~failed & (used > total), 3)
+    if single:
+        code = code.mask(~failed & (total == 0), 4)
+        eff = _round(100 * used / total.where(total != 0, 1), precision)
+        eff = eff.mask(failed | (total == 0), -1)
+        return pd.DataFrame({"eff": eff, "error_code": code})
+    return pd.DataFrame({"used": used.mask(failed, -1),
+                         "total": total.mask(failed, -1),
+                         "error_code": code})
+
+
+def _start_codes(tables: MetricsTables, jobs: pd.Index) -> pd.Series:
+    """Return error code 1 for the jobs without nodes and 0 otherwise."""
+    has_nodes = tables.has_nodes.reindex(jobs, fill_value=False)
+    return pd.Series(np.where(has_nodes, 0, 1), index=jobs, dtype="int64")
+
+
+def cpu_efficiency_batch(tables: MetricsTables,
+                         elapsedraw: pd.Series,
+                         single: bool=False,
+                         precision: int=1) -> pd.DataFrame:
+    """Batch version of cpu_efficiency. The index of elapsedraw gives the jobs.
+       Returns the columns used, total, error_code (or eff, error_code if single)."""
+    jobs = elapsedraw.index
+    rows = tables.node_rows(jobs)
+    code = _start_codes(tables, jobs)
+    missing = _any_per_job(rows, rows.total_time.isna() | rows.cpus.isna(), jobs)
+    code = code.mask((code == 0) & missing, 2)
+    alloc = rows.job.map(elapsedraw) * rows.cpus
+    used = _sum_per_job(rows, rows.total_time, jobs)
+    total = _sum_per_job(rows, alloc, jobs)
+    return _efficiency(used, total, code, single, precision)
+
+
+def gpu_efficiency_batch(tables: MetricsTables,
+                         elapsedraw: pd.Series,
+                         single: bool=False,
+                         precision: int=1) -> pd.DataFrame:
+    """Batch version of gpu_efficiency. The index of elapsedraw gives the jobs.
+       Returns the columns used, total, error_code (or eff, error_code if single)."""
+    jobs = elapsedraw.index
+    nodes = tables.node_rows(jobs)
+    rows = tables.gpu_rows(jobs)
+    code = _start_codes(tables, jobs)
+    missing = _any_per_job(nodes, ~nodes.has_gpu_utilization, jobs)
+    code = code.mask((code == 0) & missing, 2)
+    elapsed = rows.job.map(elapsedraw).astype("float64")
+    used = _sum_per_job(rows, elapsed * (rows.util / 100), jobs)
+    total = _sum_per_job(rows, elapsed, jobs)
+    return _efficiency(used, total, code, single, precision)
+
+
+def cpu_memory_usage_batch(tables: MetricsTables,
+                           jobs: pd.Index,
+                           precision: int=0) -> pd.DataFrame:
+    """Batch version of cpu_memory_usage. Returns the columns used, total and
+       error_code where used and total are in GB."""
+    rows = tables.node_rows(jobs)
+    code = _start_codes(tables, jobs)
+    missing = _any_per_job(rows, rows.used_memory.isna() | rows.total_memory.isna(), jobs)
+    code = code.mask((code == 0) & missing, 2)
+    failed = code > 0
+    used = _sum_per_job(rows, rows.used_memory, jobs)
+    total = _sum_per_job(rows, rows.total_memory, jobs)
+    code = code.mask(~failed & (used > total), 3)
+    fac = 1024**3
+    return pd.DataFrame({"used": _round(used / fac, precision).mask(failed, -1),
+                         "total": _round(total / fac, precision).mask(failed, -1),
+                         "error_code": code})
+
+
+def max_cpu_memory_used_per_node_batch(tables: MetricsTables,
+                                       jobs: pd.Index,
+                                       precision: int=0) -> pd.DataFrame:
+    """Batch version of max_cpu_memory_used_per_node. Returns the columns
+       max_used (GB) and error_code. Jobs without nodes have error code 4."""
+    rows = tables.node_rows(jobs)
+    code = _start_codes(tables, jobs)
+    missing = _any_per_job(rows, rows.used_memory.isna() | rows.total_memory.isna(), jobs)
+    code = code.mask((code == 0) & missing, 2)
+    over = _any_per_job(rows, rows.used_memory > rows.total_memory, jobs)
+    code = code.mask((code == 0) & over, 3)
+    max_used = rows.used_memory.groupby(rows.job, sort=False).max().reindex(jobs)
+    code = code.mask((code == 0) & max_used.isna(), 4)
+    max_used = _round(max_used / 1024**3, precision)
+    return pd.DataFrame({"max_used": max_used.mask(~code.isin([0, 3]), -1),
+                         "error_code": code})
+
+
+def gpu_memory_usage_eff_tuples_batch(tables: MetricsTables,
+                                      jobs: pd.Index,
+                                      precision: int=1,
+                                      op: Optional[str]=None) -> pd.DataFrame:
+    """Batch version of gpu_memory_usage_eff_tuples with the same choices for
+       op. Returns the columns value and error_code. For op=None, value is the
+       list of (used, allocated, utilization)-tuples. The value is an empty
+       list for error codes 1 and 2. Jobs with summary statistics but no GPUs
+       have a value of -1 and error code 4 (except for op=None)."""
+    nodes = tables.node_rows(jobs)
+    rows = tables.gpu_rows(jobs)
+    code = _start_codes(tables, jobs)
+    missing = _any_per_job(nodes, ~nodes.has_gpu_memory, jobs)
+    code = code.mask((code == 0) & missing, 2)
+    failed = code > 0
+    bad = (rows.used_memory > rows.total_memory) | (rows.util > 100) | (rows.util < 0)
+    code = code.mask(~failed & _any_per_job(rows, bad, jobs), 3)
+    used = _round(rows.used_memory / 1024**3, precision)
+    alloc = _round(rows.total_memory / 1024**3, precision)
+    num_gpus = _count_per_job(rows, pd.Series(True, index=rows.index), jobs)
+    if op is None:
+        tuples = pd.Series(list(zip(used, alloc, rows.util)), index=rows.index)
+        value = tuples.groupby(rows.job, sort=False).agg(list).reindex(jobs)
+        value = pd.Series([v if isinstance(v, list) and not f else []
+                           for v, f in zip(value, failed)], index=jobs, dtype=object)
+        return pd.DataFrame({"value": value, "error_code": code})
+    if op == "max":
+        value = _round(used.groupby(rows.job, sort=False).max().reindex(jobs), precision)
+    elif op == "max-percent":
+        pct = 100 * used / alloc
+        value = _round(pct.groupby(rows.job, sort=False).max().reindex(jobs), precision)
+    elif op == "mean":
+        value = _round(_sum_per_job(rows, used, jobs) / num_gpus, precision)
+    elif op == "mean-percent":
+        value = _round(_sum_per_job(rows, 100 * used / alloc, jobs) / num_gpus, precision)
+    else:
+        raise ValueError(f"Unknown op for gpu_memory_usage_eff_tuples_batch: {op}")
+    code = code.mask(~failed & (num_gpus == 0), 4)
+    # as in gpu_memory_usage_eff_tuples the value is an empty list on failure
+    value = pd.Series([[] if f else (-1 if n == 0 else v)
+                       for v, f, n in zip(value, failed, num_gpus)], index=jobs, dtype=object)
+    return pd.DataFrame({"value": value, "error_code": code})
+
+
+def num_gpus_with_zero_util_batch(tables: MetricsTables, jobs: pd.Index) -> pd.DataFrame:
+    """Batch version of num_gpus_with_zero_util. Returns the columns count and
+       error_code."""
+    nodes = tables.node_rows(jobs)
+    rows = tables.gpu_rows(jobs)
+    code = _start_codes(tables, jobs)
+    missing = _any_per_job(nodes, ~nodes.has_gpu_utilization, jobs)
+    code = code.mask((code == 0) & missing, 2)
+    count = _count_per_job(rows, rows.util == 0, jobs)
+    return pd.DataFrame({"count": count.mask(code > 0, -1), "error_code": code})
+
+
+def cpu_nodes_with_zero_util_batch(tables: MetricsTables, jobs: pd.Index) -> pd.DataFrame:
+    """Batch version of cpu_nodes_with_zero_util. Returns the columns count and
+       error_code."""
+    rows = tables.node_rows(jobs)
+    code = _start_codes(tables, jobs)
+    missing = _any_per_job(rows, rows.total_time.isna(), jobs)
+    code = code.mask((code == 0) & missing, 2)
+    count = _count_per_job(rows, rows.total_time == 0, jobs)
+    return pd.DataFrame({"count": count.mask(code > 0, -1), "error_code": code})
+
+
+def get_nodelist_batch(tables: MetricsTables, jobs: pd.Index) -> pd.DataFrame:
+    """Batch version of get_nodelist. Returns the columns nodelist and error_code."""
+    rows = tables.node_rows(jobs)
+    code = _start_codes(tables, jobs)
+    nodelist = rows.node.groupby(rows.job, sort=False).agg(set).reindex(jobs)
+    nodelist = nodelist.where(nodelist.notna(), pd.Series([set() for _ in jobs], index=jobs))
+    return pd.DataFrame({"nodelist": nodelist.astype(object), "error_code": code}, index=jobs)
@@ -0,0 +1,315 @@
+"""Registry of the alerts and reports and a runner that executes them."""
+
+import io
+import sys
+import multiprocessing
+from time import time
+from datetime import datetime
+from contextlib import redirect_stdout
+from concurrent.futures import ProcessPoolExecutor
+from typing import List
+from typing import Optional
+from typing import Tuple
+import pandas as pd
+
+from .instrument import PROFILER
+from .instrument import stage
+from .alert.cancel_zero_gpu_jobs import CancelZeroGpuJobs
+from .alert.gpu_model_too_powerful import GpuModelTooPowerful
+from .alert.zero_util_gpu_hours import ZeroUtilGPUHours
+from .alert.excess_cpu_memory import ExcessCPUMemory
+from .alert.zero_cpu_utilization import ZeroCPU
+from .alert.most_gpus import MostGPUs
+from .alert.most_cores import MostCores
+from .alert.usage_overview import UsageOverview
+from .alert.usage_by_slurm_account import UsageBySlurmAccount
+from .alert.longest_queued import LongestQueuedJobs
+from .alert.jobs_overview import JobsOverview
+from .alert.excessive_time_limits import ExcessiveTimeLimitsCPU
+from .alert.excessive_time_limits import ExcessiveTimeLimitsGPU
+from .alert.serial_allocating_multiple_cores import SerialAllocatingMultipleCores
+from .alert.multinode_cpu_fragmentation import MultinodeCpuFragmentation
+from .alert.multinode_gpu_fragmentation import MultinodeGpuFragmentation
+from .alert.compute_efficiency import LowEfficiencyCPU
+from .alert.compute_efficiency import LowEfficiencyGPU
+from .alert.too_many_cores_per_gpu import TooManyCoresPerGpu
+from .alert.too_much_cpu_mem_per_gpu import TooMuchCpuMemPerGpu
+
+
+class AlertSpec:
+
+    """Describe how an alert or report is run. The value of flag is the
+       name of the command-line option (e.g., low_gpu_efficiency for
+       --low-gpu-efficiency). If prefix is given then one instance of the
+       alert is created for each entry of the configuration file whose
+       name contains prefix (e.g., low-gpu-efficiency-della). Reports
+       without a prefix are created once and their metadata only shows
+       the dates."""
+
+    def __init__(self,
+                 flag: str,
+                 alert_class: type,
+                 violation: str="null",
+                 prefix: Optional[str]=None,
+                 keep_index: bool=False,
+                 pending: bool=False,
+                 with_sys_cfg: bool=False) -> None:
+        self.flag = flag
+        self.alert_class = alert_class
+        self.violation = violation
+        self.prefix = prefix
+        self.keep_index = keep_index
+        self.pending = pending
+        self.with_sys_cfg = with_sys_cfg or prefix is not None
+        self.cancels = alert_class is CancelZeroGpuJobs
+
+    def __repr__(self) -> str:
+        return f"AlertSpec({self.flag}, {self.alert_class.__name__})"
+
+
+# the alerts and reports in the order that they are run
+ALERTS = [AlertSpec("cancel_zero_gpu_jobs", CancelZeroGpuJobs,
+                    "cancel_zero_gpu_jobs", "cancel-zero-gpu-jobs"),
+          AlertSpec("zero_util_gpu_hours", ZeroUtilGPUHours,
+                    "zero_util_gpu_hours", "zero-util-gpu-hours", keep_index=True),
+          AlertSpec("low_gpu_efficiency", LowEfficiencyGPU,
+                    "low_gpu_efficiency", "low-gpu-efficiency"),
+          AlertSpec("too_much_cpu_mem_per_gpu", TooMuchCpuMemPerGpu,
+                    "too_much_cpu_mem_per_gpu", "too-much-cpu-mem-per-gpu"),
+          AlertSpec("too_many_cores_per_gpu", TooManyCoresPerGpu,
+                    "too_many_cores_per_gpu", "too-many-cores-per-gpu"),
+          AlertSpec("gpu_model_too_powerful", GpuModelTooPowerful,
+                    "gpu_model_too_powerful", "gpu-model-too-powerful"),
+          AlertSpec("multinode_gpu_fragmentation", MultinodeGpuFragmentation,
+                    "multinode_gpu_fragmentation", "multinode-gpu-fragmentation"),
+          AlertSpec("excessive_time_gpu", ExcessiveTimeLimitsGPU,
+                    "excessive_time_limits_gpu", "excessive-time-gpu"),
+          AlertSpec("zero_cpu_utilization", ZeroCPU,
+                    "zero_cpu_utilization", "zero-cpu-utilization"),
+          AlertSpec("excess_cpu_memory", ExcessCPUMemory,
+                    "excess_cpu_memory", "excess-cpu-memory", keep_index=True),
+          AlertSpec("low_cpu_efficiency", LowEfficiencyCPU,
+                    "low_cpu_efficiency", "low-cpu-efficiency"),
+          AlertSpec("serial_allocating_multiple", SerialAllocatingMultipleCores,
+                    "serial_allocating_multiple", "serial-allocating-multiple", keep_index=True),
+          AlertSpec("multinode_cpu_fragmentation", MultinodeCpuFragmentation,
+                    "multinode_cpu_fragmentation", "multinode-cpu-fragmentation"),
+          AlertSpec("excessive_time_cpu", ExcessiveTimeLimitsCPU,
+                    "excessive_time_limits_cpu", "excessive-time-cpu"),
+          AlertSpec("usage_overview", UsageOverview),
+          AlertSpec("usage_by_slurm_account", UsageBySlurmAccount),
+          AlertSpec("longest_queued", LongestQueuedJobs, pending=True),
+          AlertSpec("jobs_overview", JobsOverview),
+          AlertSpec("most_cores", MostCores, with_sys_cfg=True),
+          AlertSpec("most_gpus", MostGPUs, with_sys_cfg=True)]
+
+
+def get_alert_spec(flag: str) -> AlertSpec:
+    """Return the entry of the registry for the command-line flag. Both
+       low_gpu_efficiency and --low-gpu-efficiency are accepted."""
+    flag = flag.lstrip("-").replace("-", "_")
+    for spec in ALERTS:
+        if spec.flag == flag:
+            return spec
+    raise KeyError(f"Unknown alert: {flag}")
+
+
+class AlertResult:
+
+    """The outcome of running one alert (or report) of the pipeline."""
+
+    def __init__(self,
+                 spec: AlertSpec,
+                 name: str,
+                 report: str="",
+                 seconds: float=0.0,
+                 alert=None) -> None:
+        self.spec = spec
+        self.name = name
+        self.report = report
+        self.seconds = seconds
+        self.alert = alert
+
+    def __repr__(self) -> str:
+        return f"AlertResult({self.name}, {round(self.seconds, 2)} s)"
+
+
+class AlertRunner:
+
+    """Run the enabled alerts on the cleaned dataframe of jobs. The values
+       of cfg and sys_cfg are those returned by read_config_file (sys_cfg
+       may also contain the shared objects that are created by main such
+       as the stats decoder). Emails are only created and sent if email is
+       True and, with the exception of the cancellation of GPU jobs, only
+       on workdays. Each call to run returns one AlertResult per instance
+       of an alert with its report and its run time.
+
+       If workers is greater than 1 then the alerts (with the exception of
+       the cancellation of GPU jobs) are run by forked worker processes
+       that share the dataframe of jobs copy-on-write. The instances of an
+       alert are run one after another by the same worker since they share
+       the violation logs. The output of each worker is printed in the order
+       of the registry so it matches that of a serial run. The value of
+       alert is None for the results that come from a worker.
+
+       Example:
+
+           runner = AlertRunner(cfg, sys_cfg, df, start_date, end_date)
+           results = runner.run(["low_gpu_efficiency", "zero_cpu_utilization"])
+           print(runner.report(results))"""
+
+    def __init__(self,
+                 cfg: dict,
+                 sys_cfg: dict,
+                 df: pd.DataFrame,
+                 start_date: datetime,
+                 end_date: datetime,
+                 pending: Optional[pd.DataFrame]=None,
+                 days_between_emails: int=7,
+                 email: bool=False,
+                 is_workday: bool=True,
+                 workers: int=1) -> None:
+        self.cfg = cfg
+        self.sys_cfg = sys_cfg
+        self.df = df
+        self.start_date = start_date
+        self.end_date = end_date
+        self.pending = pending if pending is not None else pd.DataFrame()
+        self.days_between_emails = days_between_emails
+        self.email = email
+        self.is_workday = is_workday
+        self.workers = workers
+
+    def instances(self, spec: AlertSpec) -> List[Tuple[str, dict]]:
+        """Return the name and parameters of each enabled instance of the
+           alert. The parameters of the configuration file are updated with
+           sys_cfg (the configuration itself is not modified)."""
+        if spec.prefix is None:
+            return [(spec.flag, dict(self.sys_cfg) if spec.with_sys_cfg else {})]
+        names = [name for name in self.cfg.keys() if spec.prefix in name]
+        instances = []
+        for name in names:
+            params = dict(self.cfg[name])
+            if "enabled" in params and not params["enabled"]:
+                continue
+            params.update(self.sys_cfg)
+            if spec.cancels:
+                params.update({"num_cancel_alerts":len(names)})
+            instances.append((name, params))
+        return instances
+
+    def run_one(self, spec: AlertSpec, name: str, params: dict) -> AlertResult:
+        """Create the alert, send its emails and return its report."""
+        start = time()
+        data = self.pending if spec.pending else self.df
+        days = 1 if spec.cancels else self.days_between_emails
+        # the alert filters the jobs and computes its fields when created
+        with stage(f"{name}: filter"):
+            alert = spec.alert_class(data,
+                                     days_between_emails=days,
+                                     violation=spec.violation,
+                                     vpath=self.cfg["violation-logs-path"],
+                                     **params)
+        report = ""
+        if spec.cancels:
+            if self.email:
+                with stage(f"{name}: email"):
+                    alert.create_emails(self.cfg["greeting-method"])
+                    alert.send_emails_to_users()
+                with stage(f"{name}: cancel"):
+                    alert.cancel_jobs()
+        elif spec.prefix is not None:
+            if self.email and self.is_workday:
+                with stage(f"{name}: email"):
+                    alert.create_emails(self.cfg["greeting-method"])
+                    alert.send_emails_to_users()
+            with stage(f"{name}: report"):
+                report = alert.generate_report_for_admins(keep_index=spec.keep_index)
+                if report:
+                    report += alert.add_report_metadata(self.start_date, self.end_date)
+        else:
+            with stage(f"{name}: report"):
+                report = alert.generate_report_for_admins()
+                report += alert.add_report_metadata(self.start_date,
+                                                    self.end_date,
+                                                    dates_only=True)
+        return AlertResult(spec, name, report, time() - start, alert)
+
+    def run_spec(self, spec: AlertSpec) -> List[AlertResult]:
+        """Run the enabled instances of the alert one after another."""
+        return [self.run_one(spec, name, params) for name, params in self.instances(spec)]
+
+    def run(self, flags: List[str]) -> List[AlertResult]:
+        """Run the alerts of the given flags in the order of the registry."""
+        selected = {get_alert_spec(flag).flag for flag in flags}
+        specs = [spec for spec in ALERTS if spec.flag in selected]
+        forkable = [spec for spec in specs if not spec.cancels]
+        if self.workers <= 1 or len(forkable) <= 1 or \
+           "fork" not in multiprocessing.get_all_start_methods():
+            return [result for spec in specs for result in self.run_spec(spec)]
+        global _RUNNER
+        _RUNNER = self
+        sys.stdout.flush()
+        results = []
+        try:
+            with ProcessPoolExecutor(max_workers=min(self.workers, len(forkable)),
+                                     mp_context=multiprocessing.get_context("fork"),
+                                     initializer=_init_worker) as executor:
+                futures = {spec.flag: executor.submit(_run_spec_in_worker, spec.flag)
+                           for spec in forkable}
+                for spec in specs:
+                    if spec.flag not in futures:
+                        results.extend(self.run_spec(spec))
+                        continue
+                    output, spec_results, error, stages = futures[spec.flag].result()
+                    print(output, end="")
+                    PROFILER.merge(*stages)
+                    if error is not None:
+                        executor.shutdown(cancel_futures=True)
+                        raise error
+                    results.extend(spec_results)
+        finally:
+            _RUNNER = None
+        return results
+
+    @staticmethod
+    def report(results: List[AlertResult]) -> str:
+        """Return the concatenated reports of the results."""
+        return "".join(result.report for result in results)
+
+    @staticmethod
+    def timings(results: List[AlertResult]) -> str:
+        """Return a summary of the run time of each alert."""
+        lines = [f"INFO: {result.name} ran in {round(result.seconds, 1)} seconds"
+                 for result in results]
+        total = sum(result.seconds for result in results)
+        lines.append(f"INFO: Total run time of the alerts was {round(total, 1)} seconds")
+        return "\n".join(lines)
+
+
+# the runner whose alerts are run by the forked worker processes
+_RUNNER = None
+
+
+def _init_worker() -> None:
+    """Open a new connection to the stats cache in the worker process."""
+    stats_decoder = _RUNNER.sys_cfg.get("stats_decoder")
+    if stats_decoder is not None and stats_decoder.stats_cache is not None:
+        stats_decoder.stats_cache.reconnect()
+
+
+def _run_spec_in_worker(flag: str) -> tuple:
+    """Run the instances of an alert in a worker process. Return the output,
+       the results (without the alert objects), the exception that was
+       raised (SystemExit for errors in the configuration), if any, and the
+       records of the profiler."""
+    output = io.StringIO()
+    PROFILER.stages, PROFILER.snapshots = [], []
+    try:
+        with redirect_stdout(output):
+            results = _RUNNER.run_spec(get_alert_spec(flag))
+    except (SystemExit, Exception) as error:
+        return output.getvalue(), [], error, (PROFILER.stages, PROFILER.snapshots)
+    for result in results:
+        result.alert = None
+    return output.getvalue(), results, None, (PROFILER.stages, PROFILER.snapshots)
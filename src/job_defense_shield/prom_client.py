@@ -0,0 +1,308 @@
+"""Retrieve the summary statistics of running jobs from Prometheus."""
+
+import json
+import threading
+from time import time
+from urllib.parse import urlencode
+from urllib.request import Request
+from urllib.request import urlopen
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import wait
+from concurrent.futures import FIRST_COMPLETED
+from typing import Callable
+from typing import Dict
+from typing import Hashable
+from typing import Iterable
+from typing import List
+from typing import Optional
+from typing import Tuple
+
+
+class DeferredError(TimeoutError):
+
+    """The key was not fetched before the deadline of fetch_concurrently."""
+
+
+def fetch_concurrently(keys: Iterable[Hashable],
+                       fetch: Callable[[Hashable], object],
+                       workers: int=8,
+                       timeout: Optional[float]=None,
+                       deadline: Optional[float]=None) -> Tuple[dict, dict]:
+    """Call fetch(key) for each key using a pool of threads. Return a
+       dictionary of the results and a dictionary of the errors (both keyed
+       by key). An exception raised by fetch only affects its own key. A call
+       that has been running for more than timeout seconds is abandoned and
+       recorded as a TimeoutError. The thread of an abandoned call cannot be
+       stopped so if every worker is stuck then the remaining keys are also
+       recorded as errors instead of waiting indefinitely.
+
+       The keys are started in order. If deadline (an epoch time) is given
+       then the keys that have not finished by then are recorded as a
+       DeferredError."""
+    keys = list(keys)
+    results, errors = {}, {}
+    if not keys:
+        return results, errors
+    workers = max(1, min(workers, len(keys)))
+    started = {}
+
+    def run(key):
+        started[key] = time()
+        return fetch(key)
+
+    executor = ThreadPoolExecutor(max_workers=workers)
+    futures = {executor.submit(run, key): key for key in keys}
+    pending = set(futures)
+    abandoned = []
+    poll = None if timeout is None else min(timeout, 0.5)
+    if deadline is not None and poll is None:
+        poll = 0.5
+    try:
+        while pending:
+            wait_time = poll
+            if deadline is not None:
+                wait_time = max(0, min(poll, deadline - time()))
+            done, pending = wait(pending, timeout=wait_time, return_when=FIRST_COMPLETED)
+            for future in done:
+                key = futures[future]
+                try:
+                    results[key] = future.result()
+                except Exception as e:
+                    errors[key] = e
+            if deadline is not None and pending and time() >= deadline:
+                for future in pending:
+                    errors[futures[future]] = DeferredError("deadline reached")
+                pending = set()
+            if timeout is None:
+                continue
+            now = time()
+            expired = {future for future in pending
+                       if futures[future] in started and
+                       now - started[futures[future]] > timeout}
+            for future in expired:
+                errors[futures[future]] = TimeoutError(f"no response after {timeout} seconds")
+            pending -= expired
+            abandoned.extend(expired)
+            if pending and sum(not future.done() for future in abandoned) >= workers:
+                for future in pending:
+                    errors[futures[future]] = TimeoutError("all workers are unresponsive")
+                pending = set()
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+    return results, errors
+
+
+def window_bucket(seconds: int, smallest: int=3600) -> int:
+    """Return the smallest window of smallest * 2**k seconds that covers
+       seconds. The running jobs are grouped by this window so that the range
+       of the queries of a short job does not depend on the oldest job."""
+    window = smallest
+    while window < seconds:
+        window *= 2
+    return window
+
+
+class PrometheusBatchClient:
+
+    """Retrieve the summary statistics of many running jobs on a cluster using
+       a fixed number of Prometheus queries (one per metric) instead of one
+       Jobstats call per job. The CPU metrics of the cgroup exporter carry a
+       jobid label so they are selected with a regular expression on jobid.
+       The GPU metrics of the NVIDIA exporter do not have a jobid label (the
+       jobid is the value of nvidia_gpu_jobId) so they are fetched as range
+       queries over the assigned GPUs and matched to nvidia_gpu_jobId by
+       instance, minor_number and timestamp.
+
+       The result has the same shape as the summary statistics that are
+       stored in the admincomment (see efficiency.py)."""
+
+    CPU_METRICS = {"total_time":   "cgroup_cpu_total_seconds",
+                   "cpus":         "cgroup_cpus",
+                   "used_memory":  "cgroup_memory_rss_bytes",
+                   "total_memory": "cgroup_memory_total_bytes"}
+    GPU_METRICS = {"gpu_utilization":  "nvidia_gpu_duty_cycle",
+                   "gpu_used_memory":  "nvidia_gpu_memory_used_bytes",
+                   "gpu_total_memory": "nvidia_gpu_memory_total_bytes"}
+
+    def __init__(self,
+                 prom_server: str,
+                 timeout: Optional[float]=60,
+                 max_points: int=10000) -> None:
+        self.prom_server = prom_server.rstrip("/")
+        self.timeout = timeout
+        self.max_points = max_points
+        self.num_queries = 0
+
+    def query(self, endpoint: str, params: dict) -> List[dict]:
+        """Make a POST request (the jobid regex can be long) to the HTTP API
+           and return the result of the query."""
+        data = urlencode(params).encode()
+        url = f"{self.prom_server}/api/v1/{endpoint}"
+        self.num_queries += 1
+        with urlopen(Request(url, data=data), timeout=self.timeout) as response:
+            body = json.loads(response.read())
+        if body.get("status") != "success":
+            raise RuntimeError(f"Prometheus query failed: {body.get('error')}")
+        return body["data"]["result"]
+
+    @staticmethod
+    def node_name(metric: dict) -> str:
+        return metric.get("instance", "").split(":")[0]
+
+    def cpu_stats(self,
+                  cluster: str,
+                  jobids: List[str],
+                  metrics: List[str],
+                  window_seconds: int,
+                  end: float) -> dict:
+        """Return {jobid: {node: {metric: value}}} for the CPU metrics."""
+        stats = {}
+        pattern = "|".join(jobids)
+        for name in metrics:
+            selector = (f'{self.CPU_METRICS[name]}{{cluster="{cluster}",'
+                        f'jobid=~"{pattern}",step="",task=""}}')
+            result = self.query("query", {"query": f"max_over_time({selector}[{window_seconds}s])",
+                                          "time": end})
+            for series in result:
+                jobid = series["metric"].get("jobid")
+                node = self.node_name(series["metric"])
+                value = float(series["value"][1])
+                if name == "cpus":
+                    value = int(value)
+                stats.setdefault(jobid, {}).setdefault(node, {})[name] = value
+        return stats
+
+    def gpu_stats(self,
+                  cluster: str,
+                  jobids: List[str],
+                  metrics: List[str],
+                  window_seconds: int,
+                  end: float) -> dict:
+        """Return {jobid: {node: {metric: {gpu: value}}}} for the GPU metrics.
+           The utilization is averaged and the memory is maximized over the
+           samples where the GPU was assigned to the job."""
+        start = end - window_seconds
+        step = max(30, -(-window_seconds // self.max_points))
+        params = {"start": start, "end": end, "step": step}
+        wanted = set(jobids)
+        owner = {}
+        result = self.query("query_range",
+                            {"query": f'nvidia_gpu_jobId{{cluster="{cluster}"}} > 0', **params})
+        for series in result:
+            node = self.node_name(series["metric"])
+            gpu = series["metric"].get("minor_number")
+            for ts, value in series["values"]:
+                jobid = str(int(float(value)))
+                if jobid in wanted:
+                    owner[(node, gpu, ts)] = jobid
+        stats = {}
+        for name in metrics:
+            selector = f'{self.GPU_METRICS[name]}{{cluster="{cluster}"}}'
+            result = self.query("query_range", {"query": selector, **params})
+            samples = {}
+            for series in result:
+                node = self.node_name(series["metric"])
+                gpu = series["metric"].get("minor_number")
+                for ts, value in series["values"]:
+                    jobid = owner.get((node, gpu, ts))
+                    if jobid is not None:
+                        samples.setdefault((jobid, node, gpu), []).append(float(value))
+            for (jobid, node, gpu), values in samples.items():
+                if name == "gpu_utilization":
+                    value = round(sum(values) / len(values), 1)
+                else:
+                    value = max(values)
+                stats.setdefault(jobid, {}).setdefault(node, {}).setdefault(name, {})[gpu] = value
+        return stats
+
+    def get_job_stats(self,
+                      cluster: str,
+                      jobids: Iterable[str],
+                      window_seconds: int,
+                      end: Optional[float]=None,
+                      metrics: Optional[List[str]]=None,
+                      elapsed: Optional[Dict[str, int]]=None) -> dict:
+        """Return a dictionary mapping jobid to the summary statistics of the
+           job over the last window_seconds before end (now by default). Jobs
+           without data are not included. Use metrics to only request some of
+           the metrics (e.g., ["gpu_utilization"]). The number of queries is
+           one per metric plus one for the GPU assignments. The total_time of
+           a job is window_seconds unless its run time is given in elapsed
+           (for jobs that started within the window)."""
+        jobids = sorted(set(str(jobid) for jobid in jobids))
+        if not jobids:
+            return {}
+        end = time() if end is None else end
+        window_seconds = max(1, int(window_seconds))
+        if metrics is None:
+            metrics = list(self.CPU_METRICS) + list(self.GPU_METRICS)
+        cpu_metrics = [name for name in metrics if name in self.CPU_METRICS]
+        gpu_metrics = [name for name in metrics if name in self.GPU_METRICS]
+        nodes = {}
+        if cpu_metrics:
+            nodes = self.cpu_stats(cluster, jobids, cpu_metrics, window_seconds, end)
+        if gpu_metrics:
+            gpu = self.gpu_stats(cluster, jobids, gpu_metrics, window_seconds, end)
+            for jobid, gpu_nodes in gpu.items():
+                for node, gpu_metrics_node in gpu_nodes.items():
+                    nodes.setdefault(jobid, {}).setdefault(node, {}).update(gpu_metrics_node)
+        stats = {}
+        for jobid, job_nodes in nodes.items():
+            num_gpus = sum(len(node.get("gpu_utilization", {})) for node in job_nodes.values())
+            total_time = window_seconds
+            if elapsed is not None and jobid in elapsed:
+                total_time = min(int(elapsed[jobid]), window_seconds)
+            stats[jobid] = {"gpus": num_gpus,
+                            "nodes": job_nodes,
+                            "total_time": total_time}
+        return stats
+
+
+class LiveStatsCache:
+
+    """Memoize the summary statistics of running jobs for a single run so
+       that the alerts with include_running_jobs (and the cancellation of
+       GPU jobs) query Prometheus at most once per job. The keys are
+       (cluster, jobid, window) where a window of None means the entire
+       run time of the job (one Jobstats call per job) and an integer is
+       the window in seconds of a batch query (see window_bucket). The
+       sliding windows of the cancellation of GPU jobs only retrieve the
+       GPU utilization so their window is ("gpu_utilization", seconds).
+       Failed queries are also memoized so that an unresponsive job does
+       not slow down every alert. Create a new instance for each run since
+       the statistics of running jobs change. The cache can be used from
+       several threads."""
+
+    def __init__(self) -> None:
+        self.results = {}
+        self.errors = {}
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.results) + len(self.errors)
+
+    def get_many(self,
+                 keys: Iterable[Tuple[str, str, Optional[int]]],
+                 fetch: Callable[[List[Tuple[str, str, Optional[int]]]], Tuple[dict, dict]],
+                 ) -> Tuple[dict, dict]:
+        """Return dictionaries of the results and errors for keys. The keys
+           that are not memoized are passed to fetch which must return
+           dictionaries of the results and errors keyed by key."""
+        keys = list(dict.fromkeys(keys))
+        with self.lock:
+            missing = [key for key in keys if key not in self.results and key not in self.errors]
+            self.hits += len(keys) - len(missing)
+            self.misses += len(missing)
+        if missing:
+            results, errors = fetch(missing)
+            with self.lock:
+                self.results.update(results)
+                self.errors.update(errors)
+        return ({key: self.results[key] for key in keys if key in self.results},
+                {key: self.errors[key] for key in keys if key in self.errors})
+
+    def report(self) -> str:
+        return (f"INFO: Live stats cache: {self.hits} hits and {self.misses} misses "
+                f"({len(self.errors)} failed)")
@@ -1,15 +1,29 @@
 """Abstract and concrete classes to get the raw job data."""
 
 import os
+import io
 import sys
+import tempfile
 import subprocess
 from time import time
 from datetime import datetime
+from datetime import timedelta
 from abc import ABC, abstractmethod
+from typing import Iterable
+from typing import Iterator
 from typing import List
+from typing import Optional
+from typing import Tuple
+from typing import Union
+from concurrent.futures import ThreadPoolExecutor
 import pandas as pd
 
 
+# sacct fields that are parsed as int64 by the Arrow parser if every value
+# is an integer (otherwise they are left as strings for the cleaner)
+INTEGER_FIELDS = ["cputimeraw", "elapsedraw", "nnodes", "ncpus"]
+
+
 class RawJobData(ABC):
 
     """Abstract base class to get the raw job data."""
@@ -23,19 +37,39 @@ class SlurmSacct(RawJobData):
 
     """Call sacct to get the raw job data from the Slurm database. Jobnames
        containing pipe or newline characters are handled. Newline characters
-       are handled by checking the count of the number of pipe characters."""
+       are handled by checking the count of the number of pipe characters.
+
+       If chunksize is greater than zero then the output of sacct is read
+       through a pipe line by line and dataframes of at most chunksize rows
+       are produced as the data arrives (see iter_job_data). This keeps the
+       peak memory bounded and allows cleaning to start before sacct
+       finishes.
+
+       The parser is either "python" or "arrow". The latter uses the
+       multithreaded CSV reader of pyarrow and produces Arrow-backed string
+       columns and int64 columns (see INTEGER_FIELDS).
+
+       Use states (e.g., "R") to only request jobs in those states."""
 
     def __init__(self,
                  start: datetime,
                  end: datetime,
                  fields: List[str],
                  clusters: str,
-                 partitions: str) -> None:
+                 partitions: str,
+                 chunksize: int=0,
+                 parser: str="python",
+                 states: str="") -> None:
         self.start_datetime = start
         self.end_datetime = end
         self.fields = ",".join(fields)
         self.clusters = clusters
         self.partitions = partitions
+        self.chunksize = chunksize
+        self.states = states
+        if parser not in ("python", "arrow"):
+            raise ValueError('Unknown sacct parser. Use either "python" or "arrow".')
+        self.parser = parser
 
     @staticmethod
     def datetime_to_sacct(dt: datetime) -> str:
@@ -44,40 +78,284 @@ class SlurmSacct(RawJobData):
         hms = dt.strftime('%H:%M:%S')
         return f"{ymd}T{hms}"
 
-    def get_job_data(self) -> pd.DataFrame:
-        """Return the sacct data in a pandas dataframe."""
-        # convert slurm timestamps to seconds
-        os.environ["SLURM_TIME_FORMAT"] = "%s"
-        sacct_start = self.datetime_to_sacct(self.start_datetime)
-        sacct_end   = self.datetime_to_sacct(self.end_datetime)
+    def sacct_command(self,
+                      start: Optional[datetime]=None,
+                      end: Optional[datetime]=None,
+                      clusters: Optional[str]=None) -> str:
+        """Return the sacct command as a string. The time window and clusters
+           of the object are used unless they are explicitly given."""
+        sacct_start = self.datetime_to_sacct(start or self.start_datetime)
+        sacct_end   = self.datetime_to_sacct(end or self.end_datetime)
         cmd = f"sacct -a -X -P -n -S {sacct_start} -E {sacct_end} "
-        cmd += f"-M {self.clusters} -o {self.fields}"
+        cmd += f"-M {clusters or self.clusters} -o {self.fields}"
         if self.partitions:
             cmd += f" -r {self.partitions}"
-        print("INFO: Calling sacct ... ", end="", flush=True)
-        start = time()
-        try:
-            result = subprocess.run(cmd,
-                                    stdout=subprocess.PIPE,
-                                    encoding="utf8",
-                                    check=True,
-                                    text=True,
-                                    shell=True)
-            result.check_returncode()
-        except subprocess.CalledProcessError as error:
-            msg = f"Error running sacct.\n{error.stderr}"
-            raise RuntimeError(msg) from error
-        print(f"done ({round(time() - start)} seconds).", flush=True)
-        rows = result.stdout.strip().split('\n')
+        if self.states:
+            cmd += f" -s {self.states}"
+        return cmd
+
+    def rows_to_dataframe(self, rows: Iterable[str]) -> pd.DataFrame:
+        """Split the pipe-delimited rows into a dataframe. Rows with too few
+           pipe characters come from newline characters in the jobname and
+           are dropped. Extra pipe characters in the jobname are ignored."""
+        if self.parser == "arrow":
+            return self.bytes_to_dataframe("\n".join(rows).encode("utf8"))
         cols = self.fields.split(",")
         raw = pd.DataFrame([row.split("|")[:len(cols)]
                            for row in rows if row.count("|") > len(cols) - 2])
-        if raw.empty:
+        if not raw.empty:
+            raw.columns = cols
+        return raw
+
+    def bytes_to_dataframe(self, data: bytes) -> pd.DataFrame:
+        """Parse the output of sacct using the CSV reader of pyarrow. Rows
+           with the wrong number of columns are rejected by the reader. These
+           are handled as in rows_to_dataframe: rows with extra pipe characters
+           in the jobname are truncated and the continuation lines of jobnames
+           with newline characters are dropped. The truncated rows are placed
+           after the other rows."""
+        import pyarrow as pa
+        import pyarrow.compute as pc
+        from pyarrow import csv
+        cols = self.fields.split(",")
+        if not data.strip():
+            return pd.DataFrame()
+        extra = []
+        def handle_invalid_row(row) -> str:
+            if row.actual_columns > row.expected_columns:
+                extra.append(row.text.split("|")[:len(cols)])
+            return "skip"
+        table = csv.read_csv(io.BytesIO(data),
+                             read_options=csv.ReadOptions(column_names=cols,
+                                                          use_threads=True),
+                             parse_options=csv.ParseOptions(delimiter="|",
+                                                            quote_char=False,
+                                                            double_quote=False,
+                                                            invalid_row_handler=handle_invalid_row),
+                             convert_options=csv.ConvertOptions(
+                                 column_types={col: pa.string() for col in cols},
+                                 strings_can_be_null=False))
+        if extra:
+            fallback = pa.table({col: pa.array([row[i] for row in extra], pa.string())
+                                 for i, col in enumerate(cols)})
+            table = pa.concat_tables([table, fallback])
+        for col in INTEGER_FIELDS:
+            if col in cols:
+                try:
+                    integers = pc.cast(table[col], pa.int64())
+                except (pa.ArrowInvalid, pa.ArrowNotImplementedError):
+                    continue
+                table = table.set_column(cols.index(col), col, integers)
+        raw = table.to_pandas(types_mapper={pa.string(): pd.StringDtype("pyarrow")}.get)
+        return raw if len(raw) else pd.DataFrame()
+
+    @staticmethod
+    def exit_if_empty(num_rows: int) -> None:
+        """Exit if sacct did not return any job data."""
+        if num_rows == 0:
             msg = ("\nCall to sacct resulted in no job data. If this is surprising\n"
                    "then check the spelling of your cluster and/or partition names\n"
                    "in config.yml and -M <clusters> -r <partition>. Try running again\n"
                    "using the only option --usage-overview to see what is available.")
             print(msg)
             sys.exit()
-        raw.columns = cols
+
+    @staticmethod
+    def call_sacct(cmd: str, binary: bool=False) -> Union[str, bytes]:
+        """Run sacct and return its output (as bytes if binary is True)."""
+        try:
+            result = subprocess.run(cmd,
+                                    stdout=subprocess.PIPE,
+                                    stderr=subprocess.PIPE,
+                                    encoding=None if binary else "utf8",
+                                    check=True,
+                                    text=not binary,
+                                    shell=True)
+        except subprocess.CalledProcessError as error:
+            stderr = error.stderr.decode("utf8", "replace") if binary else error.stderr
+            msg = f"Error running sacct.\n{stderr}"
+            raise RuntimeError(msg) from error
+        return result.stdout
+
+    def get_job_data(self) -> pd.DataFrame:
+        """Return the sacct data in a pandas dataframe. The whole dataframe is
+           returned so chunksize is not used here. Use iter_job_data with
+           clean_chunks to keep only the cleaned chunks in memory."""
+        # convert slurm timestamps to seconds
+        os.environ["SLURM_TIME_FORMAT"] = "%s"
+        cmd = self.sacct_command()
+        print("INFO: Calling sacct ... ", end="", flush=True)
+        start = time()
+        stdout = self.call_sacct(cmd, binary=self.parser == "arrow")
+        print(f"done ({round(time() - start)} seconds).", flush=True)
+        raw = self.parse(stdout)
+        self.exit_if_empty(len(raw))
+        return raw
+
+    def parse(self, stdout: Union[str, bytes]) -> pd.DataFrame:
+        """Return the output of sacct as a dataframe."""
+        if self.parser == "arrow":
+            return self.bytes_to_dataframe(stdout)
+        return self.rows_to_dataframe(stdout.strip().split('\n'))
+
+    def iter_job_data(self) -> Iterator[pd.DataFrame]:
+        """Yield the sacct data as dataframes of at most chunksize rows while
+           sacct is still running. Only one chunk of rows is held in memory
+           at a time by this method."""
+        os.environ["SLURM_TIME_FORMAT"] = "%s"
+        cmd = self.sacct_command()
+        chunksize = self.chunksize if self.chunksize > 0 else 100000
+        print("INFO: Streaming sacct data ... ", flush=True)
+        start = time()
+        num_rows = 0
+        num_chunks = 0
+        # stderr goes to a file since a full stderr pipe would block sacct
+        # while stdout is being read
+        with tempfile.TemporaryFile(mode="w+", encoding="utf8") as err, \
+             subprocess.Popen(cmd,
+                              stdout=subprocess.PIPE,
+                              stderr=err,
+                              encoding="utf8",
+                              text=True,
+                              shell=True) as proc:
+            rows = []
+            for line in proc.stdout:
+                rows.append(line.rstrip("\n"))
+                if len(rows) == chunksize:
+                    chunk = self.rows_to_dataframe(rows)
+                    rows = []
+                    if not chunk.empty:
+                        num_rows += len(chunk)
+                        num_chunks += 1
+                        yield chunk
+            chunk = self.rows_to_dataframe(rows)
+            del rows
+            if not chunk.empty:
+                num_rows += len(chunk)
+                num_chunks += 1
+                yield chunk
+            if proc.wait() != 0:
+                err.seek(0)
+                raise RuntimeError(f"Error running sacct.\n{err.read()}")
+        secs = round(time() - start)
+        print(f"INFO: Streamed {num_rows} jobs from sacct in {num_chunks} chunks "
+              f"({secs} seconds).", flush=True)
+        self.exit_if_empty(num_rows)
+
+
+class SlurmSacctSharded(SlurmSacct):
+
+    """Split the time window into sub-windows of shard_hours and optionally
+       split the clusters given by -M. The sacct calls for the shards are
+       made concurrently using at most max_workers threads. This is useful
+       since slurmdbd serves a single large query on one thread. Jobs that
+       ran across the boundary of two sub-windows are returned by both calls
+       so duplicates are removed by cluster and jobid."""
+
+    def __init__(self,
+                 start: datetime,
+                 end: datetime,
+                 fields: List[str],
+                 clusters: str,
+                 partitions: str,
+                 shard_hours: float,
+                 max_workers: int=4,
+                 shard_by_cluster: bool=False,
+                 parser: str="python") -> None:
+        super().__init__(start, end, fields, clusters, partitions, parser=parser)
+        self.shard_hours = shard_hours
+        self.max_workers = max(1, max_workers)
+        self.shard_by_cluster = shard_by_cluster
+
+    def shard_windows(self) -> List[Tuple[datetime, datetime]]:
+        """Return the list of (start, end) sub-windows."""
+        width = timedelta(hours=self.shard_hours)
+        windows = []
+        lower = self.start_datetime
+        while lower < self.end_datetime:
+            upper = min(lower + width, self.end_datetime)
+            windows.append((lower, upper))
+            lower = upper
+        return windows if windows else [(self.start_datetime, self.end_datetime)]
+
+    def shard_clusters(self) -> List[str]:
+        """Return the list of cluster specifications for -M. The clusters are
+           only split when they are given explicitly (i.e., not all)."""
+        clusters = [c.strip() for c in self.clusters.split(",") if c.strip()]
+        if not self.shard_by_cluster or "all" in clusters or not clusters:
+            return [self.clusters]
+        return clusters
+
+    def get_shard(self, shard: Tuple[datetime, datetime, str]) -> pd.DataFrame:
+        """Return the sacct data for one shard."""
+        start, end, clusters = shard
+        stdout = self.call_sacct(self.sacct_command(start, end, clusters),
+                                 binary=self.parser == "arrow")
+        return self.parse(stdout)
+
+    def get_job_data(self) -> pd.DataFrame:
+        """Return the merged sacct data of all of the shards."""
+        os.environ["SLURM_TIME_FORMAT"] = "%s"
+        shards = [(lower, upper, clusters)
+                  for clusters in self.shard_clusters()
+                  for lower, upper in self.shard_windows()]
+        workers = min(self.max_workers, len(shards))
+        print(f"INFO: Calling sacct with {len(shards)} shards and {workers} workers ... ",
+              end="",
+              flush=True)
+        start = time()
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            frames = list(executor.map(self.get_shard, shards))
+        print(f"done ({round(time() - start)} seconds).", flush=True)
+        frames = [frame for frame in frames if not frame.empty]
+        self.exit_if_empty(len(frames))
+        raw = pd.concat(frames, ignore_index=True)
+        keys = [col for col in ("cluster", "jobid") if col in raw.columns]
+        num_rows = len(raw)
+        raw = raw.drop_duplicates(subset=keys if len(keys) == 2 else None)
+        raw = raw.reset_index(drop=True)
+        if num_rows != len(raw):
+            print(f"INFO: Removed {num_rows - len(raw)} jobs found in multiple shards")
+        return raw
+
+
+class SlurmRunningJobs(SlurmSacct):
+
+    """Call sacct for the jobs that are running now (-s R with the time
+       window set to now). This is all that the cancellation of GPU jobs
+       needs so the call is much cheaper than the call over --days. The
+       admincomment field is not requested since the summary statistics
+       of running jobs come from the Prometheus server. If admincomment is
+       in fields then an empty admincomment column is added instead (it is
+       not in fields when the summary statistics come from an external
+       database).
+
+       If allow_empty is True then an empty dataframe is returned when no
+       jobs are running instead of exiting (used by the daemon)."""
+
+    def __init__(self,
+                 fields: List[str],
+                 clusters: str,
+                 partitions: str,
+                 parser: str="python",
+                 allow_empty: bool=False) -> None:
+        now = datetime.now()
+        self.add_admincomment = "admincomment" in fields
+        fields = [field for field in fields if field != "admincomment"]
+        super().__init__(now, now, fields, clusters, partitions, parser=parser, states="R")
+        self.allow_empty = allow_empty
+
+    def get_job_data(self) -> pd.DataFrame:
+        """Return the sacct data of the running jobs in a pandas dataframe."""
+        os.environ["SLURM_TIME_FORMAT"] = "%s"
+        print("INFO: Calling sacct for the running jobs ... ", end="", flush=True)
+        start = time()
+        stdout = self.call_sacct(self.sacct_command(), binary=self.parser == "arrow")
+        print(f"done ({round(time() - start)} seconds).", flush=True)
+        raw = self.parse(stdout)
+        if raw.empty and self.allow_empty:
+            return raw
+        self.exit_if_empty(len(raw))
+        if self.add_admincomment:
+            raw["admincomment"] = ""
         return raw
@@ -0,0 +1,106 @@
+"""State of the sliding-window cancellation of GPU jobs with zero utilization."""
+
+import os
+import sqlite3
+from typing import Dict
+from typing import Iterable
+from typing import List
+from typing import Tuple
+import pandas as pd
+
+
+class SlidingWindowStore:
+
+    """Store the time when each running GPU job was last checked and its
+       number of idle GPUs in a SQLite database keyed by jobid. The entries
+       are loaded into a dictionary once per run for constant-time lookups.
+       Only the jobs that were checked are written back and the jobs that
+       are no longer running are evicted. The CSV file that was used by
+       previous versions is imported when the database does not exist."""
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        is_new = not os.path.exists(path)
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS sliding ("
+                          "jobid TEXT PRIMARY KEY, "
+                          "checked_time INTEGER NOT NULL, "
+                          "idle_gpus INTEGER NOT NULL) WITHOUT ROWID")
+        self.conn.commit()
+        csv_file = os.path.splitext(path)[0] + ".csv"
+        if is_new and os.path.isfile(csv_file):
+            old = pd.read_csv(csv_file, dtype={"jobid":str,
+                                               "checked_time":"int64",
+                                               "idle_gpus":"int64"})
+            self.update(zip(old.jobid, old.checked_time, old.idle_gpus))
+
+    def __len__(self) -> int:
+        return self.conn.execute("SELECT COUNT(*) FROM sliding").fetchone()[0]
+
+    def close(self) -> None:
+        self.conn.close()
+
+    def load(self) -> Dict[str, Tuple[int, int]]:
+        """Return a dictionary mapping jobid to (checked_time, idle_gpus)."""
+        rows = self.conn.execute("SELECT jobid, checked_time, idle_gpus FROM sliding")
+        return {jobid: (checked_time, idle_gpus) for jobid, checked_time, idle_gpus in rows}
+
+    def update(self, rows: Iterable[Tuple[str, int, int]]) -> None:
+        """Insert or replace the (jobid, checked_time, idle_gpus) rows."""
+        self.conn.executemany("INSERT OR REPLACE INTO sliding VALUES (?, ?, ?)",
+                              ((str(jobid), int(checked_time), int(idle_gpus))
+                               for jobid, checked_time, idle_gpus in rows))
+        self.conn.commit()
+
+    def evict(self, running: Iterable[str]) -> int:
+        """Remove the jobs that are not in running. Return the number of
+           entries removed."""
+        self.conn.execute("CREATE TEMP TABLE IF NOT EXISTS running (jobid TEXT PRIMARY KEY)")
+        self.conn.execute("DELETE FROM running")
+        self.conn.executemany("INSERT OR IGNORE INTO running VALUES (?)",
+                              ((str(jobid),) for jobid in running))
+        removed = self.conn.execute("DELETE FROM sliding WHERE jobid NOT IN "
+                                    "(SELECT jobid FROM running)").rowcount
+        self.conn.execute("DELETE FROM running")
+        self.conn.commit()
+        return removed
+
+
+# priorities of the sliding-window checks (lower is more urgent)
+CANCEL_CHECK = 0
+NEW_CHECK = 1
+RECHECK = 2
+
+
+def plan_sliding_checks(jobs: Iterable[Tuple[str, int]],
+                        state: Dict[str, Tuple[int, int]],
+                        now: int,
+                        warning_seconds: int,
+                        cancel_seconds: int,
+                        warning_frac: float) -> Tuple[List[tuple], List[list]]:
+    """Return the checks that are due and the state of the jobs that do not
+       need to be checked. Each check is (priority, jobid, num_gpus, window)
+       and the checks are sorted by urgency: jobs that were warned and are
+       due for the cancellation check (longest waiting first), then jobs that
+       have not been seen before (in the given order), then the re-checks of
+       jobs that were using their GPUs (longest waiting first)."""
+    checks, unchanged = [], []
+    for order, (jobid, num_gpus) in enumerate(jobs):
+        if jobid not in state:
+            checks.append((NEW_CHECK, order, jobid, num_gpus, warning_seconds))
+            continue
+        time_prev, n_prev = state[jobid]
+        if n_prev == 0:
+            if now - time_prev >= warning_frac * warning_seconds:
+                checks.append((RECHECK, time_prev, jobid, num_gpus, warning_seconds))
+            else:
+                unchanged.append([jobid, time_prev, n_prev])
+        else:
+            if now - time_prev >= cancel_seconds - warning_seconds:
+                checks.append((CANCEL_CHECK, time_prev, jobid, num_gpus, cancel_seconds))
+            else:
+                unchanged.append([jobid, time_prev, n_prev])
+    checks.sort(key=lambda check: check[:2])
+    return [(priority, jobid, num_gpus, window)
+            for priority, _, jobid, num_gpus, window in checks], unchanged
@@ -0,0 +1,155 @@
+"""An on-disk cache of the decoded summary statistics of finished jobs."""
+
+import os
+import json
+import sqlite3
+from time import time
+from typing import Callable
+from typing import Optional
+import pandas as pd
+
+
+class StatsCache:
+
+    """Store the decoded summary statistics (admincomment) of finished jobs
+       in a SQLite database keyed by (cluster, jobidraw). The summary
+       statistics of a finished job never change so each job only needs to
+       be decoded once. Running jobs are always decoded.
+
+       Entries that were added more than max_age_days ago are removed. If
+       the database is larger than max_size_mb then the oldest entries are
+       removed until it is below 80% of that size. The statistics are stored
+       as JSON since they are plain dictionaries. A database written by a
+       version that stored pickles is emptied (see VERSION)."""
+
+    # PRAGMA user_version of the database (1 for JSON)
+    VERSION = 1
+
+    def __init__(self,
+                 path: str,
+                 max_age_days: Optional[float]=None,
+                 max_size_mb: Optional[float]=None) -> None:
+        self.path = path
+        self.max_age_days = max_age_days
+        self.max_size_mb = max_size_mb
+        parent = os.path.dirname(os.path.abspath(path))
+        os.makedirs(parent, exist_ok=True)
+        if not os.path.exists(path):
+            os.close(os.open(path, os.O_CREAT | os.O_WRONLY, 0o600))
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        if self.conn.execute("PRAGMA user_version").fetchone()[0] != self.VERSION:
+            self.conn.execute("DROP TABLE IF EXISTS stats")
+            self.conn.execute(f"PRAGMA user_version = {self.VERSION}")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS stats ("
+                          "cluster TEXT NOT NULL, "
+                          "jobidraw TEXT NOT NULL, "
+                          "added REAL NOT NULL, "
+                          "ss TEXT NOT NULL, "
+                          "PRIMARY KEY (cluster, jobidraw)) WITHOUT ROWID")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS stats_added ON stats (added)")
+        self.conn.commit()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return self.conn.execute("SELECT COUNT(*) FROM stats").fetchone()[0]
+
+    def close(self) -> None:
+        self.conn.close()
+
+    def reconnect(self) -> None:
+        """Close the connection and open a new one to the database. A
+           connection must not be used by a forked process so the worker
+           processes call this."""
+        self.conn.close()
+        self.conn = sqlite3.connect(self.path, timeout=60)
+
+    def clear(self) -> None:
+        """Remove all of the entries (used by --rebuild-stats-cache)."""
+        self.conn.execute("DELETE FROM stats")
+        self.conn.commit()
+        self.conn.execute("VACUUM")
+
+    def lookup(self, keys: pd.DataFrame) -> dict:
+        """Return a dictionary mapping (cluster, jobidraw) to the summary
+           statistics for the keys that are in the cache."""
+        if keys.empty:
+            return {}
+        self.conn.execute("CREATE TEMP TABLE IF NOT EXISTS wanted "
+                          "(cluster TEXT, jobidraw TEXT)")
+        self.conn.execute("DELETE FROM wanted")
+        self.conn.executemany("INSERT INTO wanted VALUES (?, ?)",
+                              zip(keys.cluster.astype(str), keys.jobidraw.astype(str)))
+        rows = self.conn.execute("SELECT s.cluster, s.jobidraw, s.ss FROM stats s "
+                                 "JOIN wanted w ON s.cluster = w.cluster AND "
+                                 "s.jobidraw = w.jobidraw")
+        found = {(cluster, jobidraw): json.loads(ss) for cluster, jobidraw, ss in rows}
+        self.conn.execute("DELETE FROM wanted")
+        return found
+
+    def store(self, jobs: pd.DataFrame) -> None:
+        """Insert the summary statistics (in the admincomment column) of the
+           finished jobs."""
+        now = time()
+        self.conn.executemany("INSERT OR REPLACE INTO stats VALUES (?, ?, ?, ?)",
+                              ((str(cluster), str(jobidraw), now, json.dumps(ss))
+                               for cluster, jobidraw, ss in zip(jobs.cluster,
+                                                                jobs.jobidraw,
+                                                                jobs.admincomment)))
+        self.conn.commit()
+
+    def evict(self) -> int:
+        """Remove the entries that are too old or that make the database too
+           large. Return the number of entries removed."""
+        removed = 0
+        if self.max_age_days:
+            oldest = time() - self.max_age_days * 24 * 3600
+            removed += self.conn.execute("DELETE FROM stats WHERE added < ?",
+                                         (oldest,)).rowcount
+            self.conn.commit()
+        if self.max_size_mb:
+            page_size = self.conn.execute("PRAGMA page_size").fetchone()[0]
+            pages = self.conn.execute("PRAGMA page_count").fetchone()[0]
+            free = self.conn.execute("PRAGMA freelist_count").fetchone()[0]
+            size_mb = (pages - free) * page_size / 1024**2
+            if size_mb > self.max_size_mb:
+                num_rows = len(self)
+                num_remove = int(num_rows * (1 - 0.8 * self.max_size_mb / size_mb)) + 1
+                removed += self.conn.execute("DELETE FROM stats WHERE (cluster, jobidraw) IN "
+                                             "(SELECT cluster, jobidraw FROM stats "
+                                             "ORDER BY added LIMIT ?)",
+                                             (num_remove,)).rowcount
+                self.conn.commit()
+                self.conn.execute("VACUUM")
+        return removed
+
+    def get_stats_dicts(self,
+                        df: pd.DataFrame,
+                        decode: Callable[[pd.Series], pd.Series]) -> pd.Series:
+        """Return the decoded admincomment column of df. The summary statistics
+           of finished jobs are taken from the cache when available. The other
+           jobs are decoded using decode and the finished jobs with summary
+           statistics are added to the cache. The counts are kept in hits and
+           misses (see report). Call evict when done."""
+        finished = (df.state != "RUNNING") & (df.state != "PENDING")
+        found = self.lookup(df.loc[finished, ["cluster", "jobidraw"]])
+        keys = list(zip(df.cluster.astype(str), df.jobidraw.astype(str)))
+        cached = pd.Series([key in found for key in keys], index=df.index) & finished
+        decoded = decode(df.loc[~cached, "admincomment"])
+        new = df.loc[~cached & finished, ["cluster", "jobidraw"]].copy()
+        new["admincomment"] = decoded[new.index]
+        self.store(new[new.admincomment.apply(bool)])
+        decoded_iter = iter(decoded)
+        stats = pd.Series([found[key] if hit else next(decoded_iter)
+                           for key, hit in zip(keys, cached)],
+                          index=df.index,
+                          name=df.admincomment.name,
+                          dtype=object)
+        self.hits += int(cached.sum())
+        self.misses += len(decoded)
+        return stats
+
+    def report(self) -> str:
+        return (f"INFO: Stats cache served {self.hits} jobs and decoded "
+                f"{self.misses} jobs")
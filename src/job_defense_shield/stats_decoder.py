@@ -0,0 +1,55 @@
+"""Decode the summary statistics of the jobs on demand."""
+
+from typing import Callable
+from typing import Optional
+import pandas as pd
+
+
+class StatsDecoder:
+
+    """Decode the admincomment of the jobs in the job dataframe only when an
+       alert needs them. The alerts call Alert.decode_admincomment after their
+       cheap filters (cluster, partition, state, ...) so the jobs that are
+       removed by the filters of every alert are never decoded. The decoded
+       summary statistics are memoized by the index label of the job so each
+       job is decoded at most once per run.
+
+       The index of jobs must be unique and the alerts must not change the
+       index before calling decode. The optional stats cache (see StatsCache)
+       is used for the jobs that have not been decoded yet."""
+
+    def __init__(self,
+                 jobs: pd.DataFrame,
+                 decode: Callable[[pd.Series], pd.Series],
+                 stats_cache: Optional[object]=None) -> None:
+        if not jobs.index.is_unique:
+            raise ValueError("The index of the job dataframe must be unique.")
+        cols = [col for col in ("cluster", "jobidraw", "state", "admincomment")
+                if col in jobs.columns]
+        self.jobs = jobs[cols].copy()
+        self.decode_func = decode
+        self.stats_cache = stats_cache
+        self.decoded = {}
+
+    def __len__(self) -> int:
+        return len(self.decoded)
+
+    def decode(self, frame: pd.DataFrame) -> pd.Series:
+        """Return the decoded admincomment of the jobs in frame. Values that
+           are already decoded (e.g., from the Prometheus server for running
+           jobs) are returned unchanged."""
+        encoded = [not isinstance(ss, dict) for ss in frame.admincomment]
+        todo = [label for label, enc in zip(frame.index, encoded)
+                if enc and label not in self.decoded]
+        if todo:
+            subset = self.jobs.loc[todo]
+            if self.stats_cache is not None:
+                stats = self.stats_cache.get_stats_dicts(subset, self.decode_func)
+            else:
+                stats = self.decode_func(subset["admincomment"])
+            self.decoded.update(zip(todo, stats))
+        return pd.Series([self.decoded[label] if enc else ss
+                          for label, enc, ss in zip(frame.index, encoded, frame.admincomment)],
+                         index=frame.index,
+                         name="admincomment",
+                         dtype=object)
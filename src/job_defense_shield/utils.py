@@ -22,6 +22,36 @@ SECONDS_PER_HOUR = 3600
 MINUTES_PER_HOUR = 60
 HOURS_PER_DAY = 24
 
+# low-cardinality fields that are stored as categoricals (see optimize_dtypes)
+CATEGORICAL_FIELDS = ["cluster", "partition", "qos", "user", "state", "account"]
+# smallest factor that the counts can be multiplied by without overflow (see
+# optimize_dtypes)
+COUNT_HEADROOM = 1024
+
+# fields of the sacct call (jobname must be last to catch "|" characters)
+SACCT_FIELDS = ["jobid",
+                "user",
+                "cluster",
+                "account",
+                "partition",
+                "cputimeraw",
+                "elapsedraw",
+                "timelimitraw",
+                "nnodes",
+                "ncpus",
+                "alloctres",
+                "submit",
+                "eligible",
+                "start",
+                "end",
+                "qos",
+                "state",
+                "jobname"]
+FIELD_RENAMINGS = {"cputimeraw":"cpu-seconds",
+                   "nnodes":"nodes",
+                   "ncpus":"cores",
+                   "timelimitraw":"limit-minutes"}
+
 # slurm job states
 states = {
   'BF'  :'BOOT_FAIL',
@@ -42,12 +72,27 @@ states = {
   }
 JOBSTATES = dict(zip(states.values(), states.keys()))
 
-def show_history_of_emails_sent(vpath, mydir, title, day_ticks) -> None:
-    """Display the history of emails sent to users."""
-    files = sorted(glob.glob(f"{vpath}/{mydir}/*.csv"))
-    if len(files) == 0:
-        print(f"No underutilization files found in {vpath}/{mydir}")
-        return None
+def add_to_sys_path(*paths: Optional[str]) -> None:
+    """Put the paths to the Jobstats module and config.py at the front of
+       sys.path. A path that is already in sys.path is not added again so
+       that sys.path does not grow in a long-running process (--daemon)."""
+    for path in paths:
+        if path and path not in sys.path:
+            sys.path.insert(0, path)
+
+def show_history_of_emails_sent(vpath, mydir, title, day_ticks, store=None) -> None:
+    """Display the history of emails sent to users. The violation logs are
+       read from store (a ViolationStore) if it is given."""
+    if store is not None:
+        files = store.users(mydir)
+        if len(files) == 0:
+            print(f"No underutilization entries found for {mydir} in {store.path}")
+            return None
+    else:
+        files = sorted(glob.glob(f"{vpath}/{mydir}/*.csv"))
+        if len(files) == 0:
+            print(f"No underutilization files found in {vpath}/{mydir}")
+            return None
     max_netid = max([len(f.split("/")[-1].split(".")[0]) for f in files])
     title += " (EMAILS SENT)"
     width = max(len(title), max_netid + day_ticks + 1)
@@ -62,7 +107,10 @@ def show_history_of_emails_sent(vpath, mydir, title, day_ticks) -> None:
     today = datetime.now().date()
     for f in files:
         netid = f.split("/")[-1].split(".")[0]
-        df = pd.read_csv(f, parse_dates=["Email-Sent"], date_format="mixed", dayfirst=False)
+        if store is not None:
+            df = store.read(mydir, f)
+        else:
+            df = pd.read_csv(f, parse_dates=["Email-Sent"], date_format="mixed", dayfirst=False)
         df["when"] = df["Email-Sent"].apply(lambda x: x.date())
         hits = df.when.unique()
         row = []
@@ -84,7 +132,10 @@ def show_history_of_emails_sent(vpath, mydir, title, day_ticks) -> None:
     print("\n" + "=" * width)
     print(f"Number of X: {X}")
     print(f"Number of users: {num_users}")
-    print(f"Violation files: {vpath}/{mydir}/\n")
+    if store is not None:
+        print(f"Violation store: {store.path}\n")
+    else:
+        print(f"Violation files: {vpath}/{mydir}/\n")
     return None
 
 def seconds_to_slurm_time_format(seconds: int) -> str:
@@ -182,6 +233,50 @@ def read_config_file(config_file: Optional[str],
         cfg["show-empty-reports"] = False
     if "partition-renamings" not in cfg:
         cfg["partition-renamings"] = {}
+    if "sacct-chunk-size" not in cfg:
+        cfg["sacct-chunk-size"] = 0
+    if "sacct-parser" not in cfg:
+        cfg["sacct-parser"] = "python"
+    if "sacct-cleaner" not in cfg:
+        cfg["sacct-cleaner"] = "rowwise"
+    if "sacct-shard-hours" not in cfg:
+        cfg["sacct-shard-hours"] = 0
+    if "sacct-shard-workers" not in cfg:
+        cfg["sacct-shard-workers"] = 4
+    if "sacct-shard-by-cluster" not in cfg:
+        cfg["sacct-shard-by-cluster"] = False
+    if "job-history-path" not in cfg:
+        cfg["job-history-path"] = None
+    if "job-history-overlap-minutes" not in cfg:
+        cfg["job-history-overlap-minutes"] = 10
+    if "job-history-retention-days" not in cfg:
+        cfg["job-history-retention-days"] = None
+    if "optimize-dtypes" not in cfg:
+        cfg["optimize-dtypes"] = False
+    if "decode-workers" not in cfg:
+        cfg["decode-workers"] = 1
+    if "decode-min-jobs" not in cfg:
+        cfg["decode-min-jobs"] = 20000
+    if "stats-cache-path" not in cfg:
+        cfg["stats-cache-path"] = None
+    if "stats-cache-max-age-days" not in cfg:
+        cfg["stats-cache-max-age-days"] = 90
+    if "stats-cache-max-size-mb" not in cfg:
+        cfg["stats-cache-max-size-mb"] = None
+    if "prometheus-workers" not in cfg:
+        cfg["prometheus-workers"] = 8
+    if "prometheus-timeout" not in cfg:
+        cfg["prometheus-timeout"] = 60
+    if "prometheus-batch" not in cfg:
+        cfg["prometheus-batch"] = False
+    if "daemon-checkpoint-ticks" not in cfg:
+        cfg["daemon-checkpoint-ticks"] = 4
+    if "alert-workers" not in cfg:
+        cfg["alert-workers"] = 1
+    if "copy-on-write" not in cfg:
+        cfg["copy-on-write"] = False
+    if "violation-store-path" not in cfg:
+        cfg["violation-store-path"] = None
     if "smtp-server" not in cfg:
         cfg["smtp-server"] = None
     if "smtp-user" not in cfg:
@@ -234,6 +329,10 @@ def read_config_file(config_file: Optional[str],
                "smtp_password":        cfg["smtp-password"],
                "smtp_port":            cfg["smtp-port"],
                "show_empty_reports":   cfg["show-empty-reports"],
+               "violation_store_path": cfg["violation-store-path"],
+               "prometheus_workers":   cfg["prometheus-workers"],
+               "prometheus_timeout":   cfg["prometheus-timeout"],
+               "prometheus_batch":     cfg["prometheus-batch"],
                "ldap":                 ldap_params}
     return cfg, sys_cfg, head
 
@@ -322,6 +421,75 @@ def add_new_and_derived_fields(df: pd.DataFrame) -> pd.DataFrame:
     df["gpu-hours"] = df["gpu-seconds"] / SECONDS_PER_HOUR
     return df
 
+def merge_external_summary_stats(df: pd.DataFrame,
+                                 df_ext: pd.DataFrame) -> pd.DataFrame:
+    """Add the summary statistics of an external database (the columns
+       jobid, cluster and admin_comment) as the admincomment column. The
+       jobs are matched on jobidraw and cluster. The sacct data must not
+       have an admincomment column."""
+    df_ext = df_ext.astype({"jobid":"str"})
+    df = df.astype({"jobidraw":"str"})
+    df = pd.merge(df,
+                  df_ext,
+                  left_on=['jobidraw', 'cluster'],
+                  right_on=['jobid', 'cluster'],
+                  how="left")
+    df.drop(columns="jobid_y", inplace=True)
+    df.rename(columns={"admin_comment": "admincomment",
+                       "jobid_x": "jobid"}, inplace=True)
+    return df
+
+def copy_on_write_enabled() -> bool:
+    """Return True if pandas copy-on-write is enabled (it is always enabled
+       with pandas 3)."""
+    if int(pd.__version__.split(".")[0]) >= 3:
+        return True
+    return pd.get_option("mode.copy_on_write") is True
+
+def enable_copy_on_write() -> None:
+    """Enable pandas copy-on-write (only needed with pandas 2)."""
+    if not copy_on_write_enabled():
+        pd.set_option("mode.copy_on_write", True)
+
+def smallest_int_dtype(low: int, high: int) -> Optional[str]:
+    """Return the smallest signed integer dtype that holds low and high (None
+       if only int64 does)."""
+    for dtype in ["int8", "int16", "int32"]:
+        info = np.iinfo(dtype)
+        if low >= info.min and high <= info.max:
+            return dtype
+    return None
+
+def optimize_dtypes(df: pd.DataFrame) -> pd.DataFrame:
+    """Convert the low-cardinality string columns to categoricals and
+       downcast the integer columns. The counts (cores, nodes, gpus) are
+       multiplied with each other and with the thresholds of the alerts
+       (e.g., cores-per-gpu-limit * gpus) and NumPy keeps the dtype of the
+       column for a product with a Python integer. Each count is therefore
+       downcast to the smallest dtype that holds its values times the largest
+       count (at least COUNT_HEADROOM). elapsedraw is only downcast to int32
+       if its product with the counts fits. The derived fields (e.g.,
+       cpu-seconds) must be computed before calling this function."""
+    for col in CATEGORICAL_FIELDS:
+        if col in df.columns and not isinstance(df[col].dtype, pd.CategoricalDtype):
+            df[col] = df[col].astype("category")
+    if df.empty:
+        return df
+    counts = [col for col in ["cores", "nodes", "gpus"]
+              if col in df.columns and pd.api.types.is_integer_dtype(df[col].dtype)]
+    max_count = max([int(df[col].abs().max()) for col in counts] + [1])
+    factor = max(max_count, COUNT_HEADROOM)
+    for col in counts:
+        dtype = smallest_int_dtype(int(df[col].min()) * factor, int(df[col].max()) * factor)
+        if dtype is not None:
+            df[col] = df[col].astype(dtype)
+    if "elapsedraw" in df.columns:
+        elapsed = df["elapsedraw"]
+        if pd.api.types.is_integer_dtype(elapsed.dtype) and elapsed.min() >= 0 and \
+           int(elapsed.max()) * max_count <= np.iinfo(np.int32).max:
+            df["elapsedraw"] = elapsed.astype("int32")
+    return df
+
 def add_dividers(df_str: str,
                  title: str="",
                  pre: str="\n\n\n",
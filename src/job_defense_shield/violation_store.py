@@ -0,0 +1,119 @@
+"""A single-file store of the violation logs (the history of emails sent)."""
+
+import os
+import glob
+import json
+import sqlite3
+from typing import List
+from typing import Optional
+from typing import Tuple
+import pandas as pd
+
+
+class ViolationStore:
+
+    """Store the violation logs in a SQLite database instead of one CSV file
+       per user and violation under violation-logs-path. Each row of the
+       database is one row of a CSV file (i.e., one job or one user for
+       which an email was sent). The rows are indexed by (violation, user,
+       cluster, alert-partitions) so the emails sent to a user are found
+       without opening a file per user. The rows are stored as JSON since
+       the columns differ between the alerts.
+
+       The default rollback journal is used instead of WAL since the
+       database is usually on a shared (NFS) filesystem. Identical rows are
+       only stored once which makes import_csv_tree safe to run again."""
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        parent = os.path.dirname(os.path.abspath(path))
+        os.makedirs(parent, exist_ok=True)
+        self.conn = sqlite3.connect(path, timeout=60)
+        self.conn.execute("CREATE TABLE IF NOT EXISTS violations ("
+                          "violation TEXT NOT NULL, "
+                          "user TEXT NOT NULL, "
+                          "cluster TEXT NOT NULL, "
+                          "alert_partitions TEXT NOT NULL, "
+                          "email_sent REAL NOT NULL, "
+                          "record TEXT NOT NULL, "
+                          "UNIQUE (violation, user, record))")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS violations_key ON violations "
+                          "(violation, user, cluster, alert_partitions, email_sent)")
+        self.conn.commit()
+
+    def __len__(self) -> int:
+        return self.conn.execute("SELECT COUNT(*) FROM violations").fetchone()[0]
+
+    def close(self) -> None:
+        self.conn.close()
+
+    def emails_sent(self,
+                    violation: str,
+                    user: str,
+                    cluster: str,
+                    alert_partitions: str) -> Tuple[int, Optional[float]]:
+        """Return the number of emails sent to user for the violation and the
+           time of the last one (seconds since the epoch or None)."""
+        num_emails, last = self.conn.execute("SELECT COUNT(DISTINCT email_sent), "
+                                             "MAX(email_sent) FROM violations "
+                                             "WHERE violation = ? AND user = ? AND "
+                                             "cluster = ? AND alert_partitions = ?",
+                                             (violation, user, str(cluster),
+                                              alert_partitions)).fetchone()
+        return num_emails, last
+
+    def add(self, violation: str, user: str, usr: pd.DataFrame) -> int:
+        """Store the rows of usr (with the columns User, Cluster,
+           Alert-Partitions and Email-Sent) and return the number of new rows."""
+        if usr.empty:
+            return 0
+        sent = pd.to_datetime(usr["Email-Sent"], format="mixed", dayfirst=False)
+        records = json.loads(usr.to_json(orient="records"))
+        rows = [(violation,
+                 user,
+                 str(rec.get("Cluster")),
+                 str(rec.get("Alert-Partitions")),
+                 when.to_pydatetime().timestamp(),
+                 json.dumps(rec))
+                for rec, when in zip(records, sent)]
+        before = self.conn.total_changes
+        self.conn.executemany("INSERT OR IGNORE INTO violations VALUES (?, ?, ?, ?, ?, ?)",
+                              rows)
+        self.conn.commit()
+        return self.conn.total_changes - before
+
+    def users(self, violation: str) -> List[str]:
+        """Return the users that were sent an email for the violation."""
+        rows = self.conn.execute("SELECT DISTINCT user FROM violations "
+                                 "WHERE violation = ? ORDER BY user", (violation,))
+        return [user for (user,) in rows]
+
+    def read(self, violation: str, user: str) -> pd.DataFrame:
+        """Return the violation log of user as it would be read from the CSV
+           file (Email-Sent is a datetime)."""
+        rows = self.conn.execute("SELECT record FROM violations "
+                                 "WHERE violation = ? AND user = ? "
+                                 "ORDER BY email_sent, rowid", (violation, user))
+        df = pd.DataFrame([json.loads(record) for (record,) in rows])
+        if not df.empty:
+            df["Email-Sent"] = pd.to_datetime(df["Email-Sent"], format="mixed", dayfirst=False)
+        return df
+
+    def import_csv_tree(self, vpath: str) -> Tuple[int, int]:
+        """Add the rows of the CSV files under vpath (vpath/violation/user.csv)
+           and return the number of new rows and the number of files read."""
+        num_rows = 0
+        files = sorted(glob.glob(os.path.join(vpath, "*", "*.csv")))
+        for vfile in files:
+            violation = os.path.basename(os.path.dirname(vfile))
+            user = os.path.splitext(os.path.basename(vfile))[0]
+            try:
+                usr = pd.read_csv(vfile)
+            except (pd.errors.EmptyDataError, pd.errors.ParserError) as error:
+                print(f"WARNING: Skipping {vfile} ({error})")
+                continue
+            if "Email-Sent" not in usr.columns:
+                print(f"WARNING: Skipping {vfile} (no Email-Sent column)")
+                continue
+            num_rows += self.add(violation, user, usr)
+        return num_rows, len(files)
@@ -1,6 +1,8 @@
 from utils import seconds_to_slurm_time_format
 from utils import add_dividers
 from utils import gpus_per_job
+from utils import optimize_dtypes
+import pandas as pd
 
 
 def test_seconds_to_slurm_time_format():
@@ -32,3 +34,26 @@ def test_gpus_per_job():
     assert gpus_per_job("billing=112,cpu=112,gres/gpu=2,mem=33600M,node=1") == 2
     assert gpus_per_job("billing=112,cpu=112,gres/gpu=32,mem=33600M,node=2") == 32
     assert gpus_per_job("billing=112,cpu=112,gres/gpu=320,mem=33600M,node=80") == 320
+
+def test_optimize_dtypes():
+    df = pd.DataFrame({"user":["u1", "u2", "u1"],
+                       "cluster":["della"] * 3,
+                       "jobname":["a", "b", "c"],
+                       "cores":[1, 64, 2048],
+                       "gpus":[0, 4, 8],
+                       "elapsedraw":[100, 3000000, 200]})
+    df = optimize_dtypes(df)
+    assert isinstance(df.user.dtype, pd.CategoricalDtype)
+    assert isinstance(df.cluster.dtype, pd.CategoricalDtype)
+    assert not isinstance(df.jobname.dtype, pd.CategoricalDtype)
+    # each count holds its values times the largest count (2048)
+    assert df.cores.dtype == "int32"
+    assert df.gpus.dtype == "int16"
+    # 2048 cores x 3000000 seconds does not fit in int32
+    assert df.elapsedraw.dtype == "int64"
+    assert df[df.user.isin(["u1"])].cores.tolist() == [1, 2048]
+    # products with the thresholds of the alerts do not overflow
+    assert (df.gpus * 1024).tolist() == [0, 4096, 8192]
+    df = optimize_dtypes(pd.DataFrame({"cores":[4, 3000000], "gpus":[1, 2]}))
+    assert df.cores.dtype == "int64"
+    assert df.gpus.dtype == "int32"
@@ -0,0 +1,122 @@
+import os
+import sys
+import stat
+import time
+import textwrap
+import pandas as pd
+from src.job_defense_shield.alert.cancel_zero_gpu_jobs import CancelZeroGpuJobs
+from src.job_defense_shield.alert.cancel_zero_gpu_jobs import scancel_jobs
+from src.job_defense_shield.sliding_store import SlidingWindowStore
+
+
+def make_fake_scancel(tmp_path, monkeypatch):
+    # the fake scancel logs its arguments and fails on jobids starting with 9
+    log = tmp_path / "scancel.log"
+    script = tmp_path / "scancel"
+    script.write_text('#!/bin/sh\n'
+                      f'echo "$@" >> {log}\n'
+                      'status=0\n'
+                      'for jobid in "$@"; do\n'
+                      '  case "$jobid" in\n'
+                      '    9*) echo "scancel: error: Kill job error on job id $jobid: '
+                      'Invalid job id specified" >&2; status=1 ;;\n'
+                      '  esac\n'
+                      'done\n'
+                      'exit $status\n')
+    script.chmod(script.stat().st_mode | stat.S_IEXEC)
+    monkeypatch.setenv("PATH", f"{tmp_path}{os.pathsep}{os.environ['PATH']}")
+    return log
+
+
+def test_scancel_jobs(tmp_path, monkeypatch):
+    log = make_fake_scancel(tmp_path, monkeypatch)
+    jobids = ["1", "2", "91", "3", "4_1"]
+    results = scancel_jobs(jobids, chunk_size=2)
+    assert log.read_text().split("\n")[:-1] == ["1 2", "91 3", "4_1"]
+    assert [jobid for jobid, (ok, _) in results.items() if ok] == ["1", "2", "3", "4_1"]
+    assert "Invalid job id" in results["91"][1]
+
+
+def test_scancel_jobs_dry_run(tmp_path, monkeypatch):
+    log = make_fake_scancel(tmp_path, monkeypatch)
+    results = scancel_jobs(["1", "2"], dry_run=True)
+    assert not log.exists()
+    assert results == {"1":(False, "dry run"), "2":(False, "dry run")}
+
+
+def run_sliding_window(tmp_path, monkeypatch, jobids, state):
+    # the fake Jobstats reports 0% utilization for the jobids starting with
+    # 1 or 3, 50% for those starting with 2 and fails for those starting with 4
+    (tmp_path / "config.py").write_text('PROM_SERVER = "http://localhost:8480"\n')
+    (tmp_path / "jobstats.py").write_text(textwrap.dedent('''
+        class Jobstats:
+            def __init__(self, jobid, cluster, prom_server):
+                self.jobid = jobid
+            def get_job_stats(self):
+                if self.jobid.startswith("4"):
+                    raise RuntimeError("bad response")
+            def report_job_json(self, encode):
+                util = 50 if self.jobid.startswith("2") else 0
+                return str({"gpus":1, "nodes":{"g1":{"gpu_utilization":{"0":util}}}})
+    '''))
+    for module in ("jobstats", "config"):
+        monkeypatch.delitem(sys.modules, module, raising=False)
+    monkeypatch.setattr(sys, "path", list(sys.path))
+    store = SlidingWindowStore(str(tmp_path / ".sliding_cache_della_gpu.db"))
+    store.update(state)
+    store.close()
+    n = len(jobids)
+    df = pd.DataFrame({"jobid":jobids,
+                       "user":["u1"] * n,
+                       "cluster":["della"] * n,
+                       "state":["RUNNING"] * n,
+                       "gpus":[1] * n,
+                       "elapsedraw":[9000] * n,
+                       "qos":["gpu"] * n,
+                       "partition":["gpu"] * n,
+                       "jobname":["myjob"] * n,
+                       "limit-minutes":[1000] * n,
+                       "admincomment":[{}] * n})
+    try:
+        return CancelZeroGpuJobs(df,
+                                 days_between_emails=1,
+                                 violation="cancel_zero_gpu_jobs",
+                                 vpath=str(tmp_path),
+                                 cluster="della",
+                                 partitions=["gpu"],
+                                 sampling_period_minutes=10,
+                                 sliding_warning_minutes=60,
+                                 sliding_cancel_minutes=120,
+                                 jobid_cache_path=str(tmp_path),
+                                 jobstats_module_path=str(tmp_path),
+                                 jobstats_config_path=str(tmp_path),
+                                 num_cancel_alerts=1,
+                                 verbose=False)
+    finally:
+        for module in ("jobstats", "config"):
+            sys.modules.pop(module, None)
+
+
+def test_sliding_window(tmp_path, monkeypatch):
+    # job 3 was warned more than an hour ago and job 2 is using its GPU
+    warned = round(time.time()) - 3700
+    cancel_gpu = run_sliding_window(tmp_path, monkeypatch, ["1", "2", "3"], [("3", warned, 1)])
+    assert cancel_gpu.sliding_warnings == ["1"]
+    assert cancel_gpu.sliding_cancellations == ["3"]
+    assert cancel_gpu.sliding_deferred == []
+    state = SlidingWindowStore(str(tmp_path / ".sliding_cache_della_gpu.db")).load()
+    assert sorted(state) == ["1", "2", "3"]
+    assert state["1"][1] == 1 and state["2"][1] == 0
+
+
+def test_sliding_window_failed_check(tmp_path, monkeypatch, capsys):
+    # the check of job 4 fails so it is reported as an error and keeps its state
+    checked = round(time.time()) - 3700
+    cancel_gpu = run_sliding_window(tmp_path, monkeypatch, ["1", "4"], [("4", checked, 0)])
+    assert cancel_gpu.sliding_warnings == ["1"]
+    assert cancel_gpu.sliding_errors == ["4"]
+    assert cancel_gpu.sliding_deferred == []
+    assert "WARNING: 1 of 2 checks failed (e.g., 4: RuntimeError('bad response'))." in \
+           capsys.readouterr().out
+    state = SlidingWindowStore(str(tmp_path / ".sliding_cache_della_gpu.db")).load()
+    assert state["4"] == (checked, 0)
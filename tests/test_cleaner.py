@@ -1,5 +1,8 @@
+import pytest
 from datetime import datetime
 from cleaner import SacctCleaner
+from cleaner import VectorizedSacctCleaner
+from cleaner import clean_chunks
 import pandas as pd
 
 def test_field_renamings():
@@ -207,3 +210,96 @@ def test_time_limits_end_to_end():
                                    expected,
                                    check_names=False,
                                    check_index=False)
+
+
+def make_raw_sacct():
+    """Return raw sacct data as strings with the awkward values that the
+       cleaner has to handle."""
+    fields = ["jobid", "user", "cluster", "account", "partition", "cputimeraw",
+              "elapsedraw", "timelimitraw", "nnodes", "ncpus", "alloctres",
+              "submit", "eligible", "start", "end", "qos", "state"]
+    rows = [["1", "u1", "della", "bio", "cpu", "100", "100", "60", "1", "1",
+             "cpu=1", "10", "10", "10", "110", "short", "COMPLETED"],
+            ["2", "u2", "della", "bio", "cpu", "0", "0", "UNLIMITED", "1", "4",
+             "cpu=4", "20", "20", "Unknown", "Unknown", "short", "PENDING"],
+            ["3", "u3", "della", "bio", "gpu", "800", "200", "UNLIMITED", "2", "4",
+             "cpu=4", "30", "30", "1000", "Unknown", "long", "RUNNING"],
+            ["4", "u4", "della", "bio", "cpu,gpu", "0", "0", "60", "1", "1",
+             "", "40", "40", "Unknown", "Unknown", "short", "PENDING"],
+            ["5", "u5", "della", "bio", "datascience", "50", "50", "Partition_Limit", "1", "1",
+             "cpu=1", "50", "50", "100", "150", "short", "CANCELLED by 123"],
+            ["6", "u6", "della", "bio", "cpu", "0", "0", "Partition_Limit", "1", "1",
+             "cpu=1", "60", "60", "Unknown", "Unknown", "short", "CANCELLED by 456"],
+            ["7", "u7", "della", "bio", "cpu", "0", "0", "120", "", "",
+             "", "70", "70", "None", "Unknown", "short", "NODE_FAIL"],
+            ["8", "u8", "della", "bio", "cpu", "30", "30", "UNLIMITED", "1", "1",
+             "cpu=1", "80", "Unknown", "Unknown", "Unknown", "short", "REQUEUED"],
+            ["9", "u9", "della", "bio", "cpu", "90", "90", "Partition_Limit", "1", "1",
+             "cpu=1", "90", "90", "100", "Unknown", "short", "RUNNING"]]
+    return pd.DataFrame(rows, columns=fields)
+
+
+def freeze_now(monkeypatch):
+    import cleaner
+    class FrozenDatetime(datetime):
+        @classmethod
+        def now(cls, tz=None):
+            return datetime.fromtimestamp(2000000000, tz)
+    monkeypatch.setattr(cleaner, "datetime", FrozenDatetime)
+
+
+def test_vectorized_cleaner_matches_rowwise(monkeypatch):
+    freeze_now(monkeypatch)
+    field_renamings = {"cputimeraw":"cpu-seconds",
+                       "nnodes":"nodes",
+                       "ncpus":"cores",
+                       "timelimitraw":"limit-minutes"}
+    partition_renamings = {"datascience":"ds"}
+    expected = SacctCleaner(make_raw_sacct(), field_renamings, partition_renamings).clean()
+    actual = VectorizedSacctCleaner(make_raw_sacct(), field_renamings, partition_renamings).clean()
+    pd.testing.assert_frame_equal(actual, expected)
+    assert actual["limit-minutes"].tolist() == [60, -1, 2000000000 - 1000, 50, 2000000000 - 100]
+
+
+def test_vectorized_cleaner_arrow_strings(monkeypatch):
+    pytest.importorskip("pyarrow")
+    freeze_now(monkeypatch)
+    field_renamings = {"cputimeraw":"cpu-seconds",
+                       "nnodes":"nodes",
+                       "ncpus":"cores",
+                       "timelimitraw":"limit-minutes"}
+    expected = SacctCleaner(make_raw_sacct(), field_renamings, {}).clean()
+    raw = make_raw_sacct().astype(pd.StringDtype("pyarrow"))
+    actual = VectorizedSacctCleaner(raw, field_renamings, {}).clean()
+    for col in ["cpu-seconds", "nodes", "cores", "limit-minutes", "start", "end"]:
+        assert actual[col].tolist() == expected[col].tolist()
+    assert actual.state.tolist() == expected.state.tolist()
+
+
+def test_clean_chunks(monkeypatch, capsys):
+    freeze_now(monkeypatch)
+    field_renamings = {"cputimeraw":"cpu-seconds",
+                       "nnodes":"nodes",
+                       "ncpus":"cores",
+                       "timelimitraw":"limit-minutes"}
+    raw = make_raw_sacct()
+    cleaner = SacctCleaner(raw.copy(), field_renamings, {})
+    expected = cleaner.clean().reset_index(drop=True)
+    expected_output = capsys.readouterr().out
+    # the cleaner keeps the counts of its messages
+    assert cleaner.messages[8 * " " + "{} jobs in the raw dataframe"] == [9]
+    chunks = [raw.iloc[:3].copy(), raw.iloc[3:6].copy(), raw.iloc[6:].copy()]
+    actual = clean_chunks(SacctCleaner, chunks, field_renamings, {})
+    pd.testing.assert_frame_equal(actual, expected)
+    output = capsys.readouterr().out
+    assert output.count("INFO: Cleaning sacct data") == 1
+    assert "9 jobs in the raw dataframe" in output
+    assert "5 jobs in the cleaned dataframe" in output
+    assert sorted(output.splitlines()) == sorted(expected_output.splitlines())
+    # the low-cardinality columns are stored as categoricals as the chunks arrive
+    chunks = [raw.iloc[:3].copy(), raw.iloc[3:6].copy(), raw.iloc[6:].copy()]
+    actual = clean_chunks(SacctCleaner, chunks, field_renamings, {}, categorical=["state", "user"])
+    assert isinstance(actual.state.dtype, pd.CategoricalDtype)
+    assert isinstance(actual.user.dtype, pd.CategoricalDtype)
+    assert actual.state.tolist() == expected.state.tolist()
+    assert actual.user.tolist() == expected.user.tolist()
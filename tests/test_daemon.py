@@ -0,0 +1,75 @@
+import os
+import sys
+import pickle
+import signal
+import textwrap
+import pandas as pd
+from src.job_defense_shield.daemon import CancelZeroGpuDaemon
+
+
+def test_daemon(tmp_path, monkeypatch):
+    (tmp_path / "config.py").write_text('PROM_SERVER = "http://localhost:8480"\n')
+    (tmp_path / "jobstats.py").write_text(textwrap.dedent('''
+        class Jobstats:
+            def __init__(self, jobid, cluster, prom_server):
+                self.jobid = jobid
+            def get_job_stats(self):
+                pass
+            def report_job_json(self, encode):
+                util = 0 if self.jobid == "1" else 50
+                return str({"gpus":1, "nodes":{"g1":{"gpu_utilization":{"0":util}}}})
+    '''))
+    for module in ("jobstats", "config"):
+        monkeypatch.delitem(sys.modules, module, raising=False)
+    monkeypatch.setattr(sys, "path", list(sys.path))
+    loads = []
+    def load_config():
+        loads.append(1)
+        alert = {"cluster":"della",
+                 "partitions":["gpu"],
+                 "sampling_period_minutes":0.001,
+                 "cancel_minutes":60,
+                 "sliding_warning_minutes":60,
+                 "sliding_cancel_minutes":120,
+                 "jobid_cache_path":str(tmp_path)}
+        cfg = {"cancel-zero-gpu-jobs-1":alert,
+               "violation-logs-path":str(tmp_path),
+               "greeting-method":"basic",
+               "daemon-checkpoint-ticks":2}
+        sys_cfg = {"jobstats_module_path":str(tmp_path),
+                   "jobstats_config_path":str(tmp_path),
+                   "verbose":False}
+        return cfg, sys_cfg, ""
+    ticks = []
+    def get_running_jobs(cfg):
+        ticks.append(1)
+        n = 2
+        return pd.DataFrame({"jobid":["1", "2"],
+                             "user":["u1", "u2"],
+                             "cluster":["della"] * n,
+                             "state":["RUNNING"] * n,
+                             "gpus":[1] * n,
+                             "elapsedraw":[3600, 9000],
+                             "qos":["gpu"] * n,
+                             "partition":["gpu"] * n,
+                             "jobname":["myjob"] * n,
+                             "limit-minutes":[1000] * n,
+                             "admincomment":[{}] * n})
+    daemon = CancelZeroGpuDaemon(load_config, get_running_jobs=get_running_jobs)
+    monkeypatch.setattr(signal, "signal", lambda signum, handler: None)
+    daemon.request_reload(signal.SIGHUP, None)
+    daemon.run(max_ticks=3)
+    assert len(ticks) == 3
+    assert len(loads) == 2
+    # the fixed-window cache is written at the checkpoints and on shutdown
+    with open(tmp_path / ".jobid_cache_della_gpu.pkl", "rb") as fp:
+        assert pickle.load(fp) == []
+    assert daemon.jobid_cache_memo[str(tmp_path / ".jobid_cache_della_gpu.pkl")] == []
+    assert os.path.isfile(tmp_path / ".sliding_cache_della_gpu.db")
+    assert daemon.sliding_stores == {}
+    # sys.path does not grow with the ticks and config.py is imported again
+    assert sys.path.count(str(tmp_path)) == 1
+    daemon.reload()
+    assert "config" not in sys.modules
+    for module in ("jobstats", "config"):
+        sys.modules.pop(module, None)
@@ -1,4 +1,8 @@
+import json
+import gzip
+import base64
 from efficiency import get_stats_dict
+from efficiency import get_stats_dicts
 from efficiency import cpu_efficiency
 from efficiency import gpu_efficiency
 from efficiency import cpu_memory_usage
@@ -11,6 +15,7 @@ from efficiency import max_cpu_memory_used_per_node
 from efficiency import num_gpus_with_zero_util
 from efficiency import cpu_nodes_with_zero_util
 from efficiency import get_nodelist
+import pandas as pd
 import numpy as np
 
 
@@ -345,3 +350,16 @@ def test_get_nodelist():
                             "used_memory": 43 * 1024**3,
                             "total_memory": 100 * 1024**3}}}
     assert get_nodelist(ss, 12345, "c1", verbose=False) == (set(["node1", "node2"]), 0)
+
+
+def test_get_stats_dicts_parallel():
+    ss = {"gpus": 1, "nodes": {"node1": {"cpus": 4, "total_time": 10.0}}}
+    ss64 = "JS1:" + base64.b64encode(gzip.compress(json.dumps(ss).encode())).decode()
+    series = pd.Series([ss64, "JS1:Short", "", ss64, "JS1:None", ss64] * 5,
+                       index=range(100, 130))
+    expected = series.apply(get_stats_dict)
+    actual = get_stats_dicts(series, workers=2, min_jobs=1)
+    pd.testing.assert_series_equal(actual, expected)
+    assert actual.iloc[0] == ss and actual.iloc[1] == {}
+    serial = get_stats_dicts(series, workers=2, min_jobs=1000)
+    pd.testing.assert_series_equal(serial, expected)
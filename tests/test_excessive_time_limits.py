@@ -79,3 +79,39 @@ def test_excessive_time_limits_gpu():
                              "jobs":[3, 2]})
     expected.index += 1
     pd.testing.assert_frame_equal(actual, expected)
+
+def test_excessive_time_limits_copy_on_write():
+    n_jobs = 3
+    cpus = 10
+    ss = {"nodes":{"node1":{"total_time":-1, "cpus":cpus}}}
+    elapsed_hours = [9600, 5000, 1500]
+    df = pd.DataFrame({"user":["user1", "user1", "user2"],
+                       "cluster":["della"] * n_jobs,
+                       "state":["COMPLETED"] * n_jobs,
+                       "cores":[cpus] * n_jobs,
+                       "partition":["cpu"] * n_jobs,
+                       "qos":["short"] * n_jobs,
+                       "elapsed-hours":elapsed_hours,
+                       "elapsedraw":[60 * 60 * hrs for hrs in elapsed_hours],
+                       "limit-minutes":[60 * 10000] * n_jobs,
+                       "admincomment":[ss] * n_jobs,
+                       "cpu-hours":[cpus * hrs for hrs in elapsed_hours]})
+    original = df.copy()
+    gps = []
+    for copy_on_write in (False, True):
+        limits = ExcessiveTimeLimitsCPU(df,
+                                        0,
+                                        "",
+                                        "",
+                                        cluster="della",
+                                        partitions=["cpu"],
+                                        min_run_time=0,
+                                        num_top_users=10,
+                                        absolute_thres_hours=0,
+                                        overall_ratio_threshold=1.0,
+                                        mean_ratio_threshold=1.0,
+                                        median_ratio_threshold=1.0,
+                                        copy_on_write=copy_on_write)
+        gps.append(limits.gp)
+    pd.testing.assert_frame_equal(gps[0], gps[1])
+    pd.testing.assert_frame_equal(df, original)
@@ -0,0 +1,35 @@
+import json
+import pandas as pd
+from instrument import Profiler
+
+
+def test_profiler(tmp_path):
+    profiler = Profiler()
+    with profiler.stage("not recorded"):
+        pass
+    assert profiler.stages == []
+    profiler.enable()
+    for _ in range(2):
+        with profiler.stage("sacct"):
+            with profiler.stage("clean"):
+                pass
+    try:
+        with profiler.stage("failed"):
+            raise ValueError
+    except ValueError:
+        pass
+    profiler.snapshot("jobs", pd.DataFrame({"jobid":["1", "2", "3"]}))
+    totals = profiler.totals()
+    assert totals.index.tolist() == ["clean", "sacct", "failed"]
+    assert totals["calls"].tolist() == [2, 2, 1]
+    assert (totals["seconds"] >= 0).all()
+    summary = profiler.summary()
+    assert "Stages of the run" in summary and "jobs" in summary
+    path = tmp_path / "profile.json"
+    profiler.write_json(str(path), {"argv":"--low-gpu-efficiency"})
+    profiler.write_json(str(path))
+    records = [json.loads(line) for line in path.read_text().splitlines()]
+    assert len(records) == 2
+    assert records[0]["stages"]["sacct"]["calls"] == 2
+    assert records[0]["snapshots"][0]["rows"] == 3
+    assert records[0]["argv"] == "--low-gpu-efficiency"
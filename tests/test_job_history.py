@@ -0,0 +1,82 @@
+import os
+import stat
+from datetime import datetime
+from datetime import timedelta
+import pytest
+import pandas as pd
+from src.job_defense_shield.job_history import JobHistoryStore
+
+FIELDS = ["jobid", "cluster", "submit", "eligible", "end", "state", "jobname"]
+
+
+def job(jobid, end, state, cluster="della"):
+    return [jobid, cluster, "100", "100", end, state, "myjob"]
+
+
+def get_store(path, start, end, parser="python"):
+    return JobHistoryStore(str(path), start, end, FIELDS, "all", "", parser=parser)
+
+
+def test_delta_fetching(tmp_path, monkeypatch):
+    t0 = datetime(2025, 3, 1)
+    ts = lambda hours: str(int((t0 + timedelta(hours=hours)).timestamp()))
+    calls = []
+
+    def fake_fetch(self, start, end):
+        calls.append((start, end))
+        if len(calls) == 1:
+            rows = [job("1", ts(1), "COMPLETED"),
+                    job("2", ts(2), "CANCELLED by 42", cluster="stellar"),
+                    job("3", "Unknown", "RUNNING"),
+                    job("4", "Unknown", "PENDING")]
+        else:
+            rows = [job("3", ts(30), "COMPLETED"),
+                    job("4", "Unknown", "RUNNING"),
+                    job("5", "Unknown", "RUNNING")]
+        return pd.DataFrame(rows, columns=FIELDS)
+
+    monkeypatch.setattr(JobHistoryStore, "fetch", fake_fetch)
+    raw = get_store(tmp_path, t0, t0 + timedelta(days=1)).get_job_data()
+    assert calls[0] == (t0, t0 + timedelta(days=1))
+    assert sorted(raw.jobid) == ["1", "2", "3", "4"]
+    assert list(raw.columns) == FIELDS
+
+    # second call only asks sacct for the jobs that changed since the watermark
+    raw = get_store(tmp_path, t0, t0 + timedelta(days=2)).get_job_data()
+    assert calls[1] == (t0 + timedelta(days=1, minutes=-10), t0 + timedelta(days=2))
+    assert sorted(raw.jobid) == ["1", "2", "3", "4", "5"]
+    assert raw[raw.jobid == "3"].state.tolist() == ["COMPLETED"]
+    assert raw[raw.jobid == "4"].state.tolist() == ["RUNNING"]
+
+    # jobs that ended before the window are not served
+    raw = get_store(tmp_path, t0 + timedelta(hours=10), t0 + timedelta(days=2)).get_job_data()
+    assert sorted(raw.jobid) == ["3", "4", "5"]
+
+
+def test_fields_changed(tmp_path, monkeypatch):
+    t0 = datetime(2025, 3, 1)
+    end = str(int((t0 + timedelta(hours=1)).timestamp()))
+    monkeypatch.setattr(JobHistoryStore,
+                        "fetch",
+                        lambda self, start, stop: pd.DataFrame([job("1", end, "COMPLETED")],
+                                                               columns=FIELDS))
+    get_store(tmp_path, t0, t0 + timedelta(days=1)).get_job_data()
+    store = get_store(tmp_path, t0, t0 + timedelta(days=1))
+    store.fields = FIELDS + ["qos"]
+    assert store.read_meta()["watermark"] is None
+
+
+@pytest.mark.parametrize("parser", ["python", "arrow"])
+def test_fetch_parser(tmp_path, monkeypatch, parser):
+    if parser == "arrow":
+        pytest.importorskip("pyarrow")
+    script = tmp_path / "sacct"
+    script.write_text("#!/bin/sh\n"
+                      "echo '1|della|100|100|1740790800|COMPLETED|myjob'\n"
+                      "echo '2|della|100|Unknown|Unknown|PENDING|my|job'\n")
+    script.chmod(script.stat().st_mode | stat.S_IEXEC)
+    monkeypatch.setenv("PATH", f"{tmp_path}{os.pathsep}{os.environ['PATH']}")
+    t0 = datetime(2025, 3, 1)
+    raw = get_store(tmp_path, t0, t0 + timedelta(days=1), parser=parser).fetch(t0, t0)
+    assert raw.values.tolist() == [job("1", "1740790800", "COMPLETED"),
+                                   ["2", "della", "100", "Unknown", "Unknown", "PENDING", "my"]]
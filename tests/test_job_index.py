@@ -0,0 +1,59 @@
+import pandas as pd
+from job_index import JobFrameIndex
+from src.job_defense_shield.alert.excessive_time_limits import ExcessiveTimeLimitsCPU
+
+
+def make_jobs():
+    return pd.DataFrame({"jobid":["1", "2", "3", "4", "5", "6"],
+                         "cluster":["della", "stellar", "della", "della", "stellar", "della"],
+                         "partition":["cpu", "cpu", "gpu", "cpu", "pu", "mig"]})
+
+
+def test_job_frame_index():
+    df = make_jobs()
+    index = JobFrameIndex(df)
+    assert index.select("della", ["cpu"]).jobid.tolist() == ["1", "4"]
+    assert index.select("della", ["mig", "cpu"]).jobid.tolist() == ["1", "4", "6"]
+    assert index.select("della", ["*"]).jobid.tolist() == ["1", "3", "4", "6"]
+    assert index.select("della").index.tolist() == [0, 2, 3, 5]
+    assert index.select("stellar", ["gpu"]).empty
+    assert index.select("tiger", ["*"]).empty
+    assert JobFrameIndex(df.iloc[:0]).select("della", ["cpu"]).empty
+
+
+def test_alert_with_job_index():
+    n_jobs = 6
+    cpus = 10
+    ss = {"nodes":{"node1":{"total_time":-1, "cpus":cpus}}}
+    elapsed_hours = [ 9600, 5000, 1500, 2100, 3000,  5000]
+    limit_hours   = [10000, 9000, 3000, 4200, 6100, 10000]
+    df = pd.DataFrame({"user":["user3", "user1", "user1", "user2", "user1", "user2"],
+                       "cluster":["della", "della", "della", "stellar", "della", "della"],
+                       "state":["COMPLETED"] * n_jobs,
+                       "cores":[cpus] * n_jobs,
+                       "partition":["cpu", "cpu", "physics", "cpu", "cpu", "cpu"],
+                       "qos":["short"] * n_jobs,
+                       "elapsed-hours":elapsed_hours,
+                       "elapsedraw":[60 * 60 * hrs for hrs in elapsed_hours],
+                       "limit-minutes":[60 * lim for lim in limit_hours],
+                       "admincomment":[ss] * n_jobs,
+                       "cpu-hours":[cpus * hrs for hrs in elapsed_hours]})
+    params = {"cluster":"della",
+              "partitions":["cpu"],
+              "min_run_time":0,
+              "num_top_users":10,
+              "absolute_thres_hours":5000,
+              "overall_ratio_threshold":1.0,
+              "mean_ratio_threshold":1.0,
+              "median_ratio_threshold":1.0}
+    expected = ExcessiveTimeLimitsCPU(df, 0, "", "", **params)
+    actual = ExcessiveTimeLimitsCPU(df, 0, "", "", job_index=JobFrameIndex(df), **params)
+    assert len(actual.df) == 4
+    pd.testing.assert_frame_equal(actual.df, expected.df)
+    pd.testing.assert_frame_equal(actual.gp, expected.gp)
+    # the index is only used for the dataframe that it was built from
+    other = df[df.user == "user1"]
+    actual = ExcessiveTimeLimitsCPU(other, 0, "", "", job_index=JobFrameIndex(df), **params)
+    expected = ExcessiveTimeLimitsCPU(other, 0, "", "", **params)
+    assert len(actual.df) == 2
+    pd.testing.assert_frame_equal(actual.df, expected.df)
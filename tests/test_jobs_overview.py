@@ -31,3 +31,22 @@ def test_jobs_overview():
     expected["CPU-Hrs"] = expected["CPU-Hrs"].apply(round)
     expected["GPU-Hrs"] = expected["GPU-Hrs"].apply(round)
     pd.testing.assert_frame_equal(actual.reset_index(drop=True), expected)
+
+def test_jobs_overview_categorical():
+    from utils import optimize_dtypes
+    n_jobs = 4
+    df = pd.DataFrame({"jobid":["1", "2", "3", "4"],
+                       "user":["user1", "user2", "user1", "user1"],
+                       "cluster":["della"] * n_jobs,
+                       "state":["COMPLETED"] * n_jobs,
+                       "partition":["cpu", "cpu", "cpu", "gpu"],
+                       "cpu-seconds":[3600] * n_jobs,
+                       "gpu-seconds":[0, 0, 0, 3600],
+                       "gpus":[0, 0, 0, 1],
+                       "elapsedraw":[3600] * n_jobs})
+    expected = JobsOverview(df.copy(), 7, "", "").gp
+    actual = JobsOverview(optimize_dtypes(df.copy()), 7, "", "").gp
+    assert actual["COM"].tolist() == [3, 1]
+    assert actual["User"].tolist() == expected["User"].tolist()
+    assert actual["Jobs"].tolist() == expected["Jobs"].tolist()
+    assert actual["Partitions"].tolist() == expected["Partitions"].tolist()
@@ -0,0 +1,132 @@
+import pandas as pd
+import pytest
+from efficiency import get_stats_dict
+from efficiency import cpu_efficiency
+from efficiency import gpu_efficiency
+from efficiency import cpu_memory_usage
+from efficiency import gpu_memory_usage_eff_tuples
+from efficiency import max_cpu_memory_used_per_node
+from efficiency import num_gpus_with_zero_util
+from efficiency import cpu_nodes_with_zero_util
+from efficiency import get_nodelist
+from metrics_tables import MetricsTables
+from metrics_tables import cpu_efficiency_batch
+from metrics_tables import gpu_efficiency_batch
+from metrics_tables import cpu_memory_usage_batch
+from metrics_tables import gpu_memory_usage_eff_tuples_batch
+from metrics_tables import max_cpu_memory_used_per_node_batch
+from metrics_tables import num_gpus_with_zero_util_batch
+from metrics_tables import cpu_nodes_with_zero_util_batch
+from metrics_tables import get_nodelist_batch
+from benchmarks.synthetic import synthetic_jobs
+
+GB = 1024**3
+
+
+def gpu_node(cpus, total_time, util, used, alloc):
+    return {"cpus":cpus,
+            "total_time":total_time,
+            "used_memory":used * GB,
+            "total_memory":alloc * GB,
+            "gpu_utilization":{str(i):u for i, u in enumerate(util)},
+            "gpu_used_memory":{str(i):7.33 * GB for i in range(len(util))},
+            "gpu_total_memory":{str(i):40 * GB for i in range(len(util))}}
+
+
+@pytest.fixture
+def stats():
+    return pd.Series([{"nodes":{"a":gpu_node(4, 1000.5, [50, 0], 10, 16),
+                                "b":gpu_node(4, 0, [100, 0], 20, 16)}},
+                      {"nodes":{"c":{"cpus":32, "total_time":31999, "used_memory":5 * GB,
+                                     "total_memory":64 * GB}}},
+                      {"nodes":{"d":{"cpus":8, "used_memory":1, "total_memory":2}}},
+                      {},
+                      {"nodes":{"e":{"cpus":1, "total_time":5000, "used_memory":3 * GB,
+                                     "total_memory":2 * GB,
+                                     "gpu_utilization":{"0":120}}}},
+                      {"nodes":{}}],
+                     index=[10, 11, 12, 13, 14, 15])
+
+
+def expected(func, stats, *args, **kwargs):
+    rows = [func(ss, *[arg[job] for arg in args], "jobid", "della", verbose=False, **kwargs)
+            for job, ss in stats.items()]
+    return [tuple(row) for row in rows]
+
+
+def actual(frame):
+    return [tuple(row) for row in frame.itertuples(index=False)]
+
+
+def test_efficiency_batch(stats):
+    tables = MetricsTables(stats)
+    elapsed = pd.Series([1000, 1000, 10, 10, 1000, 10], index=stats.index)
+    for single in [False, True]:
+        assert actual(cpu_efficiency_batch(tables, elapsed, single=single)) == \
+               expected(cpu_efficiency, stats, elapsed, single=single)
+        assert actual(gpu_efficiency_batch(tables, elapsed, single=single)) == \
+               expected(gpu_efficiency, stats, elapsed, single=single)
+
+
+def test_memory_and_zero_util_batch(stats):
+    tables = MetricsTables(stats)
+    jobs = stats.index
+    assert actual(cpu_memory_usage_batch(tables, jobs)) == expected(cpu_memory_usage, stats)
+    assert actual(num_gpus_with_zero_util_batch(tables, jobs)) == \
+           expected(num_gpus_with_zero_util, stats)
+    assert actual(cpu_nodes_with_zero_util_batch(tables, jobs)) == \
+           expected(cpu_nodes_with_zero_util, stats)
+    assert actual(get_nodelist_batch(tables, jobs)) == expected(get_nodelist, stats)
+    # the scalar version fails for jobs without nodes
+    subset = stats.loc[[10, 11, 13, 14]]
+    assert actual(max_cpu_memory_used_per_node_batch(tables, subset.index)) == \
+           expected(max_cpu_memory_used_per_node, subset)
+    assert actual(max_cpu_memory_used_per_node_batch(tables, pd.Index([15]))) == [(-1, 4)]
+
+
+def test_gpu_memory_batch(stats):
+    tables = MetricsTables(stats)
+    # the scalar version fails for jobs without GPUs
+    subset = stats.loc[[10, 12, 13]]
+    for op in [None, "max", "max-percent", "mean", "mean-percent"]:
+        assert actual(gpu_memory_usage_eff_tuples_batch(tables, subset.index, op=op)) == \
+               expected(gpu_memory_usage_eff_tuples, subset, op=op)
+    assert actual(gpu_memory_usage_eff_tuples_batch(tables, pd.Index([11, 15]), op="max")) == [([], 2), (-1, 4)]
+
+
+def test_tables(stats):
+    tables = MetricsTables(stats)
+    assert tables.nodes.node.tolist() == ["a", "b", "c", "d", "e"]
+    assert len(tables.gpus) == 5
+    assert tables.nodes.total_time.dtype == "float64"
+    assert tables.has_nodes.tolist() == [True, True, True, False, True, True]
+    with pytest.raises(ValueError):
+        MetricsTables(pd.Series([{}, {}], index=[0, 0]))
+
+
+def test_efficiency_batch_summation_order():
+    # a compensated sum gives 44.7 instead of 44.8
+    stats = pd.Series([{"nodes":{"a":{"gpu_utilization":{"0":41.5, "1":47.4, "2":52.5, "3":37.6}}}}])
+    elapsed = pd.Series([11])
+    assert actual(gpu_efficiency_batch(MetricsTables(stats), elapsed, single=True)) == \
+           expected(gpu_efficiency, stats, elapsed, single=True) == [(44.8, 0)]
+
+
+def test_batch_parity_synthetic():
+    # the batch functions match efficiency.py for every job of the synthetic workload
+    raw = synthetic_jobs(3000, num_nodes=40, gpus_per_node=8, gpu_fraction=0.5, seed=7)
+    raw = raw[raw.admincomment.str.len() > 20]
+    stats = pd.Series([get_stats_dict(x) for x in raw.admincomment], index=raw.index)
+    elapsed = pd.Series([int(x) for x in raw.elapsedraw], index=raw.index, dtype=object)
+    tables = MetricsTables(stats)
+    for func, batch in [(cpu_efficiency, cpu_efficiency_batch),
+                        (gpu_efficiency, gpu_efficiency_batch)]:
+        assert actual(batch(tables, elapsed)) == expected(func, stats, elapsed)
+        assert actual(batch(tables, elapsed, single=True)) == \
+               expected(func, stats, elapsed, single=True)
+    assert actual(cpu_memory_usage_batch(tables, stats.index)) == \
+           expected(cpu_memory_usage, stats)
+    for op in ["max", "max-percent", "mean", "mean-percent"]:
+        assert actual(gpu_memory_usage_eff_tuples_batch(tables, stats.index, op=op)) == \
+               expected(gpu_memory_usage_eff_tuples, stats, op=op)
+    assert actual(get_nodelist_batch(tables, stats.index)) == expected(get_nodelist, stats)
@@ -0,0 +1,102 @@
+import pandas as pd
+from datetime import datetime
+from src.job_defense_shield.pipeline import ALERTS
+from src.job_defense_shield.pipeline import AlertRunner
+from src.job_defense_shield.pipeline import get_alert_spec
+
+
+def test_get_alert_spec():
+    assert get_alert_spec("--excessive-time-cpu").violation == "excessive_time_limits_cpu"
+    assert get_alert_spec("longest_queued").pending
+    assert len({spec.flag for spec in ALERTS}) == len(ALERTS)
+
+
+def make_jobs_and_config(tmp_path):
+    n_jobs = 6
+    cpus = 10
+    ss = {"nodes":{"node1":{"total_time":-1, "cpus":cpus}}}
+    elapsed_hours = [ 9600, 5000, 1500, 2100, 3000,  5000]
+    limit_hours   = [10000, 9000, 3000, 4200, 6100, 10000]
+    df = pd.DataFrame({"user":["user3", "user1", "user1", "user2", "user1", "user2"],
+                       "cluster":["della"] * n_jobs,
+                       "state":["COMPLETED"] * n_jobs,
+                       "cores":[cpus] * n_jobs,
+                       "partition":["cpu"] * n_jobs,
+                       "qos":["short"] * n_jobs,
+                       "elapsed-hours":elapsed_hours,
+                       "elapsedraw":[60 * 60 * hrs for hrs in elapsed_hours],
+                       "limit-minutes":[60 * lim for lim in limit_hours],
+                       "admincomment":[ss] * n_jobs,
+                       "cpu-hours":[cpus * hrs for hrs in elapsed_hours],
+                       "gpu-hours":[0] * n_jobs})
+    entry = {"cluster":"della",
+             "partitions":["cpu"],
+             "min_run_time":0,
+             "num_top_users":10,
+             "absolute_thres_hours":5000,
+             "overall_ratio_threshold":1.0,
+             "mean_ratio_threshold":1.0,
+             "median_ratio_threshold":1.0}
+    cfg = {"violation-logs-path":str(tmp_path),
+           "greeting-method":"basic",
+           "excessive-time-cpu-1":dict(entry),
+           "excessive-time-cpu-2":dict(entry, enabled=False)}
+    return df, cfg
+
+
+def test_alert_runner(tmp_path):
+    df, cfg = make_jobs_and_config(tmp_path)
+    runner = AlertRunner(cfg,
+                         {"verbose":False},
+                         df,
+                         datetime(2025, 1, 1),
+                         datetime(2025, 1, 8))
+    results = runner.run(["excessive_time_cpu"])
+    assert [result.name for result in results] == ["excessive-time-cpu-1"]
+    assert results[0].alert.gp.User.tolist() == ["user1", "user2"]
+    assert "user1" in runner.report(results)
+    assert "verbose" not in cfg["excessive-time-cpu-1"]
+    assert runner.timings(results).startswith("INFO: excessive-time-cpu-1 ran in")
+    assert runner.run(["low_cpu_efficiency"]) == []
+
+
+def test_alert_runner_workers(tmp_path, capsys):
+    df, cfg = make_jobs_and_config(tmp_path)
+    flags = ["usage_overview", "excessive_time_cpu"]
+    reports, outputs = [], []
+    for workers in (1, 2):
+        runner = AlertRunner(cfg,
+                             {"verbose":False},
+                             df,
+                             datetime(2025, 1, 1),
+                             datetime(2025, 1, 8),
+                             workers=workers)
+        results = runner.run(flags)
+        assert [result.name for result in results] == ["excessive-time-cpu-1", "usage_overview"]
+        reports.append(runner.report(results))
+        outputs.append(capsys.readouterr().out)
+    assert reports[0] == reports[1]
+    assert outputs[0] == outputs[1]
+    assert results[0].alert is None
+
+
+def test_alert_runner_profile(tmp_path):
+    from src.job_defense_shield.instrument import PROFILER
+    df, cfg = make_jobs_and_config(tmp_path)
+    PROFILER.enable()
+    try:
+        runner = AlertRunner(cfg,
+                             {"verbose":False},
+                             df,
+                             datetime(2025, 1, 1),
+                             datetime(2025, 1, 8),
+                             workers=2)
+        runner.run(["usage_overview", "excessive_time_cpu"])
+        stages = PROFILER.totals().index.tolist()
+    finally:
+        PROFILER.enabled = False
+        PROFILER.stages, PROFILER.snapshots = [], []
+    assert stages == ["excessive-time-cpu-1: filter",
+                      "excessive-time-cpu-1: report",
+                      "usage_overview: filter",
+                      "usage_overview: report"]
@@ -0,0 +1,253 @@
+import sys
+import json
+import time
+import textwrap
+import threading
+from http.server import BaseHTTPRequestHandler
+from http.server import HTTPServer
+from urllib.parse import parse_qs
+import pytest
+import pandas as pd
+from prom_client import fetch_concurrently
+from prom_client import PrometheusBatchClient
+from prom_client import LiveStatsCache
+from prom_client import DeferredError
+from prom_client import window_bucket
+from efficiency import cpu_efficiency
+from efficiency import gpu_efficiency
+from src.job_defense_shield.alert.zero_cpu_utilization import ZeroCPU
+
+
+def test_fetch_concurrently():
+    def fetch(key):
+        if key == 3:
+            raise RuntimeError("bad response")
+        if key == 4:
+            time.sleep(1)
+        return key * 10
+    results, errors = fetch_concurrently(range(6), fetch, workers=3, timeout=0.2)
+    assert results == {0:0, 1:10, 2:20, 5:50}
+    assert isinstance(errors[3], RuntimeError)
+    assert isinstance(errors[4], TimeoutError)
+    assert fetch_concurrently([], fetch) == ({}, {})
+
+
+def test_fetch_concurrently_deadline():
+    def fetch(key):
+        time.sleep(0.3)
+        return key
+    results, errors = fetch_concurrently(range(6), fetch, workers=2, deadline=time.time() + 0.5)
+    assert results == {0:0, 1:1}
+    assert sorted(errors) == [2, 3, 4, 5]
+    assert all(isinstance(e, DeferredError) for e in errors.values())
+
+
+def test_live_stats_cache():
+    fetched = []
+    def fetch(keys):
+        fetched.extend(keys)
+        return {key: {"gpus":1} for key in keys if key[1] != "2"}, {("della", "2", 600): KeyError()}
+    cache = LiveStatsCache()
+    keys = [("della", "1", 600), ("della", "2", 600)]
+    results, errors = cache.get_many(keys, fetch)
+    assert list(results) == [("della", "1", 600)]
+    assert list(errors) == [("della", "2", 600)]
+    cache.get_many(keys + [("della", "1", None)], fetch)
+    assert fetched == keys + [("della", "1", None)]
+    assert (cache.hits, cache.misses, len(cache)) == (2, 3, 3)
+
+
+def test_get_admincomment_for_running_jobs(tmp_path, monkeypatch):
+    (tmp_path / "config.py").write_text('PROM_SERVER = "http://localhost:8480"\n')
+    (tmp_path / "jobstats.py").write_text(textwrap.dedent('''
+        calls = []
+        class Jobstats:
+            def __init__(self, jobid, cluster, prom_server):
+                calls.append(jobid)
+                if jobid == "3":
+                    raise RuntimeError("no data")
+                self.jobid = jobid
+            def report_job_json(self, encode):
+                node = {"cpus":16, "total_time":0.0, "total_memory":100, "used_memory":10}
+                return str({"gpus":0, "nodes":{"n" + self.jobid:node}})
+    '''))
+    for module in ("jobstats", "config"):
+        monkeypatch.delitem(sys.modules, module, raising=False)
+    monkeypatch.setattr(sys, "path", list(sys.path))
+    n = 4
+    df = pd.DataFrame({"jobid":["1", "2", "3", "4"],
+                       "user":["user1", "user2", "user3", "user4"],
+                       "admincomment":[{}, {}, {}, {"gpus":0, "nodes":{}}],
+                       "cluster":["della"] * n,
+                       "jobname":["myjob"] * n,
+                       "nodes":[1] * n,
+                       "cores":[16] * n,
+                       "state":["RUNNING", "RUNNING", "RUNNING", "COMPLETED"],
+                       "partition":["cpu"] * n,
+                       "qos":["short"] * n,
+                       "elapsed-hours":[10] * n})
+    live_stats_cache = LiveStatsCache()
+    for _ in range(2):
+        alert = ZeroCPU(df,
+                        0,
+                        "",
+                        "",
+                        cluster="della",
+                        partitions=["cpu"],
+                        verbose=False,
+                        include_running_jobs=True,
+                        jobstats_module_path=str(tmp_path),
+                        jobstats_config_path=str(tmp_path),
+                        prometheus_workers=2,
+                        prometheus_timeout=10,
+                        live_stats_cache=live_stats_cache)
+        assert alert.df.JobID.tolist() == ["1", "2"]
+    # the second alert is served by the cache (including the failed job)
+    assert sorted(sys.modules["jobstats"].calls) == ["1", "2", "3"]
+    assert (live_stats_cache.hits, live_stats_cache.misses) == (3, 3)
+    for module in ("jobstats", "config"):
+        sys.modules.pop(module, None)
+
+
+def test_get_admincomment_for_running_jobs_batch(tmp_path, monkeypatch):
+    (tmp_path / "config.py").write_text('PROM_SERVER = "http://localhost:8480"\n')
+    monkeypatch.delitem(sys.modules, "config", raising=False)
+    monkeypatch.setattr(sys, "path", list(sys.path))
+
+    class FakeClient:
+        num_queries = 0
+        windows = []
+        def get_job_stats(self, cluster, jobids, window, elapsed=None):
+            self.windows.append(window)
+            node = {"cpus":16, "total_time":0.0, "total_memory":100, "used_memory":10}
+            # the exporters only know the raw jobid of an array job
+            return {jobid: {"gpus":0, "nodes":{"n1":node}, "total_time":elapsed[jobid]}
+                    for jobid in jobids if "_" not in jobid}
+
+    # job 3_4 is an array job with the raw jobid 5
+    n = 3
+    df = pd.DataFrame({"jobid":["1", "2", "3_4"],
+                       "jobidraw":["1", "2", "5"],
+                       "user":["user1", "user2", "user3"],
+                       "admincomment":[{}] * n,
+                       "cluster":["della"] * n,
+                       "jobname":["myjob"] * n,
+                       "nodes":[1] * n,
+                       "cores":[16] * n,
+                       "state":["RUNNING"] * n,
+                       "partition":["cpu"] * n,
+                       "qos":["short"] * n,
+                       "elapsedraw":[600, 3000, 5000],
+                       "elapsed-hours":[10] * n})
+    client = FakeClient()
+    live_stats_cache = LiveStatsCache()
+    alert = ZeroCPU(df,
+                    0,
+                    "",
+                    "",
+                    cluster="della",
+                    partitions=["cpu"],
+                    verbose=False,
+                    include_running_jobs=True,
+                    jobstats_module_path=str(tmp_path),
+                    jobstats_config_path=str(tmp_path),
+                    prometheus_batch=True,
+                    prometheus_client=client,
+                    live_stats_cache=live_stats_cache)
+    # the jobs are queried in two windows and keyed on their window
+    assert sorted(client.windows) == [3600, 7200]
+    assert sorted(live_stats_cache.results) == [("della", "1", 3600),
+                                                ("della", "2", 3600),
+                                                ("della", "3_4", 7200)]
+    assert live_stats_cache.results[("della", "1", 3600)]["total_time"] == 600
+    # the array job is matched on its raw jobid
+    assert live_stats_cache.results[("della", "3_4", 7200)]["total_time"] == 5000
+    assert alert.df.JobID.tolist() == ["1", "2", "3_4"]
+    sys.modules.pop("config", None)
+
+
+class FakePrometheus(BaseHTTPRequestHandler):
+
+    """Answer the queries of PrometheusBatchClient for two CPU jobs (1 and 2)
+       and one GPU job (3) on the della cluster."""
+
+    queries = []
+
+    def do_POST(self):
+        length = int(self.headers["Content-Length"])
+        params = {k: v[0] for k, v in parse_qs(self.rfile.read(length).decode()).items()}
+        self.queries.append(params["query"])
+        query = params["query"]
+        if "query_range" in self.path:
+            steps = [float(params["start"]) + i * 30 for i in range(4)]
+            if query.startswith("nvidia_gpu_jobId"):
+                # gpu 0 of g1 is assigned to job 3 for the last three steps
+                series = [({"instance":"g1:9445", "minor_number":"0"}, [0, 3, 3, 3]),
+                          ({"instance":"g1:9445", "minor_number":"1"}, [4, 4, 4, 4])]
+            elif query.startswith("nvidia_gpu_duty_cycle"):
+                series = [({"instance":"g1:9445", "minor_number":"0"}, [90, 20, 40, 60]),
+                          ({"instance":"g1:9445", "minor_number":"1"}, [99, 99, 99, 99])]
+            else:
+                series = [({"instance":"g1:9445", "minor_number":"0"}, [1e9, 2e9, 3e9, 4e9])]
+            result = [{"metric":metric, "values":[[t, str(v)] for t, v in zip(steps, values)]}
+                      for metric, values in series]
+        else:
+            assert 'jobid=~"1|2|3"' in query
+            value = {"cgroup_cpu_total_seconds":"3600",
+                     "cgroup_cpus":"4",
+                     "cgroup_memory_rss_bytes":"1000",
+                     "cgroup_memory_total_bytes":"8000"}[query[14:query.index("{")]]
+            result = [{"metric":{"jobid":jobid, "instance":f"{node}:9306"}, "value":[0, value]}
+                      for jobid, node in [("1", "c1"), ("2", "c2"), ("2", "c3"), ("3", "g1")]]
+        body = json.dumps({"status":"success", "data":{"result":result}}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def prom_server():
+    server = HTTPServer(("127.0.0.1", 0), FakePrometheus)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    FakePrometheus.queries = []
+    yield f"http://127.0.0.1:{server.server_port}"
+    server.shutdown()
+
+
+def test_prometheus_batch_client(prom_server):
+    client = PrometheusBatchClient(prom_server, timeout=10)
+    stats = client.get_job_stats("della", ["1", "2", "3"], 3600, end=1000000)
+    assert client.num_queries == 8
+    assert sorted(stats) == ["1", "2", "3"]
+    assert stats["1"] == {"gpus":0,
+                          "nodes":{"c1":{"total_time":3600.0,
+                                         "cpus":4,
+                                         "used_memory":1000.0,
+                                         "total_memory":8000.0}},
+                          "total_time":3600}
+    assert sorted(stats["2"]["nodes"]) == ["c2", "c3"]
+    gpu_node = stats["3"]["nodes"]["g1"]
+    assert stats["3"]["gpus"] == 1
+    assert gpu_node["gpu_utilization"] == {"0":40.0}
+    assert gpu_node["gpu_used_memory"] == {"0":4e9}
+    assert cpu_efficiency(stats["2"], 3600, "2", "della") == (7200.0, 28800, 0)
+    assert gpu_efficiency(stats["3"], 3600, "3", "della") == (1440.0, 3600, 0)
+    # the number of queries does not depend on the number of jobs
+    client.get_job_stats("della", ["3"], 600, metrics=["gpu_utilization"])
+    assert client.num_queries == 10
+    # each job has its own total_time
+    stats = client.get_job_stats("della", ["1", "2", "3"], 3600, end=1000000,
+                                 elapsed={"1":600, "2":3600})
+    assert [stats[jobid]["total_time"] for jobid in ["1", "2", "3"]] == [600, 3600, 3600]
+
+
+def test_window_bucket():
+    assert window_bucket(0) == 3600
+    assert window_bucket(3600) == 3600
+    assert window_bucket(3601) == 7200
+    assert window_bucket(20 * 3600) == 32 * 3600
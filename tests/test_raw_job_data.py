@@ -0,0 +1,191 @@
+import os
+import stat
+from datetime import datetime
+import pytest
+import pandas as pd
+from raw_job_data import SlurmSacct
+from raw_job_data import SlurmSacctSharded
+from raw_job_data import SlurmRunningJobs
+from utils import merge_external_summary_stats
+
+
+def make_fake_sacct(tmp_path, monkeypatch, output):
+    script = tmp_path / "sacct"
+    script.write_text("#!/bin/sh\ncat <<'EOF'\n" + output + "EOF\n")
+    script.chmod(script.stat().st_mode | stat.S_IEXEC)
+    monkeypatch.setenv("PATH", f"{tmp_path}{os.pathsep}{os.environ['PATH']}")
+
+
+def get_sacct(chunksize=0):
+    return SlurmSacct(datetime(2025, 1, 1),
+                      datetime(2025, 1, 8),
+                      ["jobid", "user", "state", "jobname"],
+                      "della",
+                      "",
+                      chunksize=chunksize)
+
+
+OUTPUT = ("1|u1|COMPLETED|myjob\n"
+          "2|u2|RUNNING|my|job\n"
+          "3|u3|FAILED|first line\n"
+          "second line\n"
+          "4|u4|COMPLETED|job4\n"
+          "5|u5|PENDING|job5\n")
+
+
+def test_rows_to_dataframe():
+    raw = get_sacct().rows_to_dataframe(OUTPUT.strip().split("\n"))
+    assert raw.columns.tolist() == ["jobid", "user", "state", "jobname"]
+    assert raw.jobid.tolist() == ["1", "2", "3", "4", "5"]
+    assert raw.jobname.tolist() == ["myjob", "my", "first line", "job4", "job5"]
+
+
+def test_rows_to_dataframe_empty():
+    assert get_sacct().rows_to_dataframe([]).empty
+
+
+def test_iter_job_data(tmp_path, monkeypatch):
+    make_fake_sacct(tmp_path, monkeypatch, OUTPUT)
+    chunks = list(get_sacct(chunksize=2).iter_job_data())
+    assert [len(chunk) for chunk in chunks] == [2, 1, 2]
+    streamed = pd.concat(chunks, ignore_index=True)
+    expected = get_sacct(chunksize=0).get_job_data()
+    pd.testing.assert_frame_equal(streamed, expected)
+    pd.testing.assert_frame_equal(get_sacct(chunksize=2).get_job_data(), expected)
+
+
+
+def test_iter_job_data_stderr(tmp_path, monkeypatch):
+    # more output on stderr than a pipe holds must not block sacct
+    script = tmp_path / "sacct"
+    script.write_text("#!/bin/sh\n"
+                      "head -c 200000 /dev/zero | tr '\\0' x >&2\n"
+                      "echo 'sacct: error: last line' >&2\n"
+                      "printf '1|u1|COMPLETED|myjob\\n'\n"
+                      "exit 1\n")
+    script.chmod(script.stat().st_mode | stat.S_IEXEC)
+    monkeypatch.setenv("PATH", f"{tmp_path}{os.pathsep}{os.environ['PATH']}")
+    with pytest.raises(RuntimeError, match="sacct: error: last line"):
+        list(get_sacct(chunksize=2).iter_job_data())
+
+
+def test_call_sacct_error(tmp_path, monkeypatch):
+    make_fake_sacct(tmp_path, monkeypatch, "")
+    script = tmp_path / "sacct"
+    script.write_text("#!/bin/sh\necho 'sacct: error: slurmdbd down' >&2\nexit 1\n")
+    for binary in [False, True]:
+        with pytest.raises(RuntimeError, match="sacct: error: slurmdbd down"):
+            SlurmSacct.call_sacct("sacct", binary=binary)
+
+def test_shard_windows():
+    sacct = SlurmSacctSharded(datetime(2025, 1, 1),
+                              datetime(2025, 1, 2, 12),
+                              ["jobid", "cluster", "jobname"],
+                              "della,stellar",
+                              "",
+                              shard_hours=24,
+                              shard_by_cluster=True)
+    assert sacct.shard_windows() == [(datetime(2025, 1, 1), datetime(2025, 1, 2)),
+                                     (datetime(2025, 1, 2), datetime(2025, 1, 2, 12))]
+    assert sacct.shard_clusters() == ["della", "stellar"]
+    sacct.clusters = "all"
+    assert sacct.shard_clusters() == ["all"]
+
+
+def test_sharded_get_job_data(tmp_path, monkeypatch):
+    # the fake sacct prints one job that is found in every shard and one job
+    # that is unique to the shard (the jobname is the start time)
+    script = tmp_path / "sacct"
+    script.write_text('#!/bin/sh\n'
+                      'while [ $# -gt 0 ]; do\n'
+                      '  case "$1" in\n'
+                      '    -S) S="$2"; shift ;;\n'
+                      '    -M) M="$2"; shift ;;\n'
+                      '  esac\n'
+                      '  shift\n'
+                      'done\n'
+                      'echo "1|$M|long"\n'
+                      'echo "$S|$M|$S"\n')
+    script.chmod(script.stat().st_mode | stat.S_IEXEC)
+    monkeypatch.setenv("PATH", f"{tmp_path}{os.pathsep}{os.environ['PATH']}")
+    sacct = SlurmSacctSharded(datetime(2025, 1, 1),
+                              datetime(2025, 1, 4),
+                              ["jobid", "cluster", "jobname"],
+                              "della,stellar",
+                              "",
+                              shard_hours=24,
+                              max_workers=3,
+                              shard_by_cluster=True)
+    raw = sacct.get_job_data()
+    assert len(raw) == 2 + 2 * 3
+    assert raw[raw.jobid == "1"].cluster.tolist() == ["della", "stellar"]
+    assert not raw.duplicated(subset=["cluster", "jobid"]).any()
+
+
+def test_arrow_parser():
+    pytest.importorskip("pyarrow")
+    fields = ["jobid", "user", "cputimeraw", "elapsedraw", "state", "jobname"]
+    output = ("1|u1|100|10|COMPLETED|myjob\n"
+              "2|u2|200|20|RUNNING|my|job|x\n"
+              "3|u3|300|30|FAILED|first line\n"
+              "second line\n"
+              "4|u4|400|40|COMPLETED|\n")
+    python = SlurmSacct(datetime(2025, 1, 1), datetime(2025, 1, 8), fields, "all", "")
+    arrow = SlurmSacct(datetime(2025, 1, 1), datetime(2025, 1, 8), fields, "all", "",
+                       parser="arrow")
+    expected = python.parse(output).sort_values("jobid", ignore_index=True)
+    actual = arrow.parse(output.encode("utf8")).sort_values("jobid", ignore_index=True)
+    assert actual.cputimeraw.dtype == "int64"
+    assert actual.elapsedraw.dtype == "int64"
+    assert actual.jobname.dtype == "string"
+    assert actual.jobname.tolist() == ["myjob", "my", "first line", ""]
+    pd.testing.assert_frame_equal(actual.astype(str), expected.astype(str))
+    assert arrow.parse(b"").empty
+
+
+def test_arrow_parser_non_integer_values():
+    pytest.importorskip("pyarrow")
+    fields = ["jobid", "elapsedraw", "jobname"]
+    arrow = SlurmSacct(datetime(2025, 1, 1), datetime(2025, 1, 8), fields, "all", "",
+                       parser="arrow")
+    raw = arrow.parse(b"1|10|a\n2||b\n")
+    assert raw.elapsedraw.dtype == "string"
+    assert raw.elapsedraw.tolist() == ["10", ""]
+
+
+def test_running_jobs(tmp_path, monkeypatch):
+    # the fake sacct echoes its -s and -o options as the jobname
+    script = tmp_path / "sacct"
+    script.write_text('#!/bin/sh\n'
+                      'while [ $# -gt 0 ]; do\n'
+                      '  case "$1" in\n'
+                      '    -s) S="$2"; shift ;;\n'
+                      '    -o) O="$2"; shift ;;\n'
+                      '  esac\n'
+                      '  shift\n'
+                      'done\n'
+                      'echo "1|bio|RUNNING|$S $O"\n')
+    script.chmod(script.stat().st_mode | stat.S_IEXEC)
+    monkeypatch.setenv("PATH", f"{tmp_path}{os.pathsep}{os.environ['PATH']}")
+    sacct = SlurmRunningJobs(["jobid", "account", "state", "admincomment", "jobname"], "della", "")
+    raw = sacct.get_job_data()
+    assert raw.jobname.tolist() == ["R jobid,account,state,jobname"]
+    assert raw.admincomment.tolist() == [""]
+    script.write_text('#!/bin/sh\n')
+    assert SlurmRunningJobs(["jobid", "jobname"], "della", "", allow_empty=True).get_job_data().empty
+
+
+def test_running_jobs_external_db(tmp_path, monkeypatch):
+    # admincomment is not in the fields when an external database is used
+    make_fake_sacct(tmp_path, monkeypatch, "1|41|della|RUNNING|job1\n2|42|della|RUNNING|job2\n")
+    sacct = SlurmRunningJobs(["jobid", "jobidraw", "cluster", "state", "jobname"], "della", "")
+    raw = sacct.get_job_data()
+    assert "admincomment" not in raw.columns
+    df_ext = pd.DataFrame({"jobid":[41, 43],
+                           "cluster":["della", "della"],
+                           "admin_comment":["JS1:Short", "JS1:None"]})
+    df = merge_external_summary_stats(raw, df_ext)
+    assert df.columns.tolist() == ["jobid", "jobidraw", "cluster", "state", "jobname", "admincomment"]
+    assert df.jobid.tolist() == ["1", "2"]
+    assert df.admincomment.tolist()[0] == "JS1:Short"
+    assert df.admincomment.isna().tolist() == [False, True]
@@ -0,0 +1,39 @@
+import pandas as pd
+from sliding_store import SlidingWindowStore
+from sliding_store import plan_sliding_checks
+from sliding_store import CANCEL_CHECK
+from sliding_store import NEW_CHECK
+from sliding_store import RECHECK
+
+
+def test_sliding_window_store(tmp_path):
+    csv_file = tmp_path / ".sliding_cache_della_gpu.csv"
+    pd.DataFrame({"jobid":["1", "2_3"],
+                  "checked_time":[100, 200],
+                  "idle_gpus":[0, 2]}).to_csv(csv_file, index=False)
+    store = SlidingWindowStore(str(tmp_path / ".sliding_cache_della_gpu.db"))
+    assert store.load() == {"1":(100, 0), "2_3":(200, 2)}
+    store.update([("1", 300, 1), ("4", 300, 0)])
+    assert store.evict(["1", "4", "5"]) == 1
+    store.close()
+    # the csv file is only imported when the database is created
+    store = SlidingWindowStore(str(tmp_path / ".sliding_cache_della_gpu.db"))
+    assert store.load() == {"1":(300, 1), "4":(300, 0)}
+    assert len(store) == 2
+    store.close()
+
+
+def test_plan_sliding_checks():
+    state = {"1":(0, 0),      # using gpus and due for a re-check
+             "2":(900, 0),    # using gpus and not due
+             "3":(100, 2),    # warned and due for the cancellation check
+             "4":(50, 1),     # warned longer ago
+             "5":(950, 1)}    # warned and not due
+    jobs = [(jobid, 4) for jobid in ["1", "2", "3", "4", "5", "7", "6"]]
+    checks, unchanged = plan_sliding_checks(jobs, state, 1000, 600, 1200, 1.0)
+    assert checks == [(CANCEL_CHECK, "4", 4, 1200),
+                      (CANCEL_CHECK, "3", 4, 1200),
+                      (NEW_CHECK, "7", 4, 600),
+                      (NEW_CHECK, "6", 4, 600),
+                      (RECHECK, "1", 4, 600)]
+    assert unchanged == [["2", 900, 0], ["5", 950, 1]]
@@ -0,0 +1,87 @@
+import os
+import json
+import sqlite3
+import pytest
+import pandas as pd
+from stats_cache import StatsCache
+
+
+def make_jobs():
+    return pd.DataFrame({"cluster":["della", "della", "della", "stellar"],
+                         "jobidraw":["1", "2", "3", "1"],
+                         "state":["COMPLETED", "RUNNING", "FAILED", "COMPLETED"],
+                         "admincomment":["a", "b", "JS1:None", "c"]},
+                        index=[10, 11, 12, 13])
+
+
+def decoder(calls):
+    def decode(series):
+        calls.append(list(series))
+        return series.apply(lambda x: {} if x == "JS1:None" else {"ss":x})
+    return decode
+
+
+def test_stats_cache_hits(tmp_path):
+    path = os.path.join(tmp_path, "cache.db")
+    calls = []
+    cache = StatsCache(path)
+    first = cache.get_stats_dicts(make_jobs(), decoder(calls))
+    assert first.tolist() == [{"ss":"a"}, {"ss":"b"}, {}, {"ss":"c"}]
+    assert first.index.tolist() == [10, 11, 12, 13]
+    # running jobs and jobs without statistics are not stored
+    assert len(cache) == 2
+    cache.close()
+    cache = StatsCache(path)
+    second = cache.get_stats_dicts(make_jobs(), decoder(calls))
+    pd.testing.assert_series_equal(first, second)
+    assert calls[1] == ["b", "JS1:None"]
+    second = cache.get_stats_dicts(make_jobs(), decoder(calls))
+    assert (cache.hits, cache.misses) == (4, 4)
+    assert cache.report() == "INFO: Stats cache served 4 jobs and decoded 4 jobs"
+    cache.clear()
+    assert len(cache) == 0
+    cache.close()
+
+
+def test_stats_cache_eviction(tmp_path):
+    path = os.path.join(tmp_path, "cache.db")
+    cache = StatsCache(path, max_age_days=1)
+    jobs = make_jobs()
+    jobs["admincomment"] = [{"ss":x} for x in jobs.admincomment]
+    cache.store(jobs)
+    cache.conn.execute("UPDATE stats SET added = 0 WHERE cluster = 'stellar'")
+    assert cache.evict() == 1
+    assert len(cache) == 3
+    cache.store(pd.DataFrame({"cluster":["della"] * 1000,
+                              "jobidraw":[str(i) for i in range(1000)],
+                              "admincomment":[{"ss":"x" * 1000}] * 1000}))
+    cache.max_size_mb = 0.5
+    assert cache.evict() > 0
+    assert len(cache) < 1000
+    cache.close()
+
+
+def test_stats_cache_json(tmp_path):
+    path = os.path.join(tmp_path, "cache.db")
+    # a database written by a version that stored pickles is emptied
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE stats (cluster TEXT NOT NULL, jobidraw TEXT NOT NULL, "
+                 "added REAL NOT NULL, ss BLOB NOT NULL, PRIMARY KEY (cluster, jobidraw))")
+    conn.execute("INSERT INTO stats VALUES ('della', '1', 0, ?)", (b"\x80\x05N.",))
+    conn.commit()
+    conn.close()
+    cache = StatsCache(path)
+    assert len(cache) == 0
+    jobs = make_jobs()
+    jobs["admincomment"] = [{"nodes":{"n1":{"cpus":4, "total_time":1.5}}}] * len(jobs)
+    cache.store(jobs)
+    ss = cache.conn.execute("SELECT ss FROM stats WHERE jobidraw = '2'").fetchone()[0]
+    assert json.loads(ss) == {"nodes":{"n1":{"cpus":4, "total_time":1.5}}}
+    # the old connection is closed by reconnect
+    old = cache.conn
+    cache.reconnect()
+    with pytest.raises(sqlite3.ProgrammingError):
+        old.execute("SELECT 1")
+    assert cache.lookup(jobs[["cluster", "jobidraw"]])[("stellar", "1")] == jobs.admincomment[13]
+    cache.close()
+    assert len(StatsCache(path)) == 4
@@ -0,0 +1,72 @@
+import json
+import gzip
+import base64
+import pandas as pd
+import pytest
+from efficiency import get_stats_dicts
+from stats_decoder import StatsDecoder
+from src.job_defense_shield.alert.zero_cpu_utilization import ZeroCPU
+
+
+def encode(ss):
+    return "JS1:" + base64.b64encode(gzip.compress(json.dumps(ss).encode())).decode()
+
+
+def node(cpus, total_time):
+    return {"cpus":cpus, "total_time":total_time, "total_memory":100, "used_memory":10}
+
+
+def make_jobs():
+    job1 = {"gpus":0, "nodes":{"n1":node(16, 1000.0), "n2":node(16, 0.0)}}
+    job2 = {"gpus":0, "nodes":{"n3":node(32, 2000.0)}}
+    return pd.DataFrame({"jobid":["1", "2", "3", "4", "5"],
+                         "user":["user1", "user2", "user1", "user3", "user3"],
+                         "admincomment":[encode(job1), encode(job2), "JS1:None",
+                                         encode(job1), encode(job1)],
+                         "cluster":["della", "della", "della", "della", "stellar"],
+                         "jobname":["myjob"] * 5,
+                         "nodes":[2, 1, 1, 2, 2],
+                         "cores":[32, 32, 1, 32, 32],
+                         "state":["COMPLETED"] * 5,
+                         "partition":["cpu", "cpu", "cpu", "gpu", "cpu"],
+                         "qos":["short"] * 5,
+                         "elapsed-hours":[10] * 5})
+
+
+def test_stats_decoder_memoizes():
+    jobs = make_jobs()
+    calls = []
+    def decode(series):
+        calls.append(series.index.tolist())
+        return get_stats_dicts(series)
+    decoder = StatsDecoder(jobs, decode)
+    first = decoder.decode(jobs.loc[[0, 2]])
+    assert first[0]["nodes"]["n1"]["cpus"] == 16
+    assert first[2] == {}
+    second = decoder.decode(jobs.loc[[0, 1]])
+    assert calls == [[0, 2], [1]]
+    assert second[1]["nodes"]["n3"]["cpus"] == 32
+    # values that are already decoded are not touched
+    running = jobs.loc[[3]].assign(admincomment=[{"nodes":{}}])
+    assert decoder.decode(running)[3] == {"nodes":{}}
+    assert len(decoder) == 3
+    with pytest.raises(ValueError):
+        StatsDecoder(pd.concat([jobs, jobs]), decode)
+
+
+def test_alert_decodes_filtered_jobs_only():
+    jobs = make_jobs()
+    decoder = StatsDecoder(jobs, get_stats_dicts)
+    props = {"cluster":"della",
+             "partitions":["cpu"],
+             "min_run_time":0,
+             "verbose":False,
+             "include_running_jobs":False}
+    lazy = ZeroCPU(jobs, 0, "", "", stats_decoder=decoder, **props)
+    eager = make_jobs()
+    eager["admincomment"] = get_stats_dicts(eager["admincomment"])
+    expected = ZeroCPU(eager, 0, "", "", **props)
+    pd.testing.assert_frame_equal(lazy.df, expected.df)
+    assert lazy.df.User.tolist() == ["user1"]
+    # the gpu partition and the stellar cluster are never decoded
+    assert sorted(decoder.decoded) == [0, 1, 2]
@@ -0,0 +1,102 @@
+import os
+import time
+import pandas as pd
+from datetime import datetime
+from datetime import timedelta
+from violation_store import ViolationStore
+from src.job_defense_shield.alert.excessive_time_limits import ExcessiveTimeLimitsCPU
+
+
+def make_log(user, days_ago, partitions="cpu"):
+    sent = [(datetime.now() - timedelta(days=d)).strftime("%m/%d/%Y %H:%M:%S")
+            for d in days_ago]
+    return pd.DataFrame({"User":[user] * len(days_ago),
+                         "Cluster":["della"] * len(days_ago),
+                         "Alert-Partitions":[partitions] * len(days_ago),
+                         "CPU-Hours-Unused":[100 * (i + 1) for i in range(len(days_ago))],
+                         "Email-Sent":sent})
+
+
+def test_violation_store(tmp_path):
+    store = ViolationStore(os.path.join(tmp_path, "violations.db"))
+    assert store.add("low_cpu_efficiency", "user1", make_log("user1", [10, 3, 3])) == 3
+    store.add("low_cpu_efficiency", "user1", make_log("user1", [20], partitions="gpu"))
+    num_emails, last = store.emails_sent("low_cpu_efficiency", "user1", "della", "cpu")
+    assert num_emails == 2
+    assert round((datetime.now().timestamp() - last) / 86400) == 3
+    assert store.emails_sent("low_cpu_efficiency", "user2", "della", "cpu") == (0, None)
+    assert store.users("low_cpu_efficiency") == ["user1"]
+    assert len(store.read("low_cpu_efficiency", "user1")) == 4
+    assert len(store) == 4
+
+
+def test_violation_store_local_time(tmp_path, monkeypatch):
+    # Email-Sent is a naive local time so the offset from UTC must not matter
+    monkeypatch.setenv("TZ", "America/New_York")
+    time.tzset()
+    try:
+        store = ViolationStore(os.path.join(tmp_path, "violations.db"))
+        store.add("low_cpu_efficiency", "user1", make_log("user1", [0]))
+        _, last = store.emails_sent("low_cpu_efficiency", "user1", "della", "cpu")
+        assert abs(datetime.now().timestamp() - last) < 60
+    finally:
+        monkeypatch.delenv("TZ")
+        time.tzset()
+
+
+def test_violation_store_import(tmp_path):
+    vpath = os.path.join(tmp_path, "violations")
+    os.makedirs(os.path.join(vpath, "low_cpu_efficiency"))
+    os.makedirs(os.path.join(vpath, "zero_cpu_utilization"))
+    make_log("user1", [10, 3]).to_csv(os.path.join(vpath, "low_cpu_efficiency", "user1.csv"),
+                                      index=False)
+    make_log("user2", [5]).to_csv(os.path.join(vpath, "zero_cpu_utilization", "user2.csv"),
+                                  index=False)
+    store = ViolationStore(os.path.join(tmp_path, "violations.db"))
+    assert store.import_csv_tree(vpath) == (3, 2)
+    # importing again does not duplicate the rows
+    assert store.import_csv_tree(vpath) == (0, 2)
+    expected = pd.read_csv(os.path.join(vpath, "low_cpu_efficiency", "user1.csv"),
+                           parse_dates=["Email-Sent"],
+                           date_format="mixed",
+                           dayfirst=False)
+    pd.testing.assert_frame_equal(store.read("low_cpu_efficiency", "user1"), expected)
+
+
+def test_alert_with_violation_store(tmp_path):
+    cpus = 10
+    ss = {"nodes":{"node1":{"total_time":-1, "cpus":cpus}}}
+    df = pd.DataFrame({"user":["user1"],
+                       "cluster":["della"],
+                       "state":["COMPLETED"],
+                       "cores":[cpus],
+                       "partition":["cpu"],
+                       "qos":["short"],
+                       "elapsed-hours":[100],
+                       "elapsedraw":[60 * 60 * 100],
+                       "limit-minutes":[60 * 1000],
+                       "admincomment":[ss],
+                       "cpu-hours":[cpus * 100]})
+    path = os.path.join(tmp_path, "violations.db")
+    limits = ExcessiveTimeLimitsCPU(df,
+                                    7,
+                                    "excessive_time_limits_cpu",
+                                    str(tmp_path),
+                                    cluster="della",
+                                    partitions=["cpu"],
+                                    min_run_time=0,
+                                    num_top_users=10,
+                                    absolute_thres_hours=0,
+                                    overall_ratio_threshold=1.0,
+                                    mean_ratio_threshold=1.0,
+                                    median_ratio_threshold=1.0,
+                                    violation_store_path=path)
+    vfile = f"{tmp_path}/excessive_time_limits_cpu/user1.csv"
+    assert limits.get_emails_sent_count("user1", "excessive_time_limits_cpu") == "0 (-)"
+    assert limits.has_sufficient_time_passed_since_last_email(vfile)
+    limits.update_violation_log(make_log("user1", [0]), vfile)
+    assert limits.get_emails_sent_count("user1", "excessive_time_limits_cpu") == "1 (0)"
+    assert not limits.has_sufficient_time_passed_since_last_email(vfile)
+    # the CSV files are not used
+    assert not os.path.exists(os.path.join(tmp_path, "excessive_time_limits_cpu"))
+    assert len(ViolationStore(path)) == 1